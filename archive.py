@@ -0,0 +1,281 @@
+import json
+import os
+import struct
+import threading
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+
+ARCHIVE_FILE = "frames.arc"
+ARCHIVE_MAGIC = b'LSARC001'
+
+# codecs in order of preference when the codec is auto
+ARCHIVE_CODECS = ('zstd', 'lz4', 'zlib')
+
+# entry of the footer index of each frame: chunk the frame is stored in, as byte offset and length in the file,
+# and position and number of its points in the chunk
+ARCHIVE_INDEX_DTYPE = np.dtype([('frame', '<i8'), ('timestamp', '<f8'), ('offset', '<i8'), ('length', '<i8'),
+                                ('start', '<i8'), ('count', '<i8')])
+
+# the file ends with the byte offset and number of entries of the footer index and the magic
+TRAILER = struct.Struct('<qq8s')
+
+
+def check_codec(codec):
+    """
+    :param codec: zstd, lz4, zlib or auto for the first one which is installed
+    :return: the codec to use
+    """
+    if codec == 'auto':
+        return 'zstd' if zstandard is not None else 'lz4' if lz4 is not None else 'zlib'
+    if codec not in ARCHIVE_CODECS:
+        raise ValueError('unknown archive-codec {}, expected auto or one of {}'.format(
+            codec, ', '.join(ARCHIVE_CODECS)))
+    if codec == 'zstd' and zstandard is None:
+        raise ImportError('archive-codec zstd requires the zstandard package')
+    if codec == 'lz4' and lz4 is None:
+        raise ImportError('archive-codec lz4 requires the lz4 package')
+    return codec
+
+
+def compress(data, codec, level):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    if codec == 'lz4':
+        return lz4.frame.compress(data, compression_level=level)
+    return zlib.compress(data, level)
+
+
+def decompress(data, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == 'lz4':
+        return lz4.frame.decompress(data)
+    return zlib.decompress(data)
+
+
+def encode_points(points):
+    """
+    Transform the points of a chunk into bytes which compress well: each field is stored as column, the bits
+    of each float value are XORed with those of the previous point, integers are delta encoded, and the bytes
+    of each column are shuffled so that the n-th bytes of all values are adjacent
+    """
+    columns = []
+    for name in points.dtype.names:
+        values = np.ascontiguousarray(points[name])
+        itemsize = values.dtype.itemsize
+        raw = values.view('u{}'.format(itemsize))
+        if values.dtype.kind == 'f':
+            encoded = raw ^ np.concatenate((raw[:1] * 0, raw[:-1]))
+        else:
+            encoded = np.diff(raw, prepend=raw.dtype.type(0))
+        columns.append(encoded.view(np.uint8).reshape(-1, itemsize).T.tobytes())
+    return b''.join(columns)
+
+
+def decode_points(data, dtype, count):
+    """
+    Inverse of encode_points
+    :return: structured array of dtype
+    """
+    points = np.empty(count, dtype=dtype)
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    pos = 0
+    for name in dtype.names:
+        field = dtype.fields[name][0]
+        itemsize = field.itemsize
+        shuffled = buffer[pos:pos + count * itemsize].reshape(itemsize, count)
+        encoded = np.ascontiguousarray(shuffled.T).view('<u{}'.format(itemsize)).reshape(-1)
+        if field.kind == 'f':
+            raw = np.bitwise_xor.accumulate(encoded)
+        else:
+            raw = np.cumsum(encoded, dtype=encoded.dtype)
+        points[name] = raw.view(field)
+        pos += count * itemsize
+    return points
+
+
+class ArchiveWriter:
+    """
+    Writer of all frames of a sequence into one file of compressed chunks of chunk_frames consecutive frames,
+    followed by a footer index of the frame number, timestamp, chunk and number of points of each frame
+    """
+    def __init__(self, path, dtype, codec='auto', level=3, chunk_frames=1, append=False):
+        """
+        :param codec: zstd, lz4, zlib or auto for the first one which is installed
+        :param level: compression level of the codec
+        :param chunk_frames: number of frames compressed together, a frame is read by decompressing its chunk
+        :param append: continue the archive of a previous run instead of replacing it, frames appended later may
+                       be out of frame order
+        """
+        self.path = Path(path)
+        os.makedirs(self.path.absolute(), exist_ok=True)
+        self.dtype = dtype
+        self.codec = check_codec(codec)
+        self.level = level
+        self.chunk_frames = chunk_frames
+        self.index = []
+        self.chunk = []
+
+        fpath = self.path / ARCHIVE_FILE
+        previous = read_footer(fpath) if append and fpath.exists() else None
+        if previous is not None and previous[0]['codec'] == self.codec and \
+                np.dtype([tuple(field) for field in previous[0]['dtype']]) == dtype:
+            # the footer is rewritten when the archive is closed
+            meta, index, index_offset = previous
+            self.index = [tuple(entry) for entry in index.tolist()]
+            self.file = open(fpath, 'r+b')
+            self.file.truncate(index_offset)
+            self.file.seek(index_offset)
+        else:
+            self.file = open(fpath, 'wb')
+            header = json.dumps({'dtype': dtype.descr, 'codec': self.codec}).encode('utf-8')
+            self.file.write(ARCHIVE_MAGIC + struct.pack('<q', len(header)) + header)
+        self.frames = set(entry[0] for entry in self.index)
+
+    def write(self, frame_nr, frame, timestamp=None):
+        """
+        Append a frame, it is written when its chunk is complete
+        :param timestamp: timestamp of the frame in the index, by default that of its first point
+        """
+        if timestamp is None:
+            timestamp = frame['timestamp'][0] if len(frame) else np.nan
+        self.chunk.append((frame_nr, timestamp, np.array(frame, dtype=self.dtype)))
+        self.frames.add(frame_nr)
+        if len(self.chunk) >= self.chunk_frames:
+            self.flush()
+
+    def flush(self):
+        """
+        Compress and write the frames of the current chunk
+        """
+        if not self.chunk:
+            return
+        points = np.concatenate([frame for _, _, frame in self.chunk])
+        data = compress(encode_points(points), self.codec, self.level)
+        offset = self.file.tell()
+        self.file.write(data)
+        start = 0
+        for frame_nr, timestamp, frame in self.chunk:
+            self.index.append((frame_nr, timestamp, offset, len(data), start, len(frame)))
+            start += len(frame)
+        self.chunk = []
+
+    def close(self):
+        """
+        Write the last chunk and the footer index
+        """
+        self.flush()
+        index = np.array(self.index, dtype=ARCHIVE_INDEX_DTYPE)
+        index_offset = self.file.tell()
+        self.file.write(index.tobytes())
+        self.file.write(TRAILER.pack(index_offset, len(index), ARCHIVE_MAGIC))
+        self.file.close()
+
+
+def read_footer(path):
+    """
+    :return: header, footer index and byte offset of the footer of an archive, None if it is not complete
+    """
+    with open(path, 'rb') as fp:
+        magic = fp.read(len(ARCHIVE_MAGIC))
+        size = fp.seek(0, os.SEEK_END)
+        if magic != ARCHIVE_MAGIC or size < len(ARCHIVE_MAGIC) + 8 + TRAILER.size:
+            return None
+        fp.seek(len(ARCHIVE_MAGIC))
+        meta = json.loads(fp.read(struct.unpack('<q', fp.read(8))[0]).decode('utf-8'))
+        fp.seek(size - TRAILER.size)
+        index_offset, n_frames, trailer_magic = TRAILER.unpack(fp.read(TRAILER.size))
+        if trailer_magic != ARCHIVE_MAGIC or index_offset + n_frames * ARCHIVE_INDEX_DTYPE.itemsize + \
+                TRAILER.size != size:
+            return None
+        fp.seek(index_offset)
+        index = np.frombuffer(fp.read(n_frames * ARCHIVE_INDEX_DTYPE.itemsize), dtype=ARCHIVE_INDEX_DTYPE)
+    return meta, index, index_offset
+
+
+class ArchiveReader:
+    """
+    Random access to the frames of an archive, only the chunks of the requested frames are read and decompressed
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        footer = read_footer(self.path / ARCHIVE_FILE)
+        if footer is None:
+            raise ValueError('incomplete archive: {}'.format(self.path / ARCHIVE_FILE))
+        meta, self.index, _ = footer
+        self.dtype = np.dtype([tuple(field) for field in meta['dtype']])
+        self.codec = check_codec(meta['codec'])
+        self.file = open(self.path / ARCHIVE_FILE, 'rb')
+        # the last decompressed chunk, consecutive frames of a chunk are decompressed once
+        self.chunk_offset = None
+        self.chunk = None
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        """
+        :return: structured array of the points of the i-th frame of the archive
+        """
+        entry = self.index[i]
+        with self.lock:
+            if self.chunk_offset != entry['offset']:
+                self.file.seek(int(entry['offset']))
+                data = decompress(self.file.read(int(entry['length'])), self.codec)
+                self.chunk = decode_points(data, self.dtype, len(data) // self.dtype.itemsize)
+                self.chunk_offset = entry['offset']
+            return self.chunk[entry['start']:entry['start'] + entry['count']]
+
+    def find(self, frame_nr):
+        """
+        :return: position of the frame with the given number in the archive, or None
+        """
+        pos = np.flatnonzero(self.index['frame'] == frame_nr)
+        return int(pos[0]) if pos.size > 0 else None
+
+    def frame(self, frame_nr):
+        """
+        :return: points of the frame with the given number, None if it is not in the archive
+        """
+        pos = self.find(frame_nr)
+        return self[pos] if pos is not None else None
+
+    def time_range(self, start=None, end=None):
+        """
+        :param start: first timestamp of the frames [s]
+        :param end: last timestamp of the frames [s]
+        :return: list of (frame number, points) of the frames whose timestamp is within [start, end]
+        """
+        timestamps = self.index['timestamp']
+        valid = np.ones(len(self.index), dtype=bool)
+        if start is not None:
+            valid &= timestamps >= start
+        if end is not None:
+            valid &= timestamps <= end
+        positions = np.flatnonzero(valid)
+        # chunks are read in file order
+        positions = positions[np.argsort(self.index['offset'][positions], kind='stable')]
+        return [(int(self.index['frame'][i]), self[i]) for i in positions]
@@ -0,0 +1,323 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import lidar
+from archive import ArchiveWriter
+import pcd
+import synthetic
+from frame_buffer import vertical_angles
+from frame_store import FrameSequenceWriter, write_npy
+from lidar_manager import LSLidarManager, write_txt
+from main import read_params
+from pcap_reader import PcapReader
+
+
+def read_packets(pcap_path, params):
+    """
+    :return: [N x 1206] uint8 array of the data packets of a pcap file, timestamp of each packet
+    """
+    with PcapReader(pcap_path, params['data-port']) as reader:
+        batches = [(np.array(batch.payloads), batch.timestamps) for batch in reader.batches()]
+    return np.concatenate([payloads for payloads, _ in batches]), np.concatenate([ts for _, ts in batches])
+
+
+def decode_params(params):
+    return dict(params, txt=False, pcd=False, npy=False, bin=False, resume=False)
+
+
+def read_frames(pcap_path, params):
+    """
+    :return: list of (frame number, frame) of all frames of a pcap file
+    """
+    frames = []
+    lidar_manager = LSLidarManager(pcap_path, None, decode_params(params))
+    lidar_manager.emit_frame = lambda frame, frame_nr, info=None: frames.append((frame_nr, frame.copy()))
+    payloads, timestamps = read_packets(pcap_path, params)
+    lidar_manager.process_data_batch(payloads, timestamps, np.arange(len(payloads)))
+    return frames
+
+
+def dir_size(path):
+    return sum(fpath.stat().st_size for fpath in Path(path).rglob('*') if fpath.is_file())
+
+
+def bench_decode_packet(pcap_path, work_dir, params):
+    payloads, timestamps = read_packets(pcap_path, params)
+    packets = [payload.tobytes() for payload in payloads]
+    lsc16 = lidar.LSC16()
+    start_time = time.perf_counter()
+    for data, timestamp in zip(packets, timestamps):
+        lsc16.process_data_frame(data, timestamp)
+    return {'seconds': time.perf_counter() - start_time, 'packets': len(packets), 'points': len(packets) * 384}
+
+
+def bench_decode_batch(pcap_path, work_dir, params):
+    payloads, timestamps = read_packets(pcap_path, params)
+    lsc16 = lidar.LSC16()
+    start_time = time.perf_counter()
+    for i in range(0, len(payloads), 256):
+        lsc16.decode_batch(payloads[i:i + 256], timestamps[i:i + 256])
+    return {'seconds': time.perf_counter() - start_time, 'packets': len(payloads), 'points': len(payloads) * 384}
+
+
+def bench_assemble_packet(pcap_path, work_dir, params):
+    payloads, timestamps = read_packets(pcap_path, params)
+    packets = [payload.tobytes() for payload in payloads]
+    lidar_manager = LSLidarManager(pcap_path, work_dir, decode_params(params))
+    start_time = time.perf_counter()
+    for i, (data, timestamp) in enumerate(zip(packets, timestamps)):
+        lidar_manager.process_data_frame(data, timestamp, i)
+    return {'seconds': time.perf_counter() - start_time, 'packets': len(packets), 'points': len(packets) * 384,
+            'frames': lidar_manager.frame_count}
+
+
+def bench_assemble_batch(pcap_path, work_dir, params):
+    payloads, timestamps = read_packets(pcap_path, params)
+    lidar_manager = LSLidarManager(pcap_path, work_dir, decode_params(params))
+    start_time = time.perf_counter()
+    for i in range(0, len(payloads), 256):
+        lidar_manager.process_data_batch(payloads[i:i + 256], timestamps[i:i + 256],
+                                         np.arange(i, min(i + 256, len(payloads))))
+    return {'seconds': time.perf_counter() - start_time, 'packets': len(payloads), 'points': len(payloads) * 384,
+            'frames': lidar_manager.frame_count}
+
+
+def bench_write(write_frame):
+    """
+    :param write_frame: callable returning the writer of (frame number, frame) into a output dir, a writer with
+                        a close method is closed within the measured time
+    :return: stage function writing all frames of a pcap file
+    """
+    def bench(pcap_path, work_dir, params):
+        frames = read_frames(pcap_path, params)
+        out_path = Path(work_dir) / "out"
+        os.makedirs(out_path.absolute(), exist_ok=True)
+        start_time = time.perf_counter()
+        write_frames = write_frame(out_path)
+        for frame_nr, frame in frames:
+            write_frames(frame_nr, frame)
+        if hasattr(write_frames, 'close'):
+            write_frames.close()
+        seconds = time.perf_counter() - start_time
+        return {'seconds': seconds, 'points': sum(len(frame) for _, frame in frames), 'frames': len(frames),
+                'bytes': dir_size(out_path)}
+    return bench
+
+
+def txt_writer(out_path):
+    return lambda frame_nr, frame: write_txt(
+        "{}/{}.txt".format(out_path, frame_nr), frame['timestamp'], frame['laser_id'], frame['x'], frame['y'],
+        frame['z'], frame['intensity'], vertical_angles(frame, lidar.LSC16().omega), frame['horizontal_angle'],
+        frame['distance'])
+
+
+def pcd_writer(data):
+    return lambda out_path: lambda frame_nr, frame: pcd.write_pcd(
+        "{}/{}.pcd".format(out_path, frame_nr), frame['x'], frame['y'], frame['z'], frame['intensity'], data)
+
+
+def npy_writer(out_path):
+    return lambda frame_nr, frame: write_npy("{}/{}.npy".format(out_path, frame_nr), frame)
+
+
+class SequenceWriter:
+    """
+    Writer of all frames into one file, created with the dtype of the first frame, compact or not
+    """
+    def __init__(self, writer_class, out_path):
+        self.writer_class = writer_class
+        self.out_path = out_path
+        self.writer = None
+
+    def __call__(self, frame_nr, frame):
+        if self.writer is None:
+            self.writer = self.writer_class(self.out_path, frame.dtype)
+        self.writer.write(frame_nr, frame)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def bin_writer(out_path):
+    return SequenceWriter(FrameSequenceWriter, out_path)
+
+
+def archive_writer(out_path):
+    # compressed with the first codec installed
+    return SequenceWriter(ArchiveWriter, out_path)
+
+
+def bench_extract(pcap_path, work_dir, params):
+    out_path = Path(work_dir) / "out"
+    lidar_manager = LSLidarManager(pcap_path, out_path, dict(params, resume=False))
+    stats = lidar_manager.run(progress=lambda n: None)
+    return {'seconds': stats['seconds'], 'packets': stats['packets'], 'points': stats['packets'] * 384,
+            'frames': stats['frames'], 'bytes': dir_size(out_path)}
+
+
+def bench_data_pkl(pcap_path, work_dir, params):
+    from data_pkl import generate_data_pkl
+
+    tree_path = Path(work_dir) / "tree"
+    synthetic.write_data_tree(tree_path, scenes=params['tree-scenes'], frames=params['tree-frames'])
+    cwd = os.getcwd()
+    os.chdir(tree_path)
+    try:
+        start_time = time.perf_counter()
+        data_pkl = generate_data_pkl({'imgs_path': 'imgs', 'lidar_path': 'lidar', 'cache': None})
+        seconds = time.perf_counter() - start_time
+        n_bytes = os.path.getsize('data_all.pkl')
+    finally:
+        os.chdir(cwd)
+    return {'seconds': seconds, 'frames': len(data_pkl), 'bytes': n_bytes}
+
+
+# stages in the order they are run, each one measures the time of its work without preparing its input
+STAGES = {
+    'decode_packet': bench_decode_packet,
+    'decode_batch': bench_decode_batch,
+    'assemble_packet': bench_assemble_packet,
+    'assemble_batch': bench_assemble_batch,
+    'write_txt': bench_write(txt_writer),
+    'write_pcd_ascii': bench_write(pcd_writer('ascii')),
+    'write_pcd_binary': bench_write(pcd_writer('binary')),
+    'write_pcd_binary_compressed': bench_write(pcd_writer('binary_compressed')),
+    'write_npy': bench_write(npy_writer),
+    'write_bin': bench_write(bin_writer),
+    'write_archive': bench_write(archive_writer),
+    'extract': bench_extract,
+    'data_pkl': bench_data_pkl,
+}
+
+
+def peak_rss():
+    """
+    :return: peak resident set size of the process in MB, None if unknown
+    """
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return maxrss / 1E6 if platform.system() == 'Darwin' else maxrss / 1E3
+
+
+def run_stage(name, pcap_path, params, repeat):
+    """
+    Run a stage in a fresh process, so that its peak RSS is measured alone
+    :return: result of the fastest run with throughput and peak RSS
+    """
+    best = None
+    for _ in range(repeat):
+        work_dir = tempfile.mkdtemp(prefix="benchmark_")
+        try:
+            result = STAGES[name](pcap_path, work_dir, params)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+
+    seconds = best['seconds']
+    for key in ('packets', 'points', 'frames'):
+        best["{}_per_s".format(key)] = best[key] / seconds if key in best and seconds > 0 else None
+    best['mb_per_s'] = best['bytes'] / 1E6 / seconds if 'bytes' in best and seconds > 0 else None
+    best['peak_rss_mb'] = peak_rss()
+    return best
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(
+            os.path.abspath(__file__)), stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except Exception:
+        return None
+
+
+def format_rate(value):
+    return "{:>12.1f}".format(value) if value is not None else "{:>12}".format("-")
+
+
+def main(args):
+    params = read_params(args['config'])
+    params['tree-scenes'] = args['scenes']
+    params['tree-frames'] = args['frames']
+    stages = args['stages'] or list(STAGES)
+    unknown = [name for name in stages if name not in STAGES]
+    if unknown:
+        print("unknown stages {}, expected some of {}".format(', '.join(unknown), ', '.join(STAGES)))
+        return
+    if 'write_pcd_binary_compressed' in stages and pcd.lzf is None:
+        print("write_pcd_binary_compressed skipped, it requires the python-lzf package")
+        stages.remove('write_pcd_binary_compressed')
+
+    work_dir = tempfile.mkdtemp(prefix="benchmark_")
+    results = {'commit': git_commit(), 'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'python': platform.python_version(),
+               'numpy': np.__version__, 'platform': platform.platform(), 'packets': args['packets'], 'stages': {}}
+    try:
+        pcap_path = args['pcap']
+        if pcap_path is None:
+            pcap_path = os.path.join(work_dir, "synthetic.pcap")
+            synthetic.write_pcap(pcap_path, args['packets'], params['data-port'])
+
+        print("{:<30} {:>10} {:>12} {:>12} {:>12} {:>12} {:>10}".format(
+            "stage", "seconds", "packets/s", "points/s", "frames/s", "MB/s", "RSS MB"))
+        context = multiprocessing.get_context('spawn')
+        for name in stages:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                try:
+                    result = pool.submit(run_stage, name, pcap_path, params, args['repeat']).result()
+                except Exception as ex:
+                    print("{}: {}".format(name, str(ex)))
+                    continue
+            results['stages'][name] = result
+            print("{:<30} {:>10.3f} {} {} {} {} {:>10}".format(
+                name, result['seconds'], format_rate(result['packets_per_s']), format_rate(result['points_per_s']),
+                format_rate(result['frames_per_s']), format_rate(result['mb_per_s']),
+                "{:.1f}".format(result['peak_rss_mb']) if result['peak_rss_mb'] is not None else "-"))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args['output']:
+        with open(args['output'], 'w') as fp:
+            json.dump(results, fp, indent=2)
+
+    if args['compare']:
+        with open(args['compare'], 'r') as fp:
+            baseline = json.load(fp)
+        print("speedup over {} (seconds of the baseline / seconds)".format(baseline.get('commit') or args['compare']))
+        for name, result in results['stages'].items():
+            if name in baseline['stages'] and result['seconds'] > 0:
+                print("{:<30} {:>10.2f}x".format(name, baseline['stages'][name]['seconds'] / result['seconds']))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--config', type=str, default='params.yaml', help="Path of the configuration file")
+    parser.add_argument('-p', '--pcap', type=str, default=None,
+                        help="Path of the pcap file to benchmark, by default a synthetic one is generated")
+    parser.add_argument('-n', '--packets', type=int, default=20000, help="Number of packets of the synthetic pcap file")
+    parser.add_argument('--scenes', type=int, default=3, help="Number of scenes of the synthetic data_pkl.py tree")
+    parser.add_argument('--frames', type=int, default=1000, help="Number of frames of each scene of the tree")
+    parser.add_argument('-s', '--stages', type=str, nargs='+', default=None, help="Stages to run, by default all")
+    parser.add_argument('-r', '--repeat', type=int, default=1, help="Number of runs of each stage, the fastest counts")
+    parser.add_argument('-o', '--output', type=str, default=None, help="Path of a JSON file to write the results to")
+    parser.add_argument('--compare', type=str, default=None, help="Path of the JSON results of a previous run")
+
+    args = vars(parser.parse_args())
+    main(args)
@@ -0,0 +1,134 @@
+import argparse
+import os
+from pathlib import Path
+
+import numpy as np
+from tqdm import tqdm
+
+import lidar
+from archive import ArchiveReader, ArchiveWriter, ARCHIVE_FILE
+from frame_buffer import FRAME_DTYPE, vertical_angles
+from frame_store import FrameSequenceWriter, read_txt, write_npy
+from lidar_manager import frame_time, write_txt
+from pcd import read_pcd, write_pcd
+
+
+def pcd_to_frame(points, omega):
+    """
+    Convert the points of a PCD file to FRAME_DTYPE, the fields missing in PCD files are derived
+    from the coordinates, the per point timestamps are unknown and set to NaN
+    """
+    frame = np.zeros(len(points), dtype=FRAME_DTYPE)
+    X = points['x'].astype(np.float64)
+    Y = points['y'].astype(np.float64)
+    Z = points['z'].astype(np.float64)
+    distances = np.sqrt(X ** 2 + Y ** 2 + Z ** 2)
+    vertical = np.degrees(np.arcsin(Z / np.where(distances > 0, distances, 1.)))
+    laser_id = np.argmin(np.abs(vertical[:, None] - omega), axis=1)
+
+    frame['timestamp'] = np.nan
+    frame['laser_id'] = laser_id
+    frame['x'] = X
+    frame['y'] = Y
+    frame['z'] = Z
+    frame['intensity'] = points['intensity']
+    frame['vertical_angle'] = omega[laser_id]
+    frame['horizontal_angle'] = np.degrees(np.arctan2(-Y, X)) % 360.
+    frame['distance'] = distances
+    return frame
+
+
+def list_frames(path, suffix):
+    """
+    :return: files of the frames in path sorted by frame number
+    """
+    names = [name for name in os.listdir(path) if name.endswith(suffix)]
+    return [Path(path) / name for name in sorted(names, key=lambda name: int(name.split("_")[0]))]
+
+
+def list_sources(seq_path, fmt, omega):
+    """
+    :return: list of (file name without suffix, callable reading the frame, timestamp of the frame or None for that
+             of its first point) of the frames of a sequence in frame order, from its TXT files, its PCD files or its
+             archive, the first of them which exists and is not fmt
+    """
+    if fmt != 'txt' and (seq_path / "data_txt").is_dir():
+        return [(fpath.stem, lambda fpath=fpath: read_txt(fpath), None)
+                for fpath in list_frames(seq_path / "data_txt", ".txt")]
+    if fmt != 'pcd' and (seq_path / "data_pcd").is_dir():
+        return [(fpath.stem, lambda fpath=fpath: pcd_to_frame(read_pcd(fpath), omega), None)
+                for fpath in list_frames(seq_path / "data_pcd", ".pcd")]
+    if fmt != 'archive' and (seq_path / "data_archive" / ARCHIVE_FILE).exists():
+        reader = ArchiveReader(seq_path / "data_archive")
+        # frames are named after the timestamp of the frame in the index, as the files written by main.py
+        return [("{}_{}".format(int(reader.index['frame'][i]), frame_time(reader.index['timestamp'][i])),
+                 lambda i=i: reader[i], reader.index['timestamp'][i])
+                for i in np.argsort(reader.index['frame'], kind='stable')]
+    return None
+
+
+def convert_sequence(seq_path, out_path, fmt, pcd_format='binary'):
+    """
+    Convert the TXT files of a sequence, or its PCD files if there are no TXT files, or its archive if there are
+    neither, to npy files, a sequence file, an archive, TXT or PCD files
+    """
+    omega = lidar.LSC16().omega
+    sources = list_sources(seq_path, fmt, omega)
+    if sources is None:
+        print("no data_txt, data_pcd or data_archive dir to convert to {} in {}".format(fmt, seq_path))
+        return
+
+    if fmt in ('npy', 'txt', 'pcd'):
+        fmt_path = out_path / "data_{}".format(fmt)
+        os.makedirs(fmt_path.absolute(), exist_ok=True)
+        for name, read_frame, _ in tqdm(sources, desc=seq_path.name):
+            frame = read_frame()
+            fpath = fmt_path / "{}.{}".format(name, fmt)
+            if fmt == 'npy':
+                write_npy(fpath, frame)
+            elif fmt == 'txt':
+                write_txt(fpath, frame['timestamp'], frame['laser_id'], frame['x'], frame['y'], frame['z'],
+                          frame['intensity'], vertical_angles(frame, omega), frame['horizontal_angle'],
+                          frame['distance'])
+            else:
+                write_pcd(fpath, frame['x'], frame['y'], frame['z'], frame['intensity'], pcd_format)
+    else:
+        writer = None
+        for name, read_frame, timestamp in tqdm(sources, desc=seq_path.name):
+            frame = read_frame()
+            if writer is None:
+                # frames of a compact archive keep their dtype
+                writer_class = FrameSequenceWriter if fmt == 'bin' else ArchiveWriter
+                writer = writer_class(out_path / "data_{}".format(fmt), frame.dtype)
+            writer.write(int(name.split("_")[0]), frame, timestamp)
+        if writer is not None:
+            writer.close()
+
+
+def main(args):
+    in_dir = Path(args['in_dir'])
+    out_dir = Path(args['out_dir'])
+
+    # the input is either a single sequence or a directory of sequences
+    if (in_dir / "data_txt").is_dir() or (in_dir / "data_pcd").is_dir() or (in_dir / "data_archive").is_dir():
+        seq_paths = [in_dir]
+    else:
+        seq_paths = sorted(path for path in in_dir.iterdir() if path.is_dir())
+
+    for seq_path in seq_paths:
+        convert_sequence(seq_path, out_dir / seq_path.name, args['format'], args['pcd_format'])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--in-dir', type=str, help="Path of a sequence or a directory of sequences",
+                        required=True)
+    parser.add_argument('-o', '--out-dir', type=str, help="Path of the output directory", required=True)
+    parser.add_argument('-f', '--format', type=str, choices=['npy', 'bin', 'archive', 'txt', 'pcd'],
+                        default='npy',
+                        help="npy files per frame, one sequence file, one archive, or TXT or PCD files per frame")
+    parser.add_argument('--pcd-format', type=str, default='binary',
+                        help="DATA format of the PCD files: ascii, binary or binary_compressed")
+
+    args = vars(parser.parse_args())
+    main(args)
@@ -0,0 +1,287 @@
+import argparse
+import os
+import pickle
+import struct
+import zipfile
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+
+INDEX_FILE = "data_index.npz"
+
+# division of the indoor scene dataset of 3DOPFormer, scenes which are not listed belong to no split
+SPLITS = {
+    'train': ('canteen_floor_1', 'canteen_floor_2', 'canteen_floor_3', 'fengyu', 'huiwen_floor_2', 'library_floor_2',
+              'museum_floor_2', 'museum_floor_4', 'N5_floor_1', 'N5_floor_2', 'N7_floor_2', 'shoppingmall_floor_1',
+              'shoppingmall_floor_2', 'zhensheng'),
+    'val': ('huiwen_floor_1', 'N5_floor_1_north'),
+    'test': ('N7_floor_1', 'N5_floor_1_south'),
+}
+SPLIT_NAMES = tuple(SPLITS)
+
+# paths of each entry besides img0, in the order of the columns of the index
+PATH_KEYS = ('img1', 'img2', 'img3', 'lidar_txt', 'lidar_pcd')
+
+# size of the fixed part of a zip local file header
+ZIP_LOCAL_HEADER_SIZE = 30
+
+
+def scene_split(scene_name):
+    """
+    :param scene_name: scene dir of the imgs, e.g. imgs_indoor_canteen_floor_1
+    :return: index of the split of the scene in SPLIT_NAMES, -1 if it belongs to none
+    """
+    name = scene_name.split("_indoor_", 1)[-1] if "_indoor_" in scene_name else None
+    for i, split in enumerate(SPLIT_NAMES):
+        if name in SPLITS[split]:
+            return i
+    return -1
+
+
+def scene_of(img0_key):
+    """
+    :return: scene dir of an img0_key, {scene}/{timestamp}_0.jpg
+    """
+    return img0_key.replace("\\", "/").split("/")[0]
+
+
+def string_table(strings):
+    """
+    :return: concatenated utf-8 bytes of the strings, offset of each string and of the end
+    """
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(data) for data in encoded])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def write_index(path, data_dict):
+    """
+    Write the entries of a data_dict of data_pkl.py as columns: scene and split of each entry, timestamp of img0
+    in microseconds and ids of its paths in a deduplicated string table. Entries are sorted by scene and img0 key,
+    so that the entries of each scene are consecutive even if a scene name is a prefix of another one.
+    """
+    img0_keys = sorted(data_dict, key=lambda key: (scene_of(key), key))
+    scene_names = [scene_of(key) for key in img0_keys]
+    scenes, scene_ids = np.unique(np.array(scene_names, dtype=str), return_inverse=True) if img0_keys else \
+        (np.array([], dtype=str), np.array([], dtype=np.int64))
+
+    # every path is stored once in the string table
+    paths = {}
+    columns = {'img0': [paths.setdefault(key, len(paths)) for key in img0_keys]}
+    for name in PATH_KEYS:
+        columns[name] = [paths.setdefault(data_dict[key][name], len(paths)) for key in img0_keys]
+    strings, string_offsets = string_table(paths)
+
+    timestamps = np.array([float(os.path.splitext(os.path.basename(key))[0].split("_")[0]) for key in img0_keys],
+                          dtype=np.float64)
+    scene_names, scene_offsets = string_table(scenes.tolist())
+    with open(path, 'wb') as f:
+        np.savez(f, strings=strings, string_offsets=string_offsets, scene_names=scene_names,
+                 scene_offsets=scene_offsets, scene_split=np.array([scene_split(name) for name in scenes], np.int8),
+                 scene_start=np.searchsorted(scene_ids.reshape(-1), np.arange(len(scenes) + 1)).astype(np.int64),
+                 timestamp=np.round(timestamps * 1E6).astype(np.int64),
+                 **{name: np.array(ids, dtype=np.int32) for name, ids in columns.items()})
+
+
+def load_npz(path):
+    """
+    Memory map the arrays of an uncompressed .npz file
+    :return: dict of the arrays
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as zf, open(path, 'rb') as fp:
+        for info in zf.infolist():
+            name = info.filename[:-len('.npy')] if info.filename.endswith('.npy') else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                with zf.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member)
+                continue
+            fp.seek(info.header_offset + 26)
+            name_len, extra_len = struct.unpack('<HH', fp.read(4))
+            fp.seek(info.header_offset + ZIP_LOCAL_HEADER_SIZE + name_len + extra_len)
+            version = np.lib.format.read_magic(fp)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fp)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fp)
+            if int(np.prod(shape)) == 0:
+                arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=fp.tell(), shape=shape,
+                                         order='F' if fortran_order else 'C')
+    return arrays
+
+
+class DataIndex:
+    """
+    Columnar index of data_all.pkl, opened without loading it: the columns are memory mapped and shared
+    by all processes which open the same file. Entries are queried by scene, split and time range,
+    as_dict gives a read-only view which behaves like the data_dict of data_pkl.py.
+    """
+    def __init__(self, path=INDEX_FILE):
+        self.path = path
+        self.columns = load_npz(path)
+        self.scenes = [self.decode(self.columns['scene_names'], self.columns['scene_offsets'], i)
+                       for i in range(len(self.columns['scene_offsets']) - 1)]
+
+    def __getstate__(self):
+        # the columns are mapped again instead of being pickled
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def __len__(self):
+        return len(self.columns['img0'])
+
+    @staticmethod
+    def decode(data, offsets, i):
+        return bytes(data[offsets[i]:offsets[i + 1]]).decode('utf-8')
+
+    def string(self, string_id):
+        return self.decode(self.columns['strings'], self.columns['string_offsets'], int(string_id))
+
+    def key(self, i):
+        """
+        :return: img0_key of the i-th entry
+        """
+        return self.string(self.columns['img0'][i])
+
+    def entry(self, i):
+        """
+        :return: dict of the paths of the i-th entry, as the values of the data_dict
+        """
+        return {name: self.string(self.columns[name][i]) for name in PATH_KEYS}
+
+    def keys(self):
+        """
+        :return: img0_keys of the entries in index order, each key is decoded when it is accessed
+        """
+        return KeyList(self)
+
+    def scene_range(self, scene_name):
+        """
+        :return: range of the entries of a scene
+        """
+        if scene_name not in self.scenes:
+            return range(0)
+        scene_id = self.scenes.index(scene_name)
+        return range(int(self.columns['scene_start'][scene_id]), int(self.columns['scene_start'][scene_id + 1]))
+
+    def select(self, scene=None, split=None, start=None, end=None):
+        """
+        :param scene: scene name or list of scene names
+        :param split: train, val or test
+        :param start: first timestamp of img0 [s]
+        :param end: last timestamp of img0 [s]
+        :return: sorted positions of the entries matching all given conditions
+        """
+        scene_ids = range(len(self.scenes))
+        if scene is not None:
+            names = [scene] if isinstance(scene, str) else scene
+            scene_ids = [i for i in scene_ids if self.scenes[i] in names]
+        if split is not None:
+            scene_ids = [i for i in scene_ids if self.columns['scene_split'][i] == SPLIT_NAMES.index(split)]
+
+        scene_start = self.columns['scene_start']
+        positions = [np.arange(scene_start[i], scene_start[i + 1]) for i in scene_ids]
+        positions = np.concatenate(positions) if positions else np.zeros(0, dtype=np.int64)
+        if start is not None or end is not None:
+            timestamps = self.columns['timestamp'][positions]
+            valid = np.ones(len(positions), dtype=bool)
+            if start is not None:
+                valid &= timestamps >= int(round(start * 1E6))
+            if end is not None:
+                valid &= timestamps <= int(round(end * 1E6))
+            positions = positions[valid]
+        return positions
+
+    def find(self, img0_key):
+        """
+        :return: position of the entry of img0_key, None if there is none
+        """
+        # entries are sorted by scene and img0_key
+        target = (scene_of(img0_key), img0_key)
+        low, high = 0, len(self)
+        while low < high:
+            mid = (low + high) // 2
+            key = self.key(mid)
+            if (scene_of(key), key) < target:
+                low = mid + 1
+            else:
+                high = mid
+        return low if low < len(self) and self.key(low) == img0_key else None
+
+    def as_dict(self):
+        return DataDictView(self)
+
+
+class KeyList(Sequence):
+    """
+    Read-only list of the img0_keys of a DataIndex
+    """
+    def __init__(self, index):
+        self.index = index
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.index.key(j) for j in range(len(self))[i]]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.index.key(i)
+
+    def __len__(self):
+        return len(self.index)
+
+
+class DataDictView(Mapping):
+    """
+    Read-only view of a DataIndex which behaves like the data_dict of data_pkl.py
+    """
+    def __init__(self, index):
+        self.index = index
+
+    def __getitem__(self, img0_key):
+        i = self.index.find(img0_key)
+        if i is None:
+            raise KeyError(img0_key)
+        return self.index.entry(i)
+
+    def __iter__(self):
+        return (self.index.key(i) for i in range(len(self.index)))
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, img0_key):
+        return self.index.find(img0_key) is not None
+
+
+def load_data_dict(path):
+    """
+    :return: data_dict of a data_all.pkl file, or a view of it for a data_index.npz file
+    """
+    if str(path).endswith('.npz'):
+        return DataIndex(path).as_dict()
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def main(args):
+    with open(args['pkl'], 'rb') as f:
+        data_dict = pickle.load(f)
+    write_index(args['out'], data_dict)
+    print("{} entries written to {}".format(len(data_dict), args['out']))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--pkl', type=str, default='data_all.pkl', help="Path of data_all.pkl to convert")
+    parser.add_argument('-o', '--out', type=str, default=INDEX_FILE, help="Path of the index to write")
+
+    args = vars(parser.parse_args())
+    main(args)
@@ -1,10 +1,37 @@
 import os
 import numpy as np
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 import pickle
 from tqdm import tqdm
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from data_index import write_index
+from profiler import Profiler
+
+
+def parse_lidar_timestamps(names):
+    """
+    Parse the local time in the names of lidar data in bulk
+    :param names: file names {frame_nr}_{%Y-%m-%d}_{%H-%M-%S.%f}.txt
+    :return: timestamps equal to datetime.timestamp(datetime.strptime(...)) of each name
+    """
+    if len(names) == 0:
+        return np.zeros(0)
+    name_lists = [os.path.splitext(name)[0].split("_") for name in names]
+    naive = np.array(["{}T{}".format(name_list[1], name_list[2].replace("-", ":")) for name_list in name_lists],
+                     dtype='datetime64[us]').astype(np.int64)
+    seconds, microseconds = np.divmod(naive, 1000000)
+
+    # the utc offset of the local time zone is looked up once per hour of local time
+    hours, inverse = np.unique(seconds // 3600, return_inverse=True)
+    utc_offset = np.array([int(datetime.timestamp(datetime(1970, 1, 1) + timedelta(hours=int(hour)))) - int(hour) * 3600
+                           for hour in hours], dtype=np.int64)
+    return (seconds + utc_offset[inverse.reshape(-1)]) + microseconds / 1e6
+
+
+CACHE_VERSION = 1
 
 
 class generate_data_pkl():
@@ -12,133 +39,286 @@ class generate_data_pkl():
         self.imgs_path = args['imgs_path']
         self.lidar_path = args['lidar_path']
         self.camera_num = 4
+        # maximum time offset in seconds between camera_0 and the matched imgs and lidar data, None means no limit
+        self.max_offset = args.get('max_offset')
+        # number of scene directories scanned at the same time
+        self.workers = args.get('workers', 8)
+        # index of each scene and its part of data_all.pkl saved between runs, None disables the cache
+        self.cache_path = args.get('cache')
+        self.cache = self.load_cache()
+        # path of the columnar index of data_all.pkl, None writes no index
+        self.index_path = args.get('index')
+        # time of each step, off unless --profile is given
+        self.profiler = Profiler(args.get('profile', False))
         
-        self.scene_names_list = sorted(os.listdir(self.imgs_path))
-        self.imgs_list = None
-        self.lidar_list = None
-        # get a list of all imgs and lidar data's path
-        self.get_imgs_lidar_list()
+        self.scene_names_list = sorted(entry.name for entry in os.scandir(self.imgs_path) if entry.is_dir())
+        self.imgs_index = None
+        self.lidar_index = None
+        # get an index of the imgs and lidar data of each scene, only changed scenes are scanned
+        with self.profiler.stage('scan'):
+            self.get_imgs_lidar_list()
         
         self.imgs_tp_dict = None
         self.img0_path_array = None
         # get a timestamp dict of imgs and a array consisted of camera_0's path 
-        self.get_imgs_tp()
+        with self.profiler.stage('imgs_tp'):
+            self.get_imgs_tp()
         
         self.lidar_tp_dict = None
         self.lidar_path_dict = None
         # get a timestamp dict of lidar and a path dict of lidar's timestamp 
-        self.get_lidar_tp()
+        with self.profiler.stage('lidar_tp'):
+            self.get_lidar_tp()
         
         self.get_data_pkl()
+        with self.profiler.stage('save_cache'):
+            self.save_cache()
         
     def __len__(self):
         return len(self.img0_path_array)
-    
+
+    def cache_header(self):
+        # lidar timestamps are parsed in the local time zone, a cache of another time zone is invalid
+        return {'version': CACHE_VERSION, 'imgs_path': os.path.abspath(self.imgs_path),
+                'lidar_path': os.path.abspath(self.lidar_path), 'camera_num': self.camera_num,
+                'time_zone': (time.timezone, time.altzone, time.tzname)}
+
+    def load_cache(self):
+        """
+        Load the scene index of a previous run
+        :return: cache dict, empty if there is no cache of the same dataset
+        """
+        cache = {'header': self.cache_header(), 'imgs': {}, 'lidar': {}, 'data': {}}
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return cache
+        try:
+            with open(self.cache_path, 'rb') as f:
+                loaded = pickle.load(f)
+        except Exception as ex:
+            print(str(ex))
+            return cache
+        if not isinstance(loaded, dict) or loaded.get('header') != cache['header']:
+            return cache
+        return loaded
+
+    def save_cache(self):
+        if not self.cache_path:
+            return
+        # the scenes which no longer exist are dropped
+        lidar_scene_names = [scene_name.replace("imgs", "lidar") for scene_name in self.scene_names_list]
+        cache = {'header': self.cache['header'],
+                 'imgs': {name: self.imgs_index[name] for name in self.scene_names_list},
+                 'lidar': {name: self.lidar_index[name] for name in lidar_scene_names},
+                 'data': {name: self.cache['data'][name] for name in self.scene_names_list
+                          if name in self.cache['data']}}
+        tmp_path = "{}.tmp".format(self.cache_path)
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(cache, f)
+        os.replace(tmp_path, self.cache_path)
+
     def get_imgs_lidar_list(self):
         start_time = time.time()
-        imgs_list = []
-        for dirpath, dirnames, filenames in os.walk(self.imgs_path):
-            for filename in filenames:
-                imgs_name = os.path.join(dirpath, filename)
-                imgs_list.append(imgs_name)
-        self.imgs_list = sorted(imgs_list)
-        
-        lidar_list = []
-        for dirpath, dirnames, filenames in os.walk(self.lidar_path):
-            for filename in filenames:
-                if filename.endswith('txt'):
-                    lidar_name = os.path.join(dirpath, filename)
-                    lidar_list.append(lidar_name)
-        self.lidar_list = sorted(lidar_list)
-        print("get_imgs_lidar_list done, use time: {}".format(time.time() - start_time))
+        lidar_scene_names = [scene_name.replace("imgs", "lidar") for scene_name in self.scene_names_list]
+        with ThreadPoolExecutor(max_workers=max(self.workers, 1)) as pool:
+            imgs_index = pool.map(self.index_imgs_scene, self.scene_names_list)
+            lidar_index = pool.map(self.index_lidar_scene, lidar_scene_names)
+            self.imgs_index = dict(zip(self.scene_names_list, imgs_index))
+            self.lidar_index = dict(zip(lidar_scene_names, lidar_index))
+        scanned = sum(index['scanned'] for index in self.imgs_index.values()) + \
+            sum(index['scanned'] for index in self.lidar_index.values())
+        self.profiler.count('scene_dirs_scanned', scanned)
+        self.profiler.count('lidar_files', sum(len(index['names']) for index in self.lidar_index.values()))
+        print("get_imgs_lidar_list done, {} of {} scene dirs scanned, use time: {}".format(
+            scanned, len(self.imgs_index) + len(self.lidar_index), time.time() - start_time))
+
+    def index_imgs_scene(self, scene_name):
+        """
+        Index the imgs of a scene, the cached index is used if the scene dir has not changed
+        :return: dict of the sorted timestamps of each camera and the sorted names of the imgs of camera_0
+        """
+        scene_path = os.path.join(self.imgs_path, scene_name)
+        mtime = os.stat(scene_path).st_mtime_ns
+        cached = self.cache['imgs'].get(scene_name)
+        if cached is not None and cached['mtime'] == mtime:
+            return dict(cached, scanned=False)
+
+        with os.scandir(scene_path) as it:
+            names = sorted(entry.name for entry in it if entry.is_file())
+        # file names are {timestamp}_{camera_id}.jpg
+        name_lists = [os.path.splitext(name)[0].split("_") for name in names]
+        timestamps = np.array([name_list[0] for name_list in name_lists], dtype=np.float64)
+        cam_ids = np.array([name_list[1] for name_list in name_lists])
+        tp = {"img{}".format(j): np.sort(timestamps[cam_ids == str(j)]) for j in range(self.camera_num)}
+        img0_names = np.array(names)[cam_ids == "0"] if len(names) else np.array([], dtype=str)
+        return {'mtime': mtime, 'tp': tp, 'img0_names': img0_names, 'scanned': True}
+
+    def index_lidar_scene(self, scene_name):
+        """
+        Index the lidar data of a scene, the cached index is used if the data_txt dir has not changed
+        :return: dict of the sorted timestamps and the names of the lidar data at these timestamps
+        """
+        txt_path = os.path.join(self.lidar_path, scene_name, "data_txt")
+        mtime = os.stat(txt_path).st_mtime_ns if os.path.isdir(txt_path) else None
+        cached = self.cache['lidar'].get(scene_name)
+        if cached is not None and cached['mtime'] == mtime:
+            return dict(cached, scanned=False)
+
+        names = []
+        if mtime is not None:
+            with os.scandir(txt_path) as it:
+                names = sorted(entry.name for entry in it if entry.is_file() and entry.name.endswith('txt'))
+        timestamps = parse_lidar_timestamps(names)
+
+        # of equal timestamps the last name is kept
+        order = np.argsort(timestamps, kind='stable')
+        timestamps = timestamps[order]
+        keep = np.append(timestamps[1:] != timestamps[:-1], True) if len(timestamps) else np.ones(0, dtype=bool)
+        names = np.array(names, dtype=str)[order][keep]
+        return {'mtime': mtime, 'tp': timestamps[keep], 'names': names, 'scanned': True}
     
     def get_imgs_tp(self):
         start_time = time.time()
-        imgs_tp_dict = {}
-        img0_path_list = []
-        
         # timestamp are classified by scene_name and camera_id
-        for i in range(len(self.scene_names_list)):
-            scene_name = self.scene_names_list[i]
-            imgs_tp_dict[scene_name] = {}
-            for j in range(self.camera_num):
-                imgs_tp_dict[scene_name]["img{}".format(j)] = np.array([])
-        for i in range(len(self.imgs_list)):
-            imgs_path_list = self.imgs_list[i].split("/")
-            scene_name = imgs_path_list[-2]
-            img_name = imgs_path_list[-1]
-            name_list = os.path.splitext(img_name)[0].split("_")
-            timestamp = name_list[0]
-            cam_id = name_list[1]
-            imgs_tp_dict[scene_name]["img{}".format(cam_id)] = \
-                np.append(imgs_tp_dict[scene_name]["img{}".format(cam_id)], float(timestamp))
-            if cam_id == "0":
-                img0_path_list.append(self.imgs_list[i])
-        self.imgs_tp_dict = imgs_tp_dict
-        img0_path_list = sorted(img0_path_list)
+        self.imgs_tp_dict = {scene_name: index['tp'] for scene_name, index in self.imgs_index.items()}
+        img0_path_list = []
+        for scene_name in self.scene_names_list:
+            img0_path_list += [os.path.join(self.imgs_path, scene_name, name)
+                               for name in self.imgs_index[scene_name]['img0_names']]
         self.img0_path_array = np.array(img0_path_list)
         print("get_imgs_tp done, use time: {}".format(time.time() - start_time))
     
     def get_lidar_tp(self):
         start_time = time.time()
-        lidar_tp_dict = {}
-        lidar_path_dict = {}
-        
-        # timestamp are classified by scene_name, lidar_path are classified by scene_name and timestamp
-        for i in range(len(self.scene_names_list)):
-            scene_name = self.scene_names_list[i]
-            scene_name = scene_name.replace("imgs", "lidar")
-            lidar_tp_dict[scene_name] = np.array([])
-            lidar_path_dict[scene_name] = {}
-        for i in range(len(self.lidar_list)):
-            lidar_path_list = self.lidar_list[i].split("/")
-            scene_name = lidar_path_list[-3]
-            lidar_name = lidar_path_list[-1]
-            name_list = os.path.splitext(lidar_name)[0].split("_")
-            timestamp = datetime.timestamp(datetime.strptime("{}_{}".format(name_list[1], name_list[2]), '%Y-%m-%d_%H-%M-%S.%f'))
-            lidar_tp_dict[scene_name] = np.append(lidar_tp_dict[scene_name], timestamp)
-            lidar_path_dict[scene_name]["{}".format(timestamp)] = self.lidar_list[i]
-        self.lidar_tp_dict = lidar_tp_dict
-        self.lidar_path_dict = lidar_path_dict
+        # timestamp and lidar_path are classified by scene_name, sorted by timestamp
+        self.lidar_tp_dict = {scene_name: index['tp'] for scene_name, index in self.lidar_index.items()}
+        self.lidar_path_dict = {scene_name: np.array([os.path.join(self.lidar_path, scene_name, "data_txt", name)
+                                                      for name in index['names']])
+                                for scene_name, index in self.lidar_index.items()}
         print("get_lidar_tp done, use time: {}".format(time.time() - start_time))
         
     def get_data_pkl(self):
         data_dict = {}
-        for idx in tqdm(range(len(self.img0_path_array))):
-            img0_path = self.img0_path_array[idx]
-            img0_dir_list = img0_path.split("/")
-            scene_name = img0_dir_list[-2]
-            img0_name = img0_dir_list[-1]
-            img0_key = os.path.join(scene_name, img0_name)
+        dropped = 0
+        rebuilt = 0
+
+        for scene_name in tqdm(self.scene_names_list):
+            lidar_scene_name = scene_name.replace("imgs", "lidar")
+            # the part of data_all.pkl of a scene is reused if neither its imgs nor its lidar data have changed
+            key = (self.imgs_index[scene_name]['mtime'], self.lidar_index[lidar_scene_name]['mtime'], self.max_offset)
+            cached = self.cache['data'].get(scene_name)
+            if cached is None or cached['key'] != key:
+                cached = {'key': key}
+                with self.profiler.stage('match'):
+                    cached['data'], cached['dropped'] = self.get_scene_data(scene_name)
+                self.cache['data'][scene_name] = cached
+                rebuilt += 1
+            data_dict.update(cached['data'])
+            dropped += cached['dropped']
+
+        print("{} of {} scenes matched".format(rebuilt, len(self.scene_names_list)))
+        if dropped > 0:
+            print("{} imgs dropped in total".format(dropped))
+        with self.profiler.stage('write_pkl'):
+            with open('data_all.pkl', 'wb') as f:
+                pickle.dump(data_dict, f)
+        self.profiler.count('imgs_matched', len(data_dict))
+        self.profiler.count('imgs_dropped', dropped)
+        self.profiler.count('bytes_written', os.path.getsize('data_all.pkl'))
+        if self.index_path:
+            with self.profiler.stage('write_index'):
+                write_index(self.index_path, data_dict)
+            self.profiler.count('bytes_written', os.path.getsize(self.index_path))
+
+    def get_scene_data(self, scene_name):
+        """
+        Match all imgs of camera_0 of a scene with the nearest imgs of the other cameras and lidar data
+        :return: data_dict of the scene, number of dropped imgs of camera_0
+        """
+        data_dict = {}
+        img0_name_list = self.imgs_index[scene_name]['img0_names']
+        img0_tp = np.array([os.path.splitext(img0_name)[0].split("_")[0] for img0_name in img0_name_list],
+                           dtype=np.float64)
+        valid = np.ones(len(img0_tp), dtype=bool)
+
+        # imgs_path are classified by img0_key and camera_id
+        img_tp_dict = {}
+        for i in range(1, self.camera_num):
+            tp_array = self.imgs_tp_dict[scene_name]["img{}".format(i)]
+            img_tp_dict[i], tp_valid = self.match_timestamps(tp_array, img0_tp)
+            valid &= tp_valid
+
+        # lidar_path are classified by img0_key
+        lidar_scene_name = scene_name.replace("imgs", "lidar")
+        tp_array = self.lidar_tp_dict[lidar_scene_name]
+        lidar_index, tp_valid = self.match_timestamps(tp_array, img0_tp, return_index=True)
+        valid &= tp_valid
+
+        dropped = int(np.count_nonzero(~valid))
+        if dropped > 0:
+            print("{}: {} of {} imgs dropped, no imgs or lidar data within {} s".format(
+                scene_name, dropped, len(valid), self.max_offset))
+
+        for idx in np.flatnonzero(valid):
+            img0_key = os.path.join(scene_name, img0_name_list[idx])
             data_dict[img0_key] = {}
-            
-            # imgs_path are classified by img0_key and camera_id
-            lidar_path_list = os.path.splitext(img0_name)[0].split("_")
-            img0_tp = float(lidar_path_list[0])
             for i in range(1, self.camera_num):
-                tp_diff_min_index = np.argmin(np.absolute(self.imgs_tp_dict[scene_name]["img{}".format(i)] - img0_tp))
-                img_tp = self.imgs_tp_dict[scene_name]["img{}".format(i)][tp_diff_min_index]
-                img_key = os.path.join(scene_name, "{:.6f}_{}.jpg".format(img_tp, i))
+                img_key = os.path.join(scene_name, "{:.6f}_{}.jpg".format(img_tp_dict[i][idx], i))
                 data_dict[img0_key]["img{}".format(i)] = img_key
-                
-            # lidar_path are classified by img0_key
-            scene_name = scene_name.replace("imgs", "lidar")
-            tp_diff_min_index = np.argmin(np.absolute(self.lidar_tp_dict[scene_name] - img0_tp))
-            lidar_tp = self.lidar_tp_dict[scene_name][tp_diff_min_index]
-            lidar_path = self.lidar_path_dict[scene_name]["{}".format(lidar_tp)]
-            lidar_path_list = lidar_path.split("/")
-            lidar_txt_key = os.path.join(lidar_path_list[-3],lidar_path_list[-2],lidar_path_list[-1])
-            lidar_pcd_key = os.path.join(lidar_path_list[-3],"data_pcd",lidar_path_list[-1].replace("txt", "pcd"))
+
+            lidar_name = self.lidar_index[lidar_scene_name]['names'][lidar_index[idx]]
+            lidar_txt_key = os.path.join(lidar_scene_name, "data_txt", lidar_name)
+            lidar_pcd_key = os.path.join(lidar_scene_name, "data_pcd", lidar_name.replace("txt", "pcd"))
             data_dict[img0_key]["lidar_txt"] = lidar_txt_key
             data_dict[img0_key]["lidar_pcd"] = lidar_pcd_key
-        with open('data_all.pkl', 'wb') as f:
-            pickle.dump(data_dict, f)
+        return data_dict, dropped
+
+    def match_timestamps(self, tp_array, query_tp, return_index=False):
+        """
+        Find the nearest timestamp of each query timestamp
+        :param tp_array: sorted timestamps
+        :param query_tp: timestamps to match
+        :param return_index: return the index of the nearest timestamps instead of the timestamps
+        :return: nearest timestamps (earlier one on ties) and whether each match is within max_offset
+        """
+        if len(tp_array) == 0:
+            return np.zeros(len(query_tp), dtype=np.int64 if return_index else np.float64), \
+                np.zeros(len(query_tp), dtype=bool)
+        right = np.clip(np.searchsorted(tp_array, query_tp), 0, len(tp_array) - 1)
+        left = np.clip(right - 1, 0, len(tp_array) - 1)
+        left_diff = np.absolute(tp_array[left] - query_tp)
+        right_diff = np.absolute(tp_array[right] - query_tp)
+        index = np.where(left_diff <= right_diff, left, right)
+        diff = np.minimum(left_diff, right_diff)
+
+        valid = np.ones(len(query_tp), dtype=bool)
+        if self.max_offset is not None:
+            valid = diff <= self.max_offset
+        return (index if return_index else tp_array[index]), valid
 
 
 if __name__=="__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('-im', '--imgs_path', type=str, help="Path of the imgs data", required=True)
     parser.add_argument('-lp', '--lidar_path', type=str, help="Path of the lidar data", required=True)
+    parser.add_argument('-mo', '--max_offset', type=float, default=None,
+                        help="Maximum time offset in seconds of the matched imgs and lidar data, imgs of camera_0 "
+                             "without imgs or lidar data within this offset are dropped")
+    parser.add_argument('-w', '--workers', type=int, default=8, help="Number of scene dirs scanned at the same time")
+    parser.add_argument('-ca', '--cache', type=str, default='data_pkl_cache.pkl',
+                        help="Path of the index cache, only scenes changed since the last run are scanned and matched")
+    parser.add_argument('--no_cache', action='store_true', help="Scan and match all scenes without a cache")
+    parser.add_argument('-ix', '--index', type=str, default=None,
+                        help="Path of a columnar index of data_all.pkl to write as well, e.g. data_index.npz")
+    parser.add_argument('--profile', action='store_true', help="Print the time of each step")
+    parser.add_argument('--profile_report', type=str, default=None,
+                        help="Path of a JSON, or CSV if it ends with .csv, file to write the profile to")
     args = vars(parser.parse_args())
+    if args['no_cache']:
+        args['cache'] = None
+    args['profile'] = args['profile'] or args['profile_report'] is not None
     
-    generate_data_pkl(args)
+    data_pkl = generate_data_pkl(args)
+    if data_pkl.profiler.enabled:
+        print(data_pkl.profiler.summary())
+        if args['profile_report']:
+            data_pkl.profiler.write_report(args['profile_report'])
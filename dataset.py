@@ -0,0 +1,211 @@
+import os
+import queue
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+import lidar
+from archive import ArchiveReader, ARCHIVE_FILE
+from convert import pcd_to_frame
+from data_index import DataDictView, load_data_dict
+from frame_store import FrameSequenceReader, INDEX_FILE, read_txt
+from pcd import read_pcd
+
+
+# formats a frame is looked up in, the binary ones are memory mapped
+FRAME_FORMATS = ('bin', 'npy', 'archive', 'txt', 'pcd')
+
+
+class LidarDataset:
+    """
+    Random access to the lidar frames of data_all.pkl. Frames are read from the sequence files (data_bin), npy
+    files (data_npy) or archive (data_archive) of a scene if they exist, otherwise the TXT or PCD files are parsed.
+    Loaded frames are kept in a LRU cache bounded in bytes, and the following frames can be loaded ahead by a
+    prefetch thread.
+
+    A dataset can be used by several worker processes, e.g. of a torch DataLoader: memory maps, cache and prefetch
+    thread are not pickled or inherited, each process opens its own.
+    """
+    def __init__(self, pkl_path, lidar_path, cache_mb=512, prefetch=0, formats=FRAME_FORMATS):
+        """
+        :param pkl_path: path of data_all.pkl or of its columnar index data_index.npz
+        :param lidar_path: path of the lidar data, the dir of the scene dirs
+        :param cache_mb: maximum size of the cached frames in MB, 0 disables the cache
+        :param prefetch: number of frames following the last requested one to load ahead in a thread, 0 disables it
+        :param formats: formats to look frames up in, in order of preference
+        """
+        self.pkl_path = pkl_path
+        self.lidar_path = Path(lidar_path)
+        self.cache_bytes = int(cache_mb * 1E6)
+        self.prefetch = prefetch
+        self.formats = tuple(formats)
+
+        self.data_dict = load_data_dict(pkl_path)
+        # the entries of a data_index.npz are already sorted, their keys are not decoded up front
+        if isinstance(self.data_dict, DataDictView):
+            self.keys = self.data_dict.index.keys()
+        else:
+            self.keys = sorted(self.data_dict)
+        self.omega = lidar.LSC16().omega
+        self.init_process()
+
+    def init_process(self):
+        """
+        Reset the state which belongs to a process: sequence readers, cache and prefetch thread
+        """
+        self.pid = os.getpid()
+        self.readers = {}
+        self.archives = {}
+        self.cache = OrderedDict()
+        self.cached_bytes = 0
+        self.lock = threading.Lock()
+        self.prefetch_queue = None
+        self.prefetch_thread = None
+        self.pending = set()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ('readers', 'archives', 'cache', 'lock', 'prefetch_queue', 'prefetch_thread', 'pending'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.init_process()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, i):
+        """
+        :return: dict of the img0_key, the imgs of the other cameras and the lidar frame as arrays xyz [N x 3],
+                 intensity, laser_id and timestamp [N], timestamps of frames read from PCD files are NaN
+        """
+        if os.getpid() != self.pid:
+            # forked worker process
+            self.init_process()
+        sample = {'img0': self.keys[i]}
+        sample.update({name: value for name, value in self.entry(i).items() if name.startswith('img')})
+        sample.update(self.get_frame(i))
+
+        if self.prefetch > 0:
+            self.schedule(range(i + 1, min(i + 1 + self.prefetch, len(self.keys))))
+        return sample
+
+    def entry(self, i):
+        """
+        :return: dict of the paths of the i-th entry
+        """
+        if isinstance(self.data_dict, DataDictView):
+            return self.data_dict.index.entry(i)
+        return self.data_dict[self.keys[i]]
+
+    def get_frame(self, i):
+        with self.lock:
+            frame = self.cache.get(i)
+            if frame is not None:
+                self.cache.move_to_end(i)
+                return frame
+        frame = self.load_frame(i)
+        self.put_cache(i, frame)
+        return frame
+
+    def put_cache(self, i, frame):
+        size = sum(values.nbytes for values in frame.values())
+        if size > self.cache_bytes:
+            return
+        with self.lock:
+            if i in self.cache:
+                return
+            self.cache[i] = frame
+            self.cached_bytes += size
+            # the least recently used frames are evicted
+            while self.cached_bytes > self.cache_bytes:
+                _, evicted = self.cache.popitem(last=False)
+                self.cached_bytes -= sum(values.nbytes for values in evicted.values())
+
+    def load_frame(self, i):
+        """
+        Load a frame from the first format it exists in
+        :return: dict of the arrays xyz, intensity, laser_id and timestamp
+        """
+        txt_key = self.entry(i)['lidar_txt']
+        # lidar_txt is {scene}/data_txt/{frame_nr}_{time}.txt
+        scene_name, _, txt_name = Path(txt_key).parts[-3:]
+        scene_path = self.lidar_path / scene_name
+        stem = Path(txt_name).stem
+
+        for fmt in self.formats:
+            points = None
+            if fmt == 'bin':
+                reader = self.sequence_reader(scene_name)
+                pos = reader.find(int(stem.split("_")[0])) if reader is not None else None
+                if pos is not None:
+                    points = reader[pos]
+            elif fmt == 'archive':
+                reader = self.archive_reader(scene_name)
+                points = reader.frame(int(stem.split("_")[0])) if reader is not None else None
+            elif fmt == 'npy' and (scene_path / "data_npy" / (stem + ".npy")).exists():
+                points = np.load(scene_path / "data_npy" / (stem + ".npy"), mmap_mode='r')
+            elif fmt == 'txt' and (scene_path / "data_txt" / txt_name).exists():
+                points = read_txt(scene_path / "data_txt" / txt_name)
+            elif fmt == 'pcd' and (scene_path / "data_pcd" / (stem + ".pcd")).exists():
+                points = pcd_to_frame(read_pcd(scene_path / "data_pcd" / (stem + ".pcd")), self.omega)
+            if points is not None:
+                frame = {'xyz': np.column_stack((points['x'], points['y'], points['z'])),
+                         'intensity': np.array(points['intensity']), 'laser_id': np.array(points['laser_id']),
+                         'timestamp': np.array(points['timestamp'])}
+                # cached frames are shared by all lookups
+                for values in frame.values():
+                    values.flags.writeable = False
+                return frame
+        raise FileNotFoundError('no {} file of frame {} in {}'.format('/'.join(self.formats), stem, scene_path))
+
+    def sequence_reader(self, scene_name):
+        """
+        :return: FrameSequenceReader of the sequence file of a scene, None if it has none
+        """
+        with self.lock:
+            if scene_name not in self.readers:
+                bin_path = self.lidar_path / scene_name / "data_bin"
+                self.readers[scene_name] = FrameSequenceReader(bin_path) if (bin_path / INDEX_FILE).exists() \
+                    else None
+            return self.readers[scene_name]
+
+    def archive_reader(self, scene_name):
+        """
+        :return: ArchiveReader of the archive of a scene, None if it has none
+        """
+        with self.lock:
+            if scene_name not in self.archives:
+                archive_path = self.lidar_path / scene_name / "data_archive"
+                self.archives[scene_name] = ArchiveReader(archive_path) if (archive_path / ARCHIVE_FILE).exists() \
+                    else None
+            return self.archives[scene_name]
+
+    def schedule(self, indices):
+        """
+        Load frames into the cache in the prefetch thread
+        """
+        if self.prefetch_thread is None:
+            self.prefetch_queue = queue.Queue()
+            self.prefetch_thread = threading.Thread(target=self.prefetch_frames, daemon=True)
+            self.prefetch_thread.start()
+        for i in indices:
+            with self.lock:
+                if i in self.cache or i in self.pending:
+                    continue
+                self.pending.add(i)
+            self.prefetch_queue.put(i)
+
+    def prefetch_frames(self):
+        while True:
+            i = self.prefetch_queue.get()
+            try:
+                self.get_frame(i)
+            except Exception as ex:
+                print(str(ex))
+            with self.lock:
+                self.pending.discard(i)
@@ -0,0 +1,87 @@
+import numpy as np
+
+
+# fields of each point of a frame, in the column order of the TXT files
+FRAME_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('laser_id', 'u1'),
+    ('x', '<f8'),
+    ('y', '<f8'),
+    ('z', '<f8'),
+    ('intensity', 'u1'),
+    ('vertical_angle', 'i1'),
+    ('horizontal_angle', '<f8'),
+    ('distance', '<f8'),
+])
+
+# fields of each point of a frame in compact mode, geometry is computed in float32 and the vertical angle is
+# not stored but looked up by laser_id when the frame is written
+COMPACT_FRAME_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('laser_id', 'u1'),
+    ('x', '<f4'),
+    ('y', '<f4'),
+    ('z', '<f4'),
+    ('intensity', 'u1'),
+    ('horizontal_angle', '<f4'),
+    ('distance', '<f4'),
+])
+
+# a revolution of the LSC16 at 5 Hz has less than 200 packets of 384 points
+DEFAULT_CAPACITY = 200 * 384
+
+
+class FrameAccumulator:
+    """
+    Preallocated buffer collecting the points of a 360° frame, the buffer grows geometrically
+    when a revolution has more points than expected
+    """
+    def __init__(self, capacity=DEFAULT_CAPACITY, dtype=FRAME_DTYPE):
+        self.buffer = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, **columns):
+        """
+        Append points to the frame
+        :param columns: array of each field of the frame, all of the same length
+        """
+        n = len(next(iter(columns.values())))
+        if self.size + n > len(self.buffer):
+            self.reserve(self.size + n)
+
+        points = self.buffer[self.size:self.size + n]
+        for name, values in columns.items():
+            points[name] = values
+        self.size += n
+
+    def reserve(self, capacity):
+        """
+        Grow the buffer to hold at least capacity points, keeping the stored points
+        """
+        if capacity <= len(self.buffer):
+            return
+        buffer = np.empty(max(capacity, 2 * len(self.buffer)), dtype=self.buffer.dtype)
+        buffer[:self.size] = self.buffer[:self.size]
+        self.buffer = buffer
+
+    def frame(self):
+        """
+        :return: view of the points stored so far, valid until the next call of append or clear
+        """
+        return self.buffer[:self.size]
+
+    def clear(self):
+        self.size = 0
+
+
+def vertical_angles(frame, omega):
+    """
+    :param omega: vertical angle of each laser [degree]
+    :return: vertical angle of each point of a frame, looked up by laser_id for compact frames
+    """
+    if 'vertical_angle' in frame.dtype.names:
+        return frame['vertical_angle']
+    return np.asarray(omega, dtype=np.int8)[frame['laser_id']]
@@ -0,0 +1,126 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from frame_buffer import FRAME_DTYPE
+
+
+# fields of each entry of the frame index of a sequence file, offset and count are given in points
+INDEX_DTYPE = np.dtype([('frame', '<i8'), ('offset', '<i8'), ('count', '<i8'), ('timestamp', '<f8')])
+
+POINTS_FILE = "points.bin"
+INDEX_FILE = "index.bin"
+META_FILE = "meta.json"
+
+
+def write_npy(path, frame):
+    """
+    Write the points of a frame to a .npy file as structured array
+    """
+    np.save(path, frame)
+
+
+def read_txt(path):
+    """
+    Read a TXT file written by write_txt
+    :return: structured array of FRAME_DTYPE
+    """
+    with open(path, 'r') as fp:
+        fp.readline()  # skip header
+        values = np.fromstring(fp.read().replace('\n', ','), sep=',')
+    M = values.reshape(-1, len(FRAME_DTYPE.names))
+    points = np.empty(len(M), dtype=FRAME_DTYPE)
+    for i, name in enumerate(FRAME_DTYPE.names):
+        points[name] = M[:, i]
+    return points
+
+
+class FrameSequenceWriter:
+    """
+    Append-only writer of all frames of a sequence into one memory-mappable file of points
+    and an index of the offset and number of points of each frame
+    """
+    def __init__(self, path, dtype, append=False):
+        """
+        :param append: continue the sequence file of a previous run instead of replacing it, frames appended later
+                       may be out of frame order
+        """
+        self.path = Path(path)
+        os.makedirs(self.path.absolute(), exist_ok=True)
+
+        index = np.zeros(0, dtype=INDEX_DTYPE)
+        if append and (self.path / INDEX_FILE).exists() and (self.path / POINTS_FILE).exists():
+            # only complete index entries and the points they refer to are kept
+            index = np.fromfile(self.path / INDEX_FILE, dtype=INDEX_DTYPE)
+            with open(self.path / INDEX_FILE, 'r+b') as fp:
+                fp.truncate(index.nbytes)
+            with open(self.path / POINTS_FILE, 'r+b') as fp:
+                fp.truncate(int(index['offset'][-1] + index['count'][-1]) * dtype.itemsize if len(index) else 0)
+        else:
+            append = False
+
+        with open(self.path / META_FILE, 'w') as fp:
+            json.dump({'dtype': dtype.descr}, fp)
+        self.points_file = open(self.path / POINTS_FILE, 'ab' if append else 'wb')
+        self.index_file = open(self.path / INDEX_FILE, 'ab' if append else 'wb')
+        self.offset = int(index['offset'][-1] + index['count'][-1]) if len(index) else 0
+        self.frames = set(index['frame'].tolist())
+
+    def write(self, frame_nr, frame, timestamp=None):
+        """
+        Append the points of a frame
+        :param timestamp: timestamp of the frame in the index, by default that of its first point
+        """
+        entry = np.zeros(1, dtype=INDEX_DTYPE)
+        entry['frame'] = frame_nr
+        if timestamp is None:
+            timestamp = frame['timestamp'][0] if len(frame) else np.nan
+        entry['timestamp'] = timestamp
+
+        frame.tofile(self.points_file)
+        entry['offset'] = self.offset
+        entry['count'] = len(frame)
+        self.offset += len(frame)
+
+        # the index entry is written last, so that it never refers to incomplete points
+        self.points_file.flush()
+        entry.tofile(self.index_file)
+        self.index_file.flush()
+        self.frames.add(frame_nr)
+
+    def close(self):
+        self.points_file.close()
+        self.index_file.close()
+
+
+class FrameSequenceReader:
+    """
+    Random access to the frames of a sequence file, frames are returned as views of the memory-mapped points
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / META_FILE, 'r') as fp:
+            self.dtype = np.dtype([tuple(field) for field in json.load(fp)['dtype']])
+        self.index = np.fromfile(self.path / INDEX_FILE, dtype=INDEX_DTYPE)
+
+        n_points = int(self.index['offset'][-1] + self.index['count'][-1]) if len(self.index) else 0
+        if n_points > 0:
+            self.points = np.memmap(self.path / POINTS_FILE, dtype=self.dtype, mode='r', shape=(n_points,))
+        else:
+            self.points = np.zeros(0, dtype=self.dtype)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        entry = self.index[i]
+        return self.points[entry['offset']:entry['offset'] + entry['count']]
+
+    def find(self, frame_nr):
+        """
+        :return: position of the frame with the given number in the sequence, or None
+        """
+        pos = np.flatnonzero(self.index['frame'] == frame_nr)
+        return int(pos[0]) if pos.size > 0 else None
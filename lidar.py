@@ -1,6 +1,21 @@
 import numpy as np
 
 
+# Layout of a LSC16 data packet: 12 blocks of 100 bytes followed by a 4 byte timestamp and 2 factory bytes
+FIRING_DTYPE = np.dtype([('distance', '<u2'), ('intensity', 'u1')])
+BLOCK_DTYPE = np.dtype([('flag', '<u2'), ('azimuth', '<u2'), ('firings', FIRING_DTYPE, (32,))])
+PACKET_DTYPE = np.dtype([('blocks', BLOCK_DTYPE, (12,)), ('timestamp', '<u4'), ('factory', '<u2')])
+PACKET_SIZE = PACKET_DTYPE.itemsize  # 1206 bytes
+
+
+def packet_view(data):
+    """
+    :param data: N LSC16 packets as a contiguous buffer or uint8 array of shape [N x 1206]
+    :return: structured array of PACKET_DTYPE, shape=[N]
+    """
+    return np.ascontiguousarray(data, dtype=np.uint8).reshape(-1, PACKET_SIZE).view(PACKET_DTYPE)[:, 0]
+
+
 class LSC16:
     # factor distance centimeter value to meter
     FACTOR_CM2M = 0.01
@@ -8,7 +23,12 @@ class LSC16:
     # factor distance value to cm, each LSC16 distance unit is 2.5 mm
     FACTOR_MM2CM = 0.25
 
-    def __init__(self):
+    def __init__(self, compact=False):
+        """
+        :param compact: decode_batch computes the geometry in float32 and stores no vertical angle,
+                        see COMPACT_FRAME_DTYPE
+        """
+        self.compact = compact
         self.timing_offsets = self.calc_timing_offsets()
 
         # The following is the channel vertical angle of the uniform 2 degree lidar
@@ -16,6 +36,13 @@ class LSC16:
 
         self.count_lasers = 16
 
+        # trigonometric tables of the vertical angle of each channel
+        alpha = self.omega * np.pi / 180.
+        self.cos_omega = np.cos(alpha)
+        self.sin_omega = np.sin(alpha)
+        self.cos_omega_f4 = self.cos_omega.astype(np.float32)
+        self.sin_omega_f4 = self.sin_omega.astype(np.float32)
+
     def calc_timing_offsets(self):
         single_firing = 3.125  # μs  Firing time interval of each channel of LSC16
         # Time units converted to s
@@ -69,6 +96,101 @@ class LSC16:
 
         return X, Y, Z, intensities, azimuth, timestamps, distances
 
+    def process_data_batch(self, data, timestamps):
+        """
+        Process a batch of data packets at once, the result is identical to calling process_data_frame on each packet
+        :param data: N LSC16 packets as a contiguous buffer or uint8 array of shape [N x 1206]
+        :param timestamps: timestamp of each packet, shape=[N]
+        :return: X,Y,Z-coordinate, intensity, azimuth, timestamp, distance of each firing, shape of each=[N x 384]
+        """
+        blocks = packet_view(data)['blocks']
+        # 0xeeff is upper block
+        assert np.all(blocks['flag'] == 0xeeff)
+
+        azimuth = self.calc_precise_azimuth_batch(blocks['azimuth'] / 100)
+
+        # [N x 12 x 32] firings are stored in the same order as [N x 24 x 16] sequences
+        n_packets = len(blocks)
+        distances = blocks['firings']['distance'].reshape(n_packets, -1, self.count_lasers)
+        intensities = blocks['firings']['intensity'].reshape(n_packets, -1).astype(np.uint32)
+
+        # now calculate the cartesian coordinate of each point
+        distances = distances * self.FACTOR_MM2CM * self.FACTOR_CM2M
+        theta = azimuth.reshape(n_packets, -1, self.count_lasers) * np.pi / 180.
+        X = distances * self.cos_omega * np.cos(theta)
+        Y = distances * self.cos_omega * np.sin(-theta)
+        Z = distances * self.sin_omega
+
+        timestamps = np.asarray(timestamps, dtype=np.float64).reshape(-1, 1) + self.timing_offsets
+
+        return X.reshape(n_packets, -1), Y.reshape(n_packets, -1), Z.reshape(n_packets, -1), intensities, \
+            azimuth, timestamps, distances.reshape(n_packets, -1)
+
+    def decode_batch(self, data, timestamps, point_filter=None):
+        """
+        Decode a batch of data packets into the points kept by a filter, the cartesian coordinates are only
+        computed for these points, the values of each point are identical to those of process_data_batch unless
+        the geometry is computed in float32 (compact)
+        :param data: N LSC16 packets as a contiguous buffer or uint8 array of shape [N x 1206]
+        :param timestamps: timestamp of each packet, shape=[N]
+        :param point_filter: PointFilter of the points kept, by default all returns with a distance
+        :return: dict of the fields of FRAME_DTYPE, or COMPACT_FRAME_DTYPE, of the kept points in firing order,
+                 azimuth of each firing and mask of the kept firings, shape of both=[N x 384]
+        """
+        point_filter = point_filter if point_filter is not None else PointFilter()
+        blocks = packet_view(data)['blocks']
+        # 0xeeff is upper block
+        assert np.all(blocks['flag'] == 0xeeff)
+
+        # the azimuth of all firings is kept for the roll over detection
+        azimuth = self.calc_precise_azimuth_batch(blocks['azimuth'] / 100)
+        n_packets = len(blocks)
+        distances = blocks['firings']['distance'].reshape(n_packets, -1, self.count_lasers)
+        valid = point_filter.mask(distances, azimuth)
+
+        kept = np.flatnonzero(valid)
+        laser_id = kept % self.count_lasers
+        if self.compact:
+            laser_id = laser_id.astype(np.uint8)
+            distance = distances.reshape(-1)[kept].astype(np.float32) * \
+                np.float32(self.FACTOR_MM2CM * self.FACTOR_CM2M)
+            horizontal_angle = azimuth.reshape(-1)[kept].astype(np.float32)
+            theta = horizontal_angle * np.float32(np.pi / 180.)
+            cos_omega, sin_omega = self.cos_omega_f4, self.sin_omega_f4
+        else:
+            distance = distances.reshape(-1)[kept] * self.FACTOR_MM2CM * self.FACTOR_CM2M
+            horizontal_angle = azimuth.reshape(-1)[kept]
+            theta = horizontal_angle * np.pi / 180.
+            cos_omega, sin_omega = self.cos_omega, self.sin_omega
+        X = distance * cos_omega[laser_id] * np.cos(theta)
+        Y = distance * cos_omega[laser_id] * np.sin(-theta)
+        Z = distance * sin_omega[laser_id]
+
+        inside = point_filter.crop(X, Y, Z)
+        if inside is not None:
+            valid.reshape(-1)[kept[~inside]] = False
+            kept, laser_id, distance, horizontal_angle, X, Y, Z = \
+                (values[inside] for values in (kept, laser_id, distance, horizontal_angle, X, Y, Z))
+
+        n_firings = azimuth.shape[1]
+        timestamps = np.asarray(timestamps, dtype=np.float64)[kept // n_firings] + \
+            self.timing_offsets[kept % n_firings]
+        points = dict(timestamp=timestamps, laser_id=laser_id, x=X, y=Y, z=Z,
+                      intensity=blocks['firings']['intensity'].reshape(-1)[kept],
+                      horizontal_angle=horizontal_angle, distance=distance)
+        if not self.compact:
+            points['vertical_angle'] = self.omega[laser_id]
+        return points, azimuth, valid.reshape(n_packets, -1)
+
+    def read_azimuth_batch(self, data):
+        """
+        Read the azimuth of each firing of a batch of packets without decoding the points
+        :param data: N LSC16 packets as a contiguous buffer or uint8 array of shape [N x 1206]
+        :return: azimuth of each firing, shape=[N x 384]
+        """
+        blocks = packet_view(data)['blocks']
+        return self.calc_precise_azimuth_batch(blocks['azimuth'] / 100)
+
     def read_firing_data(self, data):
         block_id = data[0] + data[1] * 256
         # 0xeeff is upper block
@@ -116,6 +238,28 @@ class LSC16:
         precision_azimuths = np.array(precision_azimuths)
         return precision_azimuths
 
+    def calc_precise_azimuth_batch(self, azimuth):
+        """
+        Linear interpolation of azimuth values of a batch of packets, see calc_precise_azimuth
+        :param azimuth: azimuth of each block, shape=[N x 12]
+        :return: azimuth of each firing, shape=[N x 384]
+        """
+        # First, adjust for an azimuth rollover from 359.99° to 0° between adjacent blocks
+        next_azimuth = np.where(azimuth[:, 1:] < azimuth[:, :-1], azimuth[:, 1:] + 360., azimuth[:, 1:])
+
+        # Determine the azimuth gap between data blocks, the last block has no successor so its gap
+        # is taken from the previous block and its own azimuth is the one adjusted for the rollover
+        start = azimuth.copy()
+        start[:, 11] = next_azimuth[:, 10]
+        gap = np.empty_like(azimuth)
+        gap[:, 0:11] = next_azimuth - azimuth[:, 0:11]
+        gap[:, 11] = next_azimuth[:, 10] - azimuth[:, 10]
+
+        factor = gap / 32.
+        precise_azimuth = start[:, :, None] + factor[:, :, None] * np.arange(32)
+        precise_azimuth[precise_azimuth >= 360.] -= 360.
+        return precise_azimuth.reshape(len(azimuth), -1)
+
     def calc_cart_coord(self, distances, azimuth):
         # convert distances to meters
         distances = distances * self.FACTOR_MM2CM * self.FACTOR_CM2M
@@ -126,3 +270,60 @@ class LSC16:
         Y = distances * np.cos(alpha) * np.sin(-theta)
         Z = distances * np.sin(alpha)
         return X, Y, Z
+
+
+class PointFilter:
+    """
+    Selection of the returns of LSC16 packets. Distance, ring and azimuth are checked on the raw data of each
+    firing before its cartesian coordinates are computed, the crop box on the coordinates of the remaining points.
+    Returns with a distance of 0 are invalid and never kept.
+    """
+    def __init__(self, min_range=None, max_range=None, rings=None, azimuth_sector=None, crop_box=None):
+        """
+        :param min_range: minimum distance of the kept returns [m]
+        :param max_range: maximum distance of the kept returns [m]
+        :param rings: laser ids of the kept returns, by default all
+        :param azimuth_sector: [start, end] azimuth of the kept returns [degree], the sector wraps around 0°
+                               if start > end
+        :param crop_box: [x_min, y_min, z_min, x_max, y_max, z_max] of the kept points [m]
+        """
+        scale = LSC16.FACTOR_MM2CM * LSC16.FACTOR_CM2M
+        # limits in raw distance units of 2.5 mm
+        self.min_distance = max(int(np.ceil(round(min_range / scale, 6))), 1) if min_range else 1
+        self.max_distance = int(np.floor(round(max_range / scale, 6))) if max_range else None
+        self.rings = None
+        if rings:
+            self.rings = np.zeros(16, dtype=bool)
+            self.rings[list(rings)] = True
+        self.azimuth_sector = tuple(azimuth_sector) if azimuth_sector else None
+        self.crop_box = np.asarray(crop_box, dtype=np.float64) if crop_box else None
+
+    def mask(self, distances, azimuth):
+        """
+        :param distances: raw distance of each firing, shape=[N x 24 x 16]
+        :param azimuth: azimuth of each firing, shape=[N x 384]
+        :return: mask of the kept firings, shape=[N x 24 x 16]
+        """
+        valid = distances >= self.min_distance
+        if self.max_distance is not None:
+            valid &= distances <= self.max_distance
+        if self.rings is not None:
+            valid &= self.rings
+        if self.azimuth_sector is not None:
+            start, end = self.azimuth_sector
+            azimuth = azimuth.reshape(distances.shape)
+            if start <= end:
+                valid &= (azimuth >= start) & (azimuth <= end)
+            else:
+                valid &= (azimuth >= start) | (azimuth <= end)
+        return valid
+
+    def crop(self, X, Y, Z):
+        """
+        :return: mask of the points inside the crop box, None if there is none
+        """
+        if self.crop_box is None:
+            return None
+        lower, upper = self.crop_box[:3], self.crop_box[3:]
+        return (X >= lower[0]) & (X <= upper[0]) & (Y >= lower[1]) & (Y <= upper[1]) & \
+            (Z >= lower[2]) & (Z <= upper[2])
@@ -1,15 +1,35 @@
 import os
 from pathlib import Path
-import dpkt
 import datetime
+import queue
+import threading
+import time
 import numpy as np
 from tqdm import tqdm
 
 import lidar
+import pcap_reader
+from archive import ArchiveWriter, check_codec
+from frame_buffer import COMPACT_FRAME_DTYPE, FRAME_DTYPE, FrameAccumulator, vertical_angles
+from frame_store import FrameSequenceWriter, write_npy
+from manifest import Manifest
+from pcd import check_data_format, write_pcd
+from profiler import Profiler
+from range_image import RangeImage, check_range_image_format, write_range_image
+from seek_index import entry_before_frame, entry_before_packet, entry_before_time, load_seek_index, \
+    save_seek_index, SEEK_INDEX_DTYPE
+from voxel import Voxelizer, check_voxel_format, write_voxels
+
+
+# wanted frames which are at most this many frames apart are read in one go instead of seeking
+SEEK_GAP_FRAMES = 10
 
 
 class LSLidarManager:
-    def __init__(self, pcap_path, out_root, params):
+    def __init__(self, pcap_path, out_root, params, profiler=None):
+        """
+        :param profiler: Profiler recording the time of each stage, by default a disabled one
+        """
         self.pcap_path = Path(pcap_path)
         self.params = params
         self.out_root = out_root
@@ -17,77 +37,401 @@ class LSLidarManager:
         self.txt_path = None
         self.pcd_path = None
         self.out_path = None
-        self.lidar_reader = None
-        self.pos_X = None
-        self.pos_Y = None
-        self.pos_Z = None
-        self.intensities = None
-        self.theta = None
-        self.timestamps = None
-        self.distances = None
-        self.indices = None
-        self.alpha = None
+        self.npy_path = None
+        self.voxel_path = None
+        self.voxelizer = None
+        self.range_path = None
+        self.range_image = None
+        self.bin_writer = None
+        self.archive_writer = None
+        self.frame_queue = None
+        self.manifest = None
+        # compact frames hold float32 geometry and no vertical angle
+        self.frame = FrameAccumulator(dtype=COMPACT_FRAME_DTYPE if self.params.get('compact', False) else FRAME_DTYPE)
         self.cur_azimuth = None
         self.last_azimuth = None
         self.datetime = None
-        self.frame_nr = 0
-
-        self.lidar = lidar.LSC16()
-
-    def run(self):
+        self.frame_nr = self.params.get('first-frame', 0)
+        # drop the frame finished first, it started before the first packet read
+        self.drop_partial = self.params.get('drop-partial', False)
+        # stop reading when this frame number is reached
+        self.stop_frame = None
+        # (ordinal, record offset) of the first packet of the following shard, the packets from it on are only
+        # read to finish the last frame of this shard and counted by the following one
+        self.shard_end = self.params.get('shard-end')
+        # frames which are not written again
+        self.done_frames = set()
+        # only frames overlapping [start-time, end-time] and with a number in frames are extracted, by default all
+        self.start_time = self.params.get('start-time')
+        self.end_time = self.params.get('end-time')
+        self.frames = set(self.params['frames']) if self.params.get('frames') is not None else None
+        # (ordinal, record offset) of the packet the current frame starts in and of the last packet processed
+        self.frame_start = None
+        # timestamp of the first firing of the current frame, whether it is kept or not
+        self.frame_time = None
+        self.last_packet = None
+        self.packet_count = 0
+        self.frame_count = 0
+
+        self.lidar = lidar.LSC16(self.params.get('compact', False))
+        # returns kept when decoding, the same points are written to all formats
+        self.point_filter = lidar.PointFilter(self.params.get('min-range'), self.params.get('max-range'),
+                                              self.params.get('rings'), self.params.get('azimuth-sector'),
+                                              self.params.get('crop-box'))
+        self.profiler = profiler if profiler is not None else Profiler()
+
+    def run(self, seek=None, progress=None):
         """
         Extracts point clouds from pcap file
+        :param seek: (ordinal, byte offset) of a record at or before packet 'from' to start reading from
+        :param progress: callable receiving the number of bytes read, by default a progress bar is shown
+        :return: dict of the number of packets, frames and bytes read and the duration in seconds
         """
-        pcap_len = self.get_pcap_length()
-        if pcap_len <= 0:
-            return
+        start_time = time.time()
 
         # open pcap file
         try:
-            f_pcap = open(self.pcap_path, 'rb')
-            self.lidar_reader = dpkt.pcap.Reader(f_pcap)
+            reader = pcap_reader.PcapReader(self.pcap_path, self.params['data-port'])
         except Exception as ex:
             print(str(ex))
             return
 
+        try:
+            if self.params['pcd']:
+                check_data_format(self.params.get('pcd-format', 'ascii'))
+            if self.params.get('voxel', False):
+                check_voxel_format(self.params.get('voxel-format', 'sparse'))
+            if self.params.get('archive', False):
+                check_codec(self.params.get('archive-codec', 'auto'))
+            if self.params.get('range-image', False):
+                check_range_image_format(self.params.get('range-image-format', 'npy'))
+                if self.params.get('range-image-format', 'npy') == 'pcd':
+                    check_data_format(self.params.get('pcd-format', 'ascii'))
+        except Exception as ex:
+            print(str(ex))
+            reader.close()
+            return
+
         # create output folder hierarchy
         self.create_folders()
 
-        # iterate through each data packet and timestamps
-        pbar = tqdm(total=pcap_len)
-        for idx, (ts, buf) in enumerate(self.lidar_reader):
-            if idx < self.params['from']:
+        # packet ranges which still have to be extracted
+        if self.windowed():
+            segments = self.plan_window()
+        else:
+            segments = self.plan_segments(seek if seek is not None else self.seek_from())
+        if not segments:
+            print("{} is up to date".format(self.out_path))
+            self.close(reader)
+            return {'packets': 0, 'frames': 0, 'bytes': 0, 'seconds': time.time() - start_time}
+
+        # iterate through each data packet and timestamps, progress is measured in bytes of the pcap file
+        pbar = None
+        if progress is None:
+            pbar = tqdm(total=reader.size, unit='B', unit_scale=True)
+            progress = pbar.update
+        writer_threads = self.params.get('writer-threads', 0)
+        queue_size = self.params.get('queue-size', 8)
+        writers = self.start_writers()
+
+        n_bytes = 0
+        for start_packet, segment_seek, first_frame, drop_partial, stop_frame in segments:
+            self.reset(first_frame, drop_partial, stop_frame)
+            stopped = False
+            batches = reader.batches(start_packet, self.params['to'], segment_seek)
+            if writer_threads > 0:
+                batches = self.read_ahead(batches, queue_size)
+
+            start = position = segment_seek[1] if segment_seek is not None else 0
+            for batch in self.profiler.iterate('read', batches):
+                self.profiler.check_packets(batch.indices[0], batch.indices[-1])
+                # Handle Data-Frames (Point clouds)
+                stopped = self.process_data_batch(batch.payloads, batch.timestamps, batch.indices, batch.offsets)
+                if self.shard_end is None:
+                    self.packet_count += len(batch.indices)
+                    end = batch.position
+                else:
+                    self.packet_count += int(np.count_nonzero(batch.indices < self.shard_end[0]))
+                    end = min(batch.position, self.shard_end[1])
+
+                progress(max(end - position, 0))
+                position = max(end, position)
+                if stopped:
+                    break
+            batches.close()
+            n_bytes += position - start
+
+        self.profiler.count('packets', self.packet_count)
+        self.profiler.count('bytes_read', n_bytes)
+        self.profiler.count('frames', self.frame_count)
+        self.stop_writers(writers)
+        # a window does not complete the packet range, a shard completes it when its stop frame is reached
+        stop_frame = self.params.get('stop-frame')
+        if self.manifest is not None and not self.windowed() and \
+                (not stopped or (stop_frame is not None and self.frame_nr >= stop_frame)):
+            self.manifest.complete(self.params['from'], self.params['to'], self.params.get('first-frame', 0),
+                                   self.frame_nr - 1, stop_frame)
+        if pbar is not None:
+            pbar.close()
+        self.close(reader)
+
+        stats = {'packets': self.packet_count, 'frames': self.frame_count, 'bytes': n_bytes,
+                 'seconds': time.time() - start_time}
+        if self.profiler.enabled:
+            stats['profile'] = self.profiler.report()
+        return stats
+
+    def close(self, reader):
+        reader.close()
+        self.profiler.close()
+        self.close_outputs()
+
+    def close_outputs(self):
+        """
+        Close the sequence file, the archive and the manifest, each output written into one file for all frames
+        has to be closed here
+        """
+        for output in (self.bin_writer, self.archive_writer, self.manifest):
+            if output is not None:
+                output.close()
+        self.bin_writer = None
+        self.archive_writer = None
+        self.manifest = None
+
+    def plan_segments(self, seek):
+        """
+        Plan the packet ranges to read, without a manifest of a previous run the whole range is read,
+        otherwise only the ranges of frames which are missing, i.e. not recorded or with missing files
+        :param seek: (ordinal, byte offset) of a record at or before packet 'from'
+        :return: list of (first packet, seek, first frame number, drop partial frame, stop frame number)
+        """
+        first_frame = self.params.get('first-frame', 0)
+        stop_frame = self.params.get('stop-frame')
+        whole = (self.params['from'], seek, first_frame, self.drop_partial, stop_frame)
+        if self.manifest is None or not self.manifest.resumed:
+            return [whole]
+
+        done = self.manifest.done_frames(self.in_sequences())
+        self.done_frames = set(done)
+        last_frame = self.manifest.last_frame(self.params['from'], self.params['to'], first_frame, stop_frame)
+        if last_frame is None:
+            # the range was not completed, frames after the last one done may be missing
+            end = max([frame_nr + 1 for frame_nr in done if frame_nr >= first_frame], default=first_frame)
+        else:
+            end = last_frame + 1
+
+        def resume(frame_nr, stop_frame):
+            # the next frame can be extracted by seeking to the packet recorded with the frame before it
+            previous = done.get(frame_nr - 1)
+            if frame_nr == first_frame or previous is None or previous['next_seek'] is None:
+                return whole[:4] + (stop_frame,)
+            ordinal, offset = previous['next_seek']
+            return ordinal, (ordinal, offset), frame_nr, True, stop_frame
+
+        segments = []
+        frame_nr = first_frame
+        while frame_nr < end:
+            if frame_nr in done:
+                frame_nr += 1
                 continue
-            if 0 < self.params['to'] < idx:
-                break
-
-            eth = dpkt.ethernet.Ethernet(buf)
+            missing = frame_nr
+            while frame_nr < end and frame_nr not in done:
+                frame_nr += 1
+            segments.append(resume(missing, frame_nr))
+        if last_frame is None:
+            segments.append(resume(end, stop_frame))
+        return segments
+
+    def in_sequences(self):
+        """
+        :return: callable checking whether a frame is stored in the sequence file and the archive, None if neither
+                 is written
+        """
+        writers = [writer for writer in (self.bin_writer, self.archive_writer) if writer is not None]
+        if not writers:
+            return None
+        return lambda frame_nr: all(frame_nr in writer.frames for writer in writers)
 
-            data = eth.data.data.data
+    def windowed(self):
+        return self.start_time is not None or self.end_time is not None or self.frames is not None
 
-            # Handle Data-Frame (Point clouds)
-            if eth.data.data.sport == self.params['data-port']:
-                self.process_data_frame(data, ts, idx)
+    def seek_from(self):
+        """
+        :return: (ordinal, byte offset) of the seek index entry at or before packet 'from', None if there is no index
+        """
+        if self.params['from'] <= 0:
+            return None
+        entries = load_seek_index(self.pcap_path, self.params['data-port'])
+        entry = entry_before_packet(entries, self.params['from']) if entries is not None else None
+        return (int(entry['ordinal']), int(entry['offset'])) if entry is not None else None
 
-            pbar.update(1)
+    def plan_window(self):
+        """
+        Plan the packet ranges to read for the frames of the window, reading starts at the entry of the seek index
+        before the frame. Frames have the numbers of extracting the whole file, 'from' is not used.
+        :return: list of (first packet, seek, first frame number, drop partial frame, stop frame number)
+        """
+        entries = self.seek_index()
+        if self.manifest is not None and self.manifest.resumed:
+            self.done_frames = set(self.manifest.done_frames(self.in_sequences()))
+
+        # frame number of the frame finished by the first roll over
+        base = self.params.get('first-frame', 0) - (1 if self.params.get('drop-partial', False) else 0)
+        whole = (0, None, self.params.get('first-frame', 0), self.params.get('drop-partial', False))
+
+        def segment(entry, stop_frame):
+            if entry is None:
+                return whole + (stop_frame,)
+            ordinal = int(entry['ordinal'])
+            return ordinal, (ordinal, int(entry['offset'])), base + int(entry['frames']) + 1, True, stop_frame
+
+        if self.frames is None:
+            entry = entry_before_time(entries, self.start_time) if self.start_time is not None else None
+            return [segment(entry, None)]
+
+        # consecutive wanted frames, or frames close to each other, are read in one go
+        segments = []
+        wanted = sorted(frame_nr for frame_nr in self.frames if frame_nr >= base and frame_nr not in self.done_frames)
+        first = 0
+        for k in range(1, len(wanted) + 1):
+            if k == len(wanted) or wanted[k] - wanted[k - 1] > SEEK_GAP_FRAMES:
+                segments.append(segment(entry_before_frame(entries, wanted[first] - base), wanted[k - 1] + 1))
+                first = k
+        return segments
+
+    def seek_index(self):
+        """
+        :return: entries of the seek index of the pcap file, it is built and stored next to the file if it has none
+        """
+        entries = load_seek_index(self.pcap_path, self.params['data-port'])
+        if entries is None:
+            with self.profiler.stage('seek_index'):
+                entries = self.scan_seek_index(self.params.get('seek-interval', 256))
+            save_seek_index(self.pcap_path, self.params['data-port'], entries)
+        return entries
+
+    def scan_seek_index(self, interval):
+        """
+        Scan the whole pcap file for an entry every 'interval' data packets, only the azimuths are decoded. Packets
+        which finish a frame get no entry, the following packet is taken instead, so that reading from an entry
+        detects the next roll over like reading the whole file.
+        :return: SEEK_INDEX_DTYPE array
+        """
+        entries = []
+        frames = 0
+        pending = False
+        count = 0
+        self.cur_azimuth = None
+        with pcap_reader.PcapReader(self.pcap_path, self.params['data-port']) as reader:
+            for batch in reader.batches():
+                theta = self.lidar.read_azimuth_batch(batch.payloads)
+                roll_overs = set(i for i, _ in self.find_roll_overs(theta))
+                for i in range(len(batch.indices)):
+                    if count % interval == 0:
+                        pending = True
+                    count += 1
+                    if i in roll_overs:
+                        frames += 1
+                    elif pending:
+                        entries.append((batch.indices[i], batch.offsets[i], batch.timestamps[i], frames))
+                        pending = False
+        self.cur_azimuth = None
+        return np.array(entries, dtype=SEEK_INDEX_DTYPE)
 
-    def get_pcap_length(self):
-        # open pcap file
+    def reset(self, first_frame, drop_partial, stop_frame):
+        """
+        Reset the frame assembly to start reading at another packet
+        """
+        self.cur_azimuth = None
+        self.last_azimuth = None
+        self.frame.clear()
+        self.frame_nr = first_frame
+        self.drop_partial = drop_partial
+        self.stop_frame = stop_frame
+        self.frame_start = None
+        self.frame_time = None
+        self.last_packet = None
+        if self.voxelizer is not None:
+            self.voxelizer.reset()
+
+    def read_ahead(self, batches, queue_size):
+        """
+        Read packet batches in a background thread
+        :param batches: generator of PacketBatch
+        :param queue_size: maximum number of batches read ahead
+        :return: generator of PacketBatch
+        """
+        batch_queue = queue.Queue(maxsize=queue_size)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    batch_queue.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def read():
+            try:
+                for batch in batches:
+                    if stop.is_set():
+                        break
+                    # copy the payloads out of the memory map, so that the file is read in this thread
+                    put(batch._replace(payloads=np.array(batch.payloads)))
+            except Exception as ex:
+                print(str(ex))
+            put(None)
+
+        thread = threading.Thread(target=read, daemon=True)
+        thread.start()
         try:
-            f_pcap = open(self.pcap_path, 'rb')
-            lidar_reader = dpkt.pcap.Reader(f_pcap)  
-
-        except Exception as ex:
-            print(str(ex))
-            return 0
+            while True:
+                batch = batch_queue.get()
+                if batch is None:
+                    return
+                yield batch
+        finally:
+            # the reading thread is stopped when the consumer stops early
+            stop.set()
+            thread.join()
+
+    def start_writers(self):
+        """
+        Start the writer threads, decoded frames are written by them while the next packets are read and decoded
+        :return: list of the writer threads
+        """
+        writer_threads = self.params.get('writer-threads', 0)
+        writers = []
+        if writer_threads > 0:
+            self.frame_queue = queue.Queue(maxsize=self.params.get('queue-size', 8))
+            writers = [threading.Thread(target=self.write_frames, daemon=True) for _ in range(writer_threads)]
+            for writer in writers:
+                writer.start()
+        return writers
+
+    def stop_writers(self, writers):
+        """
+        Wait until the writer threads have written all queued frames
+        """
+        for writer in writers:
+            self.frame_queue.put(None)
+        for writer in writers:
+            writer.join()
+        self.frame_queue = None
 
-        counter = 0
-        # iterate through each data packet and timestamps
-        for _, _ in enumerate(lidar_reader):
-            counter += 1
-        f_pcap.close()
-        print("message lenth:", counter)
-        return counter
+    def write_frames(self):
+        """
+        Write the frames of the frame queue until None is received
+        """
+        while True:
+            item = self.frame_queue.get()
+            if item is None:
+                return
+            try:
+                self.write_frame(*item)
+            except Exception as ex:
+                print(str(ex))
 
     def create_folders(self):
         self.out_path = Path("{}/{}".format(self.out_root, self.pcap_path.stem))
@@ -105,89 +449,234 @@ class LSLidarManager:
             self.pcd_path = Path("{}/{}".format(self.out_path, "data_pcd"))
             os.makedirs(self.pcd_path.absolute(), exist_ok=True)
 
+        # create npy-file dir
+        if self.params.get('npy', False):
+            self.npy_path = Path("{}/{}".format(self.out_path, "data_npy"))
+            os.makedirs(self.npy_path.absolute(), exist_ok=True)
+
+        # create voxel-file dir
+        if self.params.get('voxel', False):
+            self.voxel_path = Path("{}/{}".format(self.out_path, "data_voxel"))
+            os.makedirs(self.voxel_path.absolute(), exist_ok=True)
+            self.voxelizer = Voxelizer(self.params['voxel-bounds'], self.params['voxel-size'],
+                                       self.params.get('voxel-frames', 1))
+
+        # create range-image dir
+        if self.params.get('range-image', False):
+            self.range_path = Path("{}/{}".format(self.out_path, "data_range"))
+            os.makedirs(self.range_path.absolute(), exist_ok=True)
+            self.range_image = RangeImage(self.lidar.omega, self.params.get('range-image-resolution', 0.36))
+
+        # record of the extracted frames, to resume an interrupted extraction
+        if self.params.get('resume', False):
+            self.manifest = Manifest(self.out_path, self.pcap_path, self.params)
+
+        # create sequence file
+        if self.params.get('bin', False):
+            self.bin_writer = FrameSequenceWriter("{}/{}".format(self.out_path, "data_bin"), self.frame.buffer.dtype,
+                                                  append=self.manifest is not None and self.manifest.resumed)
+
+        # create archive
+        if self.params.get('archive', False):
+            self.archive_writer = ArchiveWriter("{}/{}".format(self.out_path, "data_archive"), self.frame.buffer.dtype,
+                                                self.params.get('archive-codec', 'auto'),
+                                                self.params.get('archive-level', 3),
+                                                self.params.get('archive-chunk-frames', 1),
+                                                append=self.manifest is not None and self.manifest.resumed)
+
     def process_data_frame(self, data, timestamp, index):
-        cur_X, cur_Y, cur_Z, cur_intensities, cur_theta, cur_timestamps, cur_distances = \
-            self.lidar.process_data_frame(data, timestamp)
-        n_seq = int(len(cur_X) / self.lidar.count_lasers)
-        cur_indices = np.tile(np.arange(self.lidar.count_lasers), n_seq)
-        cur_alpha = np.tile(self.lidar.omega, n_seq)
-
-        # initialise states
-        if index == 0:
-            self.pos_X = cur_X
-            self.pos_Y = cur_Y
-            self.pos_Z = cur_Z
-            self.intensities = cur_intensities
-            self.theta = cur_theta
-            self.timestamps = cur_timestamps
-            self.distances = cur_distances
-            self.indices = cur_indices
-            self.alpha = cur_alpha
-
-        if self.cur_azimuth is None:    
-            self.cur_azimuth = cur_theta
-            self.last_azimuth = cur_theta
-
-        # update current azimuth before checking for roll over
-        self.cur_azimuth = cur_theta
-
-        idx_rollover = self.is_roll_over()
-
-        # handle rollover (full 360° frame store in a file)
-        if idx_rollover is not None:
-            if idx_rollover > 0:
-                self.pos_X = np.hstack((self.pos_X, cur_X[0:idx_rollover]))
-                self.pos_Y = np.hstack((self.pos_Y, cur_Y[0:idx_rollover]))
-                self.pos_Z = np.hstack((self.pos_Z, cur_Z[0:idx_rollover]))
-                self.intensities = np.hstack((self.intensities, cur_intensities[0:idx_rollover]))
-                self.theta = np.hstack((self.theta, cur_theta[0:idx_rollover]))
-                self.timestamps = np.hstack((self.timestamps, cur_timestamps[0:idx_rollover]))
-                self.distances = np.hstack((self.distances, cur_distances[0:idx_rollover]))
-                self.indices = np.hstack((self.indices, cur_indices[0:idx_rollover]))
-                self.alpha = np.hstack((self.alpha, cur_alpha[0:idx_rollover]))
-
-            ts0 = self.timestamps[0]
-            curr_time = str(datetime.datetime.utcfromtimestamp(ts0) + datetime.timedelta(hours=8))
-            curr_time = curr_time.replace(":", "-")
-            curr_time = curr_time.replace(" ", "_")
-
-            if self.params['txt']:
-                fpath = "{}/{}_{}.txt".format(self.txt_path, self.frame_nr, curr_time)
-                write_txt(fpath, self.timestamps, self.indices, self.pos_X, self.pos_Y, self.pos_Z,
-                          self.intensities, self.alpha, self.theta, self.distances)
+        self.process_data_batch(np.frombuffer(data, dtype=np.uint8), [timestamp], [index])
 
-            if self.params['pcd']:
-                fpath = "{}/{}_{}.pcd".format(self.pcd_path, self.frame_nr, curr_time)
-                write_pcd(fpath, self.pos_X, self.pos_Y, self.pos_Z, self.intensities)
-
-            self.pos_X = cur_X[idx_rollover:]
-            self.pos_Y = cur_Y[idx_rollover:]
-            self.pos_Z = cur_Z[idx_rollover:]
-            self.intensities = cur_intensities[idx_rollover:]
-            self.theta = cur_theta[idx_rollover:]
-            self.timestamps = cur_timestamps[idx_rollover:]
-            self.distances = cur_distances[idx_rollover:]
-            self.indices = cur_indices[idx_rollover:]
-            self.alpha = cur_alpha[idx_rollover:]
-
-            self.frame_nr += 1
-
-            # reset roll over check
-            self.cur_azimuth = None
-            return
+    def process_data_batch(self, data, timestamps, indices, offsets=None):
+        """
+        Assemble the points of consecutive data packets into 360° frames
+        :param data: [N x 1206] uint8 array of LSC16 packets
+        :param timestamps: timestamp of each packet
+        :param indices: ordinal of each packet in the pcap file
+        :param offsets: byte offset of the record of each packet in the pcap file
+        :return: True if the stop frame is reached
+        """
+        with self.profiler.stage('decode'):
+            points, cur_theta, valid = self.lidar.decode_batch(data, timestamps, self.point_filter)
+        self.profiler.count('dropped_points', valid.size - len(points['distance']))
+        with self.profiler.stage('assemble'):
+            return self.assemble_frames(points, cur_theta, valid, timestamps, indices, offsets)
+
+    def assemble_frames(self, points, cur_theta, valid, timestamps, indices, offsets):
+        """
+        Append the decoded points of a batch of packets to the frame, and emit the frames finished by the batch
+        :param points: dict of the fields of the kept points, see LSC16.decode_batch
+        :param cur_theta: azimuth of each firing, shape=[N x 384]
+        :param valid: mask of the kept firings, shape=[N x 384]
+        :param timestamps: timestamp of each packet
+        :return: True if the stop frame is reached
+        """
+        n_packets, n_points = cur_theta.shape
+        packets = [(int(idx), int(offsets[i]) if offsets is not None else None) for i, idx in enumerate(indices)]
+        if self.frame_start is None:
+            self.frame_start = packets[0]
+            self.frame_time = float(timestamps[0]) + self.lidar.timing_offsets[0]
+
+        roll_overs = self.find_roll_overs(cur_theta)
+        # number of kept points before each firing, roll overs are found on all firings
+        kept = np.cumsum(valid.reshape(-1)) if roll_overs else None
+
+        # first point of the batch which is not stored in the frame yet
+        begin = 0
+        for i, idx_rollover in roll_overs:
+            # handle rollover (full 360° frame store in a file)
+            firing = i * n_points + idx_rollover
+            end = int(kept[firing - 1]) if firing > 0 else 0
+            self.frame.append(**{name: values[begin:end] for name, values in points.items()})
+            next_seek = packets[i - 1] if i > 0 else self.last_packet
+            next_time = float(timestamps[i]) + self.lidar.timing_offsets[idx_rollover]
+            if self.drop_partial:
+                self.drop_partial = False
+            else:
+                if self.frame_nr not in self.done_frames and self.in_window(self.frame_nr, self.frame_time, next_time):
+                    info = {'first_packet': self.frame_start[0], 'last_packet': packets[i][0],
+                            'offset': self.frame_start[1], 'next_seek': next_seek, 'start_time': self.frame_time}
+                    self.emit_frame(self.frame.frame(), self.frame_nr, info)
+                    self.frame_count += 1
+                self.frame_nr += 1
+            self.frame.clear()
+            self.frame_start = packets[i]
+            self.frame_time = next_time
+            begin = end
+            if self.stop_frame is not None and self.frame_nr >= self.stop_frame:
+                return True
+            if self.end_time is not None and self.frame_time > self.end_time:
+                return True
+
+        self.frame.append(**{name: values[begin:] for name, values in points.items()})
+        self.last_packet = packets[-1]
+        return False
+
+    def in_window(self, frame_nr, start, end):
+        """
+        :param start: timestamp of the first firing of the frame
+        :param end: timestamp of the first firing of the next frame
+        :return: True if the frame is extracted
+        """
+        if self.frames is not None and frame_nr not in self.frames:
+            return False
+        if self.start_time is not None and end <= self.start_time:
+            return False
+        return self.end_time is None or start <= self.end_time
+
+    def find_roll_overs(self, theta):
+        """
+        Check consecutive packets for roll over
+        :param theta: azimuth of each firing of each packet, shape=[N x 384]
+        :return: list of (packet, index of the first point after roll-over)
+        """
+        roll_overs = []
+        for i in range(len(theta)):
+            if self.cur_azimuth is None:
+                self.last_azimuth = theta[i]
 
-        if index > 0:
-            self.pos_X = np.hstack((self.pos_X, cur_X))
-            self.pos_Y = np.hstack((self.pos_Y, cur_Y))
-            self.pos_Z = np.hstack((self.pos_Z, cur_Z))
-            self.intensities = np.hstack((self.intensities, cur_intensities))
-            self.theta = np.hstack((self.theta, cur_theta))
-            self.timestamps = np.hstack((self.timestamps, cur_timestamps))
-            self.distances = np.hstack((self.distances, cur_distances))
-            self.indices = np.hstack((self.indices, cur_indices))
-            self.alpha = np.hstack((self.alpha, cur_alpha))
+            # update current azimuth before checking for roll over
+            self.cur_azimuth = theta[i]
 
-        self.last_azimuth = cur_theta
+            idx_rollover = self.is_roll_over()
+
+            if idx_rollover is None:
+                self.last_azimuth = theta[i]
+            else:
+                roll_overs.append((i, idx_rollover))
+                # reset roll over check
+                self.cur_azimuth = None
+        return roll_overs
+
+    def emit_frame(self, frame, frame_nr, info=None):
+        """
+        Hand a finished frame over to the writers
+        :param info: packets of the frame, recorded in the manifest once the frame is written
+        """
+        # the sequence file and the archive are appended in frame order by the decoding thread, frames which are
+        # already stored by a previous run are not appended again
+        if self.profiler.enabled:
+            self.profiler.count('points', len(frame))
+            self.profiler.observe('points_per_frame', len(frame))
+
+        if self.bin_writer is not None and frame_nr not in self.bin_writer.frames:
+            with self.profiler.stage('write_bin'):
+                self.bin_writer.write(frame_nr, frame, info.get('start_time') if info is not None else None)
+        if self.archive_writer is not None and frame_nr not in self.archive_writer.frames:
+            with self.profiler.stage('write_archive'):
+                self.archive_writer.write(frame_nr, frame, info.get('start_time') if info is not None else None)
+
+        # representations derived from the frame, frames are voxelized in frame order, so that consecutive
+        # frames can be aggregated
+        products = {}
+        if self.voxelizer is not None:
+            with self.profiler.stage('voxelize'):
+                products['voxels'] = self.voxelizer.add(frame)
+        if self.range_image is not None:
+            with self.profiler.stage('range_image'):
+                products['range_image'] = self.range_image.fill(frame)
+
+        if self.frame_queue is None:
+            self.write_frame(frame, frame_nr, info, products)
+        else:
+            # the frame buffer and the range image are reused for the next frame, so the writers get a copy
+            if 'range_image' in products:
+                products['range_image'] = products['range_image'].copy()
+            with self.profiler.stage('queue_wait'):
+                self.frame_queue.put((frame.copy(), frame_nr, info, products))
+
+    def write_frame(self, frame, frame_nr, info=None, products=None):
+        """
+        Write the files of a frame
+        :param products: dict of the voxel grid and range image of the frame, if they are written
+        """
+        products = products or {}
+        # files are named after the first firing of the frame, so that filtering does not rename them
+        ts0 = info['start_time'] if info is not None and 'start_time' in info else frame['timestamp'][0]
+        curr_time = frame_time(ts0)
+        files = []
+
+        if self.params['txt']:
+            fpath = "{}/{}_{}.txt".format(self.txt_path, frame_nr, curr_time)
+            with self.profiler.stage('write_txt'):
+                write_txt(fpath, frame['timestamp'], frame['laser_id'], frame['x'], frame['y'], frame['z'],
+                          frame['intensity'], vertical_angles(frame, self.lidar.omega), frame['horizontal_angle'],
+                          frame['distance'])
+            files.append(fpath)
+
+        if self.params['pcd']:
+            fpath = "{}/{}_{}.pcd".format(self.pcd_path, frame_nr, curr_time)
+            with self.profiler.stage('write_pcd'):
+                write_pcd(fpath, frame['x'], frame['y'], frame['z'], frame['intensity'],
+                          self.params.get('pcd-format', 'ascii'))
+            files.append(fpath)
+
+        if self.params.get('npy', False):
+            fpath = "{}/{}_{}.npy".format(self.npy_path, frame_nr, curr_time)
+            with self.profiler.stage('write_npy'):
+                write_npy(fpath, frame)
+            files.append(fpath)
+
+        if 'voxels' in products:
+            fpath = "{}/{}_{}.npz".format(self.voxel_path, frame_nr, curr_time)
+            with self.profiler.stage('write_voxel'):
+                write_voxels(fpath, products['voxels'], self.params.get('voxel-format', 'sparse'))
+            files.append(fpath)
+
+        if 'range_image' in products:
+            fmt = self.params.get('range-image-format', 'npy')
+            fpath = "{}/{}_{}.{}".format(self.range_path, frame_nr, curr_time, fmt)
+            with self.profiler.stage('write_range_image'):
+                write_range_image(fpath, self.range_image, products['range_image'], fmt,
+                                  self.params.get('pcd-format', 'ascii'))
+            files.append(fpath)
+
+        if self.profiler.enabled:
+            self.profiler.count('bytes_written', sum(os.path.getsize(fpath) for fpath in files))
+        if self.manifest is not None and info is not None:
+            with self.profiler.stage('manifest'):
+                self.manifest.add_frame(frame_nr, files=[os.path.relpath(fpath, self.out_path) for fpath in files],
+                                        **info)
 
     def is_roll_over(self):
         """
@@ -211,6 +700,16 @@ class LSLidarManager:
             return None
 
 
+def frame_time(timestamp):
+    """
+    :return: time of a frame in its file names, UTC+8
+    """
+    curr_time = str(datetime.datetime.utcfromtimestamp(timestamp) + datetime.timedelta(hours=8))
+    curr_time = curr_time.replace(":", "-")
+    curr_time = curr_time.replace(" ", "_")
+    return curr_time
+
+
 def write_txt(path, timestamps, laser_id, X, Y, Z, intensities=None, alpha=None, theta=None, distances=None):
     header = "timestamp,laser_id,X,Y,Z,intensity,vertical_angle,horizontal_angle,distance\n"
     try:
@@ -232,33 +731,5 @@ def write_txt(path, timestamps, laser_id, X, Y, Z, intensities=None, alpha=None,
         M = np.vstack((M, distances))
 
     M =  M.T
-    M = M[np.where(M[:,-1]!=0)]  # remove invalid values
     np.savetxt(fp, M, fmt=('%.6f', '%d', '%.6f', '%.6f', '%.6f', '%d', '%d', '%.3f', '%.4f'), delimiter=',')
     fp.close()
-
-
-def write_pcd(path, X, Y, Z, I):
-    X = X.reshape(1, -1)
-    Y = Y.reshape(1, -1)
-    Z = Z.reshape(1, -1)
-    I = I.reshape(1, -1)
-    points = np.hstack((X.T, Y.T, Z.T, I.T)).reshape(-1, 4)
-    points = points[np.where((points[:,0]!=0) & (points[:,1]!=0) & (points[:,2]!=0))]  # remove invalid values
-
-    handle = open(path, 'a')
-
-    point_num = points.shape[0]
-
-    # pcd header
-    handle.write('# .PCD v0.7 - Point Cloud Data file format\nVERSION 0.7\nFIELDS x y z intensity\nSIZE 4 4 4 4\nTYPE F F F F\nCOUNT 1 1 1 1')
-    string = '\nWIDTH ' + str(point_num)
-    handle.write(string)
-    handle.write('\nHEIGHT 1\nVIEWPOINT 0 0 0 1 0 0 0')
-    string = '\nPOINTS ' + str(point_num)
-    handle.write(string)
-    handle.write('\nDATA ascii')
-
-    for i in range(point_num):
-        string = '\n' + str(points[i, 0]) + ' ' + str(points[i, 1]) + ' ' + str(points[i, 2]) + ' ' + str(points[i, 3])
-        handle.write(string)
-    handle.close()
@@ -0,0 +1,319 @@
+import argparse
+import queue
+import select
+import socket
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from tqdm import tqdm
+
+from lidar import PACKET_SIZE
+from lidar_manager import LSLidarManager
+from main import read_params
+from pcap_reader import PcapReader, PcapWriter
+from pcd import check_data_format
+
+
+class LSLidarLive(LSLidarManager):
+    """
+    Decoder of the live LSC16 stream. Datagrams are received in bursts into a ring buffer by a receiving
+    thread and decoded batch by batch by a decoding thread, which publishes every frame as soon as the
+    packet finishing it is decoded
+    """
+    def __init__(self, params, out_root=None, callback=None, publish_queue=None, record=None, host='0.0.0.0',
+                 ring_size=4096, batch_size=256, latency_budget=0.05):
+        """
+        :param params: params of params.yaml, the stream is received on data-port
+        :param out_root: output dir the frames are also written to as when extracting pcap files, None writes no files,
+                         frames are written by a background thread after they are published
+        :param callback: callable receiving (frame, frame number) of each frame, called in the decoding thread
+        :param publish_queue: queue.Queue receiving (frame, frame number) of each frame, the oldest frame is
+                              dropped when it is full
+        :param record: path of a pcap file the received packets are recorded to
+        :param ring_size: number of packets held by the ring buffer, packets received while it is full are dropped
+        :param batch_size: maximum number of packets received in one burst
+        :param latency_budget: seconds from receiving the last packet of a frame to publishing it, frames
+                               published later are counted as late
+        """
+        name = Path(record).stem if record else "live_{}".format(time.strftime('%Y-%m-%d_%H-%M-%S'))
+        # a live stream cannot be resumed
+        super().__init__(name, out_root, dict(params, resume=False))
+        self.callback = callback
+        self.publish_queue = publish_queue
+        self.record = record
+        self.host = host
+        self.batch_size = batch_size
+        self.latency_budget = latency_budget
+
+        # one spare byte per slot detects datagrams longer than a data packet
+        self.ring = np.zeros((ring_size, PACKET_SIZE + 1), dtype=np.uint8)
+        self.ring_times = np.zeros(ring_size)
+        # number of packets received and decoded, slot of a packet is its number modulo ring_size
+        self.head = 0
+        self.tail = 0
+        self.ready = threading.Condition()
+        self.stopped = threading.Event()
+
+        self.sock = None
+        self.recorder = None
+        self.threads = []
+        self.writers = []
+        # published frames waiting to be written, a frame is not written if queue-size frames are waiting
+        self.write_queue = None
+        self.output_thread = None
+        self.unwritten = 0
+        self.dropped = 0
+        self.invalid = 0
+        self.late_frames = 0
+        self.max_latency = 0.
+
+    def start(self):
+        """
+        Open the socket and start receiving and decoding
+        """
+        if self.out_root is not None:
+            if self.params['pcd']:
+                check_data_format(self.params.get('pcd-format', 'ascii'))
+            self.create_folders()
+            self.writers = self.start_writers()
+            self.write_queue = queue.Queue(maxsize=self.params.get('queue-size', 8))
+            self.output_thread = threading.Thread(target=self.write_outputs, daemon=True)
+            self.output_thread.start()
+        if self.record:
+            self.recorder = PcapWriter(self.record, self.params['data-port'])
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, len(self.ring) * PACKET_SIZE)
+        except OSError as ex:
+            print(str(ex))
+        self.sock.bind((self.host, self.params['data-port']))
+        self.sock.setblocking(False)
+
+        self.stopped.clear()
+        self.threads = [threading.Thread(target=self.receive, daemon=True),
+                        threading.Thread(target=self.decode, daemon=True)]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        """
+        Stop receiving, decode the packets already received and close all files
+        """
+        self.stopped.set()
+        with self.ready:
+            self.ready.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        # the frames queued by the decoding thread are written before the files are closed
+        if self.output_thread is not None:
+            self.write_queue.put(None)
+            self.output_thread.join()
+            self.output_thread = None
+            self.write_queue = None
+        self.stop_writers(self.writers)
+        self.writers = []
+        self.sock.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        self.close_outputs()
+
+    def capture(self, duration=None):
+        """
+        Receive and decode the stream until the duration has passed or the capture is interrupted
+        :param duration: seconds to capture, None captures until KeyboardInterrupt
+        :return: dict of the number of packets, frames, dropped and invalid packets, late frames,
+                 the maximum latency, the number of frames not written and the duration in seconds
+        """
+        start_time = time.time()
+        self.start()
+        try:
+            while duration is None or time.time() - start_time < duration:
+                time.sleep(0.1 if duration is None else max(min(0.1, start_time + duration - time.time()), 0))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+        return {'packets': self.packet_count, 'frames': self.frame_count, 'dropped': self.dropped,
+                'invalid': self.invalid, 'late': self.late_frames, 'max_latency': self.max_latency,
+                'unwritten': self.unwritten, 'seconds': time.time() - start_time}
+
+    def receive(self):
+        """
+        Receive datagrams into the ring buffer, all datagrams waiting in the socket are received
+        in one burst before the decoding thread is notified
+        """
+        n_slots = len(self.ring)
+        overflow = np.zeros(PACKET_SIZE + 1, dtype=np.uint8)
+        while not self.stopped.is_set():
+            readable, _, _ = select.select([self.sock], [], [], 0.1)
+            if not readable:
+                continue
+            received = 0
+            while received < self.batch_size:
+                full = self.head + received - self.tail >= n_slots
+                slot = (self.head + received) % n_slots
+                try:
+                    nbytes = self.sock.recv_into(overflow if full else self.ring[slot])
+                except (BlockingIOError, InterruptedError):
+                    break
+                except OSError as ex:
+                    print(str(ex))
+                    break
+                if nbytes != PACKET_SIZE:
+                    self.invalid += 1
+                elif full:
+                    self.dropped += 1
+                else:
+                    self.ring_times[slot] = time.time()
+                    received += 1
+            if received > 0:
+                with self.ready:
+                    self.head += received
+                    self.ready.notify()
+
+    def decode(self):
+        """
+        Decode the packets of the ring buffer as they arrive, until stopped and all packets are decoded
+        """
+        n_slots = len(self.ring)
+        while True:
+            with self.ready:
+                while self.tail == self.head and not self.stopped.is_set():
+                    self.ready.wait(0.1)
+                head = self.head
+            if self.tail == head:
+                return
+
+            while self.tail < head:
+                # packets up to the end of the ring buffer are decoded in one batch
+                begin = self.tail % n_slots
+                count = min(head - self.tail, n_slots - begin)
+                payloads = self.ring[begin:begin + count, :PACKET_SIZE]
+                timestamps = self.ring_times[begin:begin + count]
+                if self.recorder is not None:
+                    self.recorder.write(timestamps, payloads)
+                try:
+                    self.process_data_batch(payloads, timestamps, np.arange(self.tail, self.tail + count))
+                except Exception as ex:
+                    print(str(ex))
+                self.packet_count += count
+                # the slots are released for the receiving thread after the batch is decoded
+                self.tail += count
+
+    def emit_frame(self, frame, frame_nr, info=None):
+        """
+        Publish a finished frame, then queue it for the writing thread if frames are written to files, the
+        decoding thread never waits for the files
+        """
+        published = frame.copy()
+        if self.callback is not None:
+            self.callback(published, frame_nr)
+        if self.publish_queue is not None:
+            # a slow consumer gets the latest frames
+            while True:
+                try:
+                    self.publish_queue.put_nowait((published, frame_nr))
+                    break
+                except queue.Full:
+                    try:
+                        self.publish_queue.get_nowait()
+                    except queue.Empty:
+                        pass
+
+        if info is not None:
+            latency = time.time() - self.ring_times[info['last_packet'] % len(self.ring_times)]
+            self.max_latency = max(self.max_latency, latency)
+            if latency > self.latency_budget:
+                self.late_frames += 1
+
+        if self.write_queue is not None:
+            try:
+                self.write_queue.put_nowait((published, frame_nr, info))
+            except queue.Full:
+                if self.unwritten == 0:
+                    print("frame {} is not written, the files are written slower than the frames arrive".format(
+                        frame_nr))
+                self.unwritten += 1
+
+    def write_outputs(self):
+        """
+        Write the queued frames to the files of all formats until None is received
+        """
+        while True:
+            item = self.write_queue.get()
+            if item is None:
+                return
+            try:
+                super().emit_frame(*item)
+            except Exception as ex:
+                print(str(ex))
+
+
+def replay(path, port, host='127.0.0.1', speed=1.):
+    """
+    Send the data packets of a pcap file as UDP datagrams at their original timing
+    :param port: data-port of the packets in the pcap file, the datagrams are sent to this port
+    :param speed: factor of the original packet rate
+    :return: number of packets sent
+    """
+    sent = 0
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    start_time = None
+    first_timestamp = None
+    with PcapReader(path, port) as reader:
+        for batch in reader.batches():
+            if start_time is None:
+                start_time = time.time()
+                first_timestamp = batch.timestamps[0]
+            for timestamp, payload in zip(batch.timestamps, batch.payloads):
+                delay = start_time + (timestamp - first_timestamp) / speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                sock.sendto(payload.tobytes(), (host, port))
+                sent += 1
+    sock.close()
+    return sent
+
+
+def main(args):
+    params = read_params(args['config'])
+    if args['replay']:
+        sent = replay(args['replay'], params['data-port'], args['host'] or '127.0.0.1', args['speed'])
+        print("{} packets sent".format(sent))
+        return
+
+    pbar = tqdm(unit='frame')
+    lidar_live = LSLidarLive(params, args['out_dir'], callback=lambda frame, frame_nr: pbar.update(1),
+                             record=args['record'], host=args['host'] or '0.0.0.0', ring_size=args['ring_size'],
+                             latency_budget=args['latency_budget'])
+    stats = lidar_live.capture(args['duration'])
+    pbar.close()
+    print("{} packets, {} frames, {} dropped packets, {} invalid datagrams, {} late frames, max latency {:.1f} ms, "
+          "{} frames not written".format(stats['packets'], stats['frames'], stats['dropped'], stats['invalid'],
+                                         stats['late'], stats['max_latency'] * 1E3, stats['unwritten']))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--config', type=str, help="Path of the configuration file", required=True)
+    parser.add_argument('-o', '--out-dir', type=str, default=None,
+                        help="Path of the output directory, by default no files are written")
+    parser.add_argument('-r', '--record', type=str, default=None, help="Path of a pcap file to record the stream to")
+    parser.add_argument('-d', '--duration', type=float, default=None,
+                        help="Seconds to capture, by default until interrupted")
+    parser.add_argument('--host', type=str, default=None,
+                        help="Address to receive on, or to send to with --replay")
+    parser.add_argument('--ring-size', type=int, default=4096, help="Number of packets held by the ring buffer")
+    parser.add_argument('--latency-budget', type=float, default=0.05,
+                        help="Seconds from receiving a frame to publishing it, later frames are reported as late")
+    parser.add_argument('--replay', type=str, default=None,
+                        help="Send the packets of this pcap file at their original timing instead of capturing")
+    parser.add_argument('--speed', type=float, default=1., help="Factor of the original packet rate of --replay")
+
+    args = vars(parser.parse_args())
+    main(args)
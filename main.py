@@ -1,7 +1,14 @@
 import argparse
+import multiprocessing
+import os
+import queue
+from concurrent.futures import ProcessPoolExecutor, wait
 import yaml
 
+from data_index import load_data_dict
 from lidar_manager import *
+from manifest import Manifest
+from profiler import Profiler
 
 
 def read_params(path):
@@ -14,20 +21,276 @@ def read_params(path):
     return params
 
 
+def list_pcaps(paths):
+    """
+    :param paths: pcap files or directories of pcap files
+    :return: sorted list of pcap files
+    """
+    pcaps = []
+    for path in paths:
+        if os.path.isdir(path):
+            pcaps += [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith('.pcap')]
+        else:
+            pcaps.append(path)
+    return pcaps
+
+
+def camera_frames(path):
+    """
+    :param path: data_all.pkl or data_index.npz
+    :return: dict of the numbers of the lidar frames matched with imgs of camera 0 keyed by the sequence name
+    """
+    frames = {}
+    for value in load_data_dict(path).values():
+        # lidar_txt is {scene}/data_txt/{frame_nr}_{time}.txt
+        scene_name, _, txt_name = Path(value['lidar_txt']).parts[-3:]
+        frames.setdefault(scene_name, set()).add(int(txt_name.split("_")[0]))
+    return frames
+
+
+def window_params(path, params, args):
+    """
+    :return: params of a pcap file with the time window and camera aligned frames of the arguments,
+             None if no frame of the file is matched with imgs
+    """
+    params = dict(params)
+    if args.get('start_time') is not None:
+        params['start-time'] = args['start_time']
+    if args.get('end_time') is not None:
+        params['end-time'] = args['end_time']
+    if args.get('camera_frames') is not None:
+        frames = args['camera_frames'].get(Path(path).stem)
+        if not frames:
+            print("{}: no frame is matched with imgs".format(path))
+            return None
+        params['frames'] = sorted(frames)
+    return params
+
+
+def plan_shards(path, params, n_shards, manifest=None):
+    """
+    Split a pcap file into packet ranges cut at entries of its seek index, so that no frame is split between
+    shards and the frame numbers are the same as when extracting the whole file at once. Each shard finishes its
+    last frame by reading past its range, the packets after the range are counted by the following shard.
+    :param manifest: manifest of a previous run, shards which are up to date are left out
+    :return: list of (params, seek) of each shard
+    """
+    if n_shards <= 1:
+        return [(params, None)]
+    if params.get('bin', False) or params.get('archive', False):
+        print("{}: the sequence file of bin: True or the archive of archive: True cannot be written by several shards, "
+              "extract in one shard".format(path))
+        return [(params, None)]
+
+    if any(params.get(key) is not None for key in ('start-time', 'end-time', 'frames')):
+        print("{}: a time window or camera aligned frames are extracted in one shard".format(path))
+        return [(params, None)]
+
+    if params.get('voxel', False) and params.get('voxel-frames', 1) > 1:
+        print("{}: voxel-frames > 1 aggregates the frames before each frame, extract in one shard".format(path))
+        return [(params, None)]
+
+    if params['from'] != 0:
+        print("{}: the seek index counts the frames from the start of the file, extract from packet {} in one shard"
+              .format(path, params['from']))
+        return [(params, None)]
+
+    entries = LSLidarManager(path, None, params).seek_index()
+    # entries after the first roll over and before the last packet can start a shard
+    entries = entries[(entries['ordinal'] > 0) & (entries['frames'] > 0)]
+    if params['to'] >= 0:
+        entries = entries[entries['ordinal'] < params['to']]
+    if len(entries) == 0 or int(entries['frames'][-1]) < 2 * n_shards:
+        return [(params, None)]
+
+    # frame number of the frame finished by the first roll over
+    base = params.get('first-frame', 0) - (1 if params.get('drop-partial', False) else 0)
+
+    shards = []
+    shard_params = dict(params)
+    seek = None
+    frames = 0
+    for j in range(1, n_shards):
+        entry = entries[j * len(entries) // n_shards]
+        if int(entry['frames']) <= frames:
+            continue
+        frames = int(entry['frames'])
+        ordinal, offset = int(entry['ordinal']), int(entry['offset'])
+        # the frame in progress at the entry is finished by this shard and dropped by the following one
+        shard_params['stop-frame'] = base + frames + 1
+        shard_params['shard-end'] = [ordinal, offset]
+        shards.append((shard_params, seek))
+
+        shard_params = dict(params)
+        shard_params['from'] = ordinal
+        shard_params['first-frame'] = base + frames + 1
+        shard_params['drop-partial'] = True
+        seek = (ordinal, offset)
+    shards.append((shard_params, seek))
+
+    if manifest is not None:
+        shards = [(shard_params, seek) for shard_params, seek in shards
+                  if not manifest.up_to_date(shard_params['from'], shard_params['to'],
+                                             shard_params.get('first-frame', 0), shard_params.get('stop-frame'))]
+    return shards
+
+
+def plan(path, out_dir, params, n_shards, args=None):
+    """
+    Plan the shards of a pcap file in a worker process, a file which is up to date is skipped before its seek
+    index is read or built
+    :return: list of (params, seek) of each shard
+    """
+    params = window_params(path, params, args or {})
+    if params is None:
+        return []
+    manifest = None
+    if params.get('resume', False):
+        # the manifest is validated once, so that shards of the same pcap do not discard each other's records
+        out_path = Path("{}/{}".format(out_dir, Path(path).stem))
+        os.makedirs(out_path.absolute(), exist_ok=True)
+        manifest = Manifest(out_path, path, params)
+        manifest.close()
+        if not manifest.resumed:
+            manifest = None
+
+    # the sequence file and the archive are checked by the extraction, a window does not complete the file
+    if manifest is not None and not params.get('bin', False) and not params.get('archive', False) and \
+            all(params.get(key) is None for key in ('start-time', 'end-time', 'frames')) and \
+            manifest.up_to_date(params['from'], params['to'], params.get('first-frame', 0)):
+        print("{} is up to date".format(out_path))
+        return []
+    return plan_shards(path, params, n_shards, manifest)
+
+
+def make_profiler(args, path=None, params=None):
+    """
+    :param path: pcap file of a job of several jobs, its cProfile dump is named after the file and first packet
+    :return: Profiler of the --profile arguments
+    """
+    packets = args.get('profile_packets')
+    dump = args.get('profile_dump')
+    if packets is not None and path is not None:
+        dump_path = Path(dump)
+        dump = str(dump_path.with_name("{}_{}_{}{}".format(dump_path.stem, Path(path).stem, params['from'],
+                                                          dump_path.suffix)))
+    enabled = bool(args.get('profile') or args.get('profile_report') or packets is not None)
+    return Profiler(enabled, packets, dump)
+
+
+def report_profile(profiler, args):
+    if not profiler.enabled:
+        return
+    print(profiler.summary())
+    if args.get('profile_report'):
+        profiler.write_report(args['profile_report'])
+
+
+def extract(path, out_dir, params, seek, progress_queue, args=None):
+    """
+    Extract a pcap file or a shard of it in a worker process
+    """
+    lidar_manager = LSLidarManager(path, out_dir, params, make_profiler(args or {}, path, params))
+    return lidar_manager.run(seek, lambda n: progress_queue.put(n))
+
+
+def run_parallel(pcaps, out_dir, params, workers, n_shards, args=None):
+    """
+    Extract several pcap files, or shards of them, on a process pool. The shards of each file are planned on the
+    pool too, its shards are extracted as soon as they are planned.
+    """
+    args = args or {}
+    total = sum(os.path.getsize(path) for path in pcaps)
+    stats = {path: [] for path in pcaps}
+    progress_queue = multiprocessing.Manager().Queue()
+    pbar = tqdm(total=total, unit='B', unit_scale=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        plans = {pool.submit(plan, path, out_dir, params, n_shards, args): path for path in pcaps}
+        futures = {}
+        pending = set(plans)
+        while pending:
+            done, pending = wait(pending, timeout=0.2)
+            try:
+                while True:
+                    pbar.update(progress_queue.get_nowait())
+            except queue.Empty:
+                pass
+            for future in done:
+                path = plans.get(future) or futures[future]
+                try:
+                    result = future.result()
+                except Exception as ex:
+                    print("{}: {}".format(path, str(ex)))
+                    continue
+                if future in plans:
+                    for shard_params, seek in result:
+                        job = pool.submit(extract, path, out_dir, shard_params, seek, progress_queue, args)
+                        futures[job] = path
+                        pending.add(job)
+                elif result is not None:
+                    stats[path].append(result)
+    pbar.close()
+
+    print("{:<60} {:>10} {:>8} {:>10} {:>12}".format("pcap", "packets", "frames", "MB", "packets/s"))
+    for path in pcaps:
+        packets = sum(result['packets'] for result in stats[path])
+        frames = sum(result['frames'] for result in stats[path])
+        mbytes = sum(result['bytes'] for result in stats[path]) / 1e6
+        seconds = sum(result['seconds'] for result in stats[path])
+        print("{:<60} {:>10} {:>8} {:>10.1f} {:>12.0f}".format(
+            Path(path).name, packets, frames, mbytes, packets / seconds if seconds > 0 else 0))
+
+    # the profiles of all jobs are added up
+    profiler = make_profiler(args)
+    for path in pcaps:
+        for result in stats[path]:
+            if 'profile' in result:
+                profiler.merge(result['profile'])
+    report_profile(profiler, args)
+
+
 def main(args):
-    path = args['path']
+    paths = args['path']
     out_dir = args['out_dir']
     config = args['config']
     params = read_params(config)
-    lidar_manager = LSLidarManager(path, out_dir, params)
-    lidar_manager.run()
+    pcaps = list_pcaps(paths)
+    if args.get('camera_aligned'):
+        args['camera_frames'] = camera_frames(args['camera_aligned'])
+    if len(pcaps) == 1 and args['workers'] <= 1 and args['shards'] <= 1:
+        params = window_params(pcaps[0], params, args)
+        if params is None:
+            return
+        profiler = make_profiler(args)
+        lidar_manager = LSLidarManager(pcaps[0], out_dir, params, profiler)
+        lidar_manager.run()
+        report_profile(profiler, args)
+    else:
+        run_parallel(pcaps, out_dir, params, args['workers'], args['shards'], args)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument('-p', '--path', type=str, help="Path of the pcap file", required=True)
+    parser.add_argument('-p', '--path', type=str, nargs='+', help="Path of the pcap files or directories of pcap files",
+                        required=True)
     parser.add_argument('-o', '--out-dir', type=str, help="Path of the output directory", required=True)
     parser.add_argument('-c', '--config', type=str, help="Path of the configuration file", required=True)
+    parser.add_argument('-w', '--workers', type=int, default=1, help="Number of worker processes")
+    parser.add_argument('-s', '--shards', type=int, default=1, help="Number of shards each pcap file is split into")
+    parser.add_argument('--start-time', type=float, default=None,
+                        help="Extract only the frames ending after this unix timestamp [s], using a seek index")
+    parser.add_argument('--end-time', type=float, default=None,
+                        help="Extract only the frames starting before this unix timestamp [s]")
+    parser.add_argument('--camera-aligned', type=str, default=None,
+                        help="Path of data_all.pkl or data_index.npz, extract only the frames matched with imgs")
+    parser.add_argument('--profile', action='store_true',
+                        help="Print the time of each stage, bytes read and written and points per frame")
+    parser.add_argument('--profile-report', type=str, default=None,
+                        help="Path of a JSON, or CSV if it ends with .csv, file to write the profile to")
+    parser.add_argument('--profile-packets', type=int, nargs=2, default=None, metavar=('FIRST', 'LAST'),
+                        help="Run cProfile while decoding this range of packets")
+    parser.add_argument('--profile-dump', type=str, default='profile.prof',
+                        help="Path of the cProfile dump of --profile-packets")
 
     args = vars(parser.parse_args())
     main(args)
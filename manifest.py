@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+
+MANIFEST_FILE = "manifest.jsonl"
+
+# params which select the packets to read or tune the extraction, they do not change the content of a frame
+RANGE_PARAMS = ('from', 'to', 'first-frame', 'drop-partial', 'writer-threads', 'queue-size', 'resume', 'start-time',
+                'end-time', 'frames', 'seek-interval', 'stop-frame', 'shard-end')
+
+
+def config_hash(params):
+    config = {key: value for key, value in params.items() if key not in RANGE_PARAMS}
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class Manifest:
+    """
+    Append-only record of the frames extracted into an output dir. The first line identifies the source pcap
+    and the config, each following line records a frame whose files are completely written or the completion
+    of a packet range. A manifest of another source or config is discarded.
+    """
+    def __init__(self, out_path, pcap_path, params):
+        self.path = Path(out_path) / MANIFEST_FILE
+        stat = os.stat(pcap_path)
+        self.header = {'source': str(Path(pcap_path).absolute()), 'size': stat.st_size, 'mtime': stat.st_mtime,
+                       'config': config_hash(params)}
+        self.frames = {}
+        self.completed = []
+        self.lock = threading.Lock()
+
+        self.resumed = self.load()
+        if not self.resumed:
+            with open(self.path, 'w') as fp:
+                fp.write(json.dumps(self.header) + '\n')
+        self.file = open(self.path, 'a')
+
+    def load(self):
+        """
+        Load the records of a previous run
+        :return: True if the manifest belongs to the same source and config
+        """
+        try:
+            with open(self.path, 'r') as fp:
+                content = fp.read()
+        except FileNotFoundError:
+            return False
+
+        # drop a record which was not completely written
+        if not content.endswith('\n'):
+            content = content[:content.rfind('\n') + 1]
+            with open(self.path, 'w') as fp:
+                fp.write(content)
+
+        lines = content.splitlines()
+        if not lines or json.loads(lines[0]) != self.header:
+            return False
+        for line in lines[1:]:
+            record = json.loads(line)
+            if 'frame' in record:
+                self.frames[record['frame']] = record
+            else:
+                self.completed.append(record)
+        return True
+
+    def close(self):
+        self.file.close()
+
+    def append(self, record):
+        with self.lock:
+            self.file.write(json.dumps(record) + '\n')
+            self.file.flush()
+
+    def add_frame(self, frame_nr, first_packet, last_packet, offset, next_seek, files, start_time=None):
+        """
+        Record a frame after all its files are written
+        :param first_packet: ordinal of the packet the frame starts in
+        :param last_packet: ordinal of the packet the frame ends in
+        :param offset: byte offset of the record of the first packet in the pcap file
+        :param next_seek: (ordinal, byte offset) of the data packet to start reading from to extract the next frame
+        :param files: output files of the frame relative to the output dir
+        :param start_time: timestamp of the first firing of the frame, its files are named after it
+        """
+        record = {'frame': frame_nr, 'first_packet': first_packet, 'last_packet': last_packet, 'offset': offset,
+                  'next_seek': next_seek, 'files': files, 'start_time': start_time}
+        self.frames[frame_nr] = record
+        self.append(record)
+
+    def complete(self, start, stop, first_frame, last_frame, stop_frame=None):
+        """
+        Record that the packet range [start, stop] has been extracted completely
+        :param stop_frame: frame number the extraction of a shard stopped at
+        """
+        record = {'from': start, 'to': stop, 'first_frame': first_frame, 'last_frame': last_frame,
+                  'stop_frame': stop_frame}
+        self.completed.append(record)
+        self.append(record)
+
+    def last_frame(self, start, stop, first_frame, stop_frame=None):
+        """
+        :return: number of the last frame of a completely extracted packet range, or None
+        """
+        for record in self.completed:
+            if (record['from'], record['to'], record['first_frame'], record.get('stop_frame')) == \
+                    (start, stop, first_frame, stop_frame):
+                return record['last_frame']
+        return None
+
+    def up_to_date(self, start, stop, first_frame, stop_frame=None):
+        """
+        :return: True if the packet range has been extracted completely and the files of all its frames exist
+        """
+        last_frame = self.last_frame(start, stop, first_frame, stop_frame)
+        if last_frame is None:
+            return False
+        done = self.done_frames()
+        return all(frame_nr in done for frame_nr in range(first_frame, last_frame + 1))
+
+    def done_frames(self, is_done=None):
+        """
+        :param is_done: optional check of a frame number besides the existence of its files
+        :return: dict of frame number to record of the frames whose files all exist
+        """
+        out_path = self.path.parent
+        return {frame_nr: record for frame_nr, record in self.frames.items()
+                if all((out_path / name).exists() for name in record['files'])
+                and (is_done is None or is_done(frame_nr))}
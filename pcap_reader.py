@@ -0,0 +1,204 @@
+import mmap
+import os
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+from lidar import PACKET_SIZE
+
+
+PCAP_HEADER_SIZE = 24
+RECORD_HEADER_SIZE = 16
+
+# byte order of the headers and divisor of the sub-second timestamp field, keyed by magic number
+PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1E6),
+    b'\xa1\xb2\xc3\xd4': ('>', 1E6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1E9),
+    b'\xa1\xb2\x3c\x4d': ('>', 1E9),
+}
+
+# length of the link layer header keyed by link type (Ethernet, Linux cooked capture)
+LINK_HEADER_SIZE = {1: 14, 113: 16}
+
+# offsets inside the link layer payload: IPv4 header without options followed by the UDP header
+UDP_SPORT_OFFSET = 20
+UDP_PAYLOAD_OFFSET = 28
+
+# indices: ordinal of each packet in the pcap file, offsets: byte offset of each record header,
+# timestamps: capture time of each packet, payloads: [N x 1206] uint8 array,
+# position: byte offset in the pcap file after the last record of the batch
+PacketBatch = namedtuple('PacketBatch', ['indices', 'offsets', 'timestamps', 'payloads', 'position'])
+
+
+class PcapReader:
+    """
+    Single pass reader of lidar data packets, the pcap file is memory mapped and only the record headers
+    and the UDP source port are parsed, payloads are returned as views of the mapped file where possible
+    """
+    def __init__(self, path, port, batch_size=256):
+        self.path = path
+        self.port = port
+        self.batch_size = batch_size
+
+        self.file = open(path, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        if self.size < PCAP_HEADER_SIZE:
+            self.file.close()
+            raise ValueError('invalid pcap header: {}'.format(path))
+
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = np.frombuffer(self.mmap, dtype=np.uint8)
+
+        magic = self.mmap[0:4]
+        if magic not in PCAP_MAGIC:
+            self.close()
+            raise ValueError('invalid pcap header: {}'.format(path))
+        byte_order, self.divisor = PCAP_MAGIC[magic]
+        self.record_header = struct.Struct(byte_order + 'IIII')
+
+        link_type = struct.unpack_from(byte_order + 'I', self.mmap, 20)[0] & 0xffff
+        if link_type not in LINK_HEADER_SIZE:
+            self.close()
+            raise ValueError('unsupported pcap link type {}: {}'.format(link_type, path))
+        self.sport_offset = RECORD_HEADER_SIZE + LINK_HEADER_SIZE[link_type] + UDP_SPORT_OFFSET
+        self.payload_offset = RECORD_HEADER_SIZE + LINK_HEADER_SIZE[link_type] + UDP_PAYLOAD_OFFSET
+        self.min_caplen = LINK_HEADER_SIZE[link_type] + UDP_PAYLOAD_OFFSET + PACKET_SIZE
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.buffer = None
+        try:
+            self.mmap.close()
+        except BufferError:
+            # payload views are still referenced, the mapping is released together with them
+            pass
+        self.file.close()
+
+    def batches(self, start=0, stop=-1, seek=None):
+        """
+        Iterate over the data packets of the pcap file
+        :param start: ordinal of the first packet to read
+        :param stop: ordinal of the last packet to read, values <= 0 read until the end of the file
+        :param seek: (ordinal, byte offset) of a record at or before start to continue reading from
+        :return: generator of PacketBatch
+        """
+        index, pos = seek if seek is not None else (0, PCAP_HEADER_SIZE)
+        unpack_record = self.record_header.unpack_from
+        unpack_sport = struct.Struct('>H').unpack_from
+        mm = self.mmap
+        size = self.size
+        port = self.port
+        min_caplen = self.min_caplen
+        sport_offset = self.sport_offset
+
+        indices = []
+        offsets = []
+        seconds = []
+        fractions = []
+        while pos + RECORD_HEADER_SIZE <= size:
+            ts_sec, ts_frac, caplen, _ = unpack_record(mm, pos)
+            end = pos + RECORD_HEADER_SIZE + caplen
+            if end > size:
+                # truncated record at the end of the capture
+                break
+            if index >= start:
+                if 0 < stop < index:
+                    break
+                if caplen >= min_caplen and unpack_sport(mm, pos + sport_offset)[0] == port:
+                    indices.append(index)
+                    offsets.append(pos)
+                    seconds.append(ts_sec)
+                    fractions.append(ts_frac)
+                    if len(indices) == self.batch_size:
+                        yield self.make_batch(indices, offsets, seconds, fractions, end)
+                        indices = []
+                        offsets = []
+                        seconds = []
+                        fractions = []
+            index += 1
+            pos = end
+
+        if indices:
+            yield self.make_batch(indices, offsets, seconds, fractions, pos)
+
+    def make_batch(self, indices, offsets, seconds, fractions, position):
+        offsets = np.array(offsets, dtype=np.int64)
+        timestamps = np.array(seconds, dtype=np.float64) + np.array(fractions, dtype=np.float64) / self.divisor
+        return PacketBatch(np.array(indices, dtype=np.int64), offsets, timestamps,
+                           self.read_payloads(offsets), position)
+
+    def read_payloads(self, offsets):
+        starts = offsets + self.payload_offset
+        strides = np.diff(starts)
+        if strides.size == 0 or np.all(strides == strides[0]):
+            # records of equal length, the payloads are a strided view of the mapped file
+            stride = int(strides[0]) if strides.size else PACKET_SIZE
+            return np.lib.stride_tricks.as_strided(self.buffer[starts[0]:], shape=(len(starts), PACKET_SIZE),
+                                                   strides=(stride, 1), writeable=False)
+        return self.buffer[starts[:, None] + np.arange(PACKET_SIZE)]
+
+
+# record of a data packet written by PcapWriter: record header, Ethernet, IPv4 and UDP headers, payload
+RECORD_DTYPE = np.dtype([('ts_sec', '<u4'), ('ts_usec', '<u4'), ('caplen', '<u4'), ('len', '<u4'),
+                         ('headers', 'u1', (LINK_HEADER_SIZE[1] + UDP_PAYLOAD_OFFSET,)),
+                         ('payload', 'u1', (PACKET_SIZE,))])
+
+
+def udp_headers(port):
+    """
+    :return: Ethernet, IPv4 and UDP headers of a data packet from and to the given port, uint8 array
+    """
+    ip_length = UDP_PAYLOAD_OFFSET + PACKET_SIZE
+    ip_header = bytearray(struct.pack('>BBHHHBBH4s4s', 0x45, 0, ip_length, 0, 0x4000, 64, 17, 0,
+                                      bytes([127, 0, 0, 1]), bytes([127, 0, 0, 1])))
+    checksum = sum(struct.unpack('>10H', ip_header))
+    checksum = (checksum & 0xffff) + (checksum >> 16)
+    struct.pack_into('>H', ip_header, 10, ~checksum & 0xffff)
+    udp_header = struct.pack('>HHHH', port, port, ip_length - UDP_SPORT_OFFSET, 0)
+    return np.frombuffer(b'\xff' * 6 + b'\x00' * 6 + b'\x08\x00' + bytes(ip_header) + udp_header, dtype=np.uint8)
+
+
+class PcapWriter:
+    """
+    Writer of lidar data packets to a pcap file which can be read by PcapReader, the packets are
+    stored as UDP datagrams from and to the given port
+    """
+    def __init__(self, path, port):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+
+        self.headers = udp_headers(port)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def write(self, timestamps, payloads, headers=None):
+        """
+        Append data packets
+        :param timestamps: capture time of each packet
+        :param payloads: [N x 1206] uint8 array
+        :param headers: headers of each packet, [N x 42] uint8 array, by default those of the port of the writer
+        """
+        records = np.empty(len(timestamps), dtype=RECORD_DTYPE)
+        microseconds = np.round(np.asarray(timestamps, dtype=np.float64) * 1E6).astype(np.int64)
+        records['ts_sec'], records['ts_usec'] = np.divmod(microseconds, 1000000)
+        records['caplen'] = RECORD_DTYPE.itemsize - RECORD_HEADER_SIZE
+        records['len'] = RECORD_DTYPE.itemsize - RECORD_HEADER_SIZE
+        records['headers'] = self.headers if headers is None else headers
+        records['payload'] = payloads
+        records.tofile(self.file)
+        self.file.flush()
@@ -0,0 +1,121 @@
+import struct
+
+import numpy as np
+
+try:
+    import lzf
+except ImportError:
+    lzf = None
+
+
+PCD_DATA_FORMATS = ('ascii', 'binary', 'binary_compressed')
+
+# fields of each point of the PCD files
+PCD_DTYPE = np.dtype([('x', '<f4'), ('y', '<f4'), ('z', '<f4'), ('intensity', '<f4')])
+
+PCD_HEADER = '# .PCD v0.7 - Point Cloud Data file format\nVERSION 0.7\nFIELDS x y z intensity\nSIZE 4 4 4 4\n' \
+             'TYPE F F F F\nCOUNT 1 1 1 1\nWIDTH {}\nHEIGHT {}\nVIEWPOINT 0 0 0 1 0 0 0\nPOINTS {}\nDATA {}\n'
+
+
+def check_data_format(data):
+    """
+    Check that PCD files can be written in the given DATA format
+    """
+    if data not in PCD_DATA_FORMATS:
+        raise ValueError('unknown pcd-format {}, expected one of {}'.format(data, ', '.join(PCD_DATA_FORMATS)))
+    if data == 'binary_compressed' and lzf is None:
+        raise ImportError('pcd-format binary_compressed requires the python-lzf package')
+
+
+def write_pcd(path, X, Y, Z, I, data='ascii'):
+    """
+    Write a point cloud to a PCD file
+    :param data: DATA format of the file, ascii, binary or binary_compressed
+    """
+    check_data_format(data)
+
+    with open(path, 'wb') as handle:
+        write_points(handle, X, Y, Z, I, data)
+
+
+def write_organized_pcd(path, X, Y, Z, I, data='binary'):
+    """
+    Write an organized point cloud to a PCD file, points without return have to be NaN
+    :param X, Y, Z, I: [HEIGHT x WIDTH] arrays
+    :param data: DATA format of the file, ascii, binary or binary_compressed
+    """
+    write_pcd(path, X, Y, Z, I, data)
+
+
+def write_points(handle, X, Y, Z, I, data):
+    """
+    Write the header and the points, the shape of the arrays, [HEIGHT x WIDTH] or [WIDTH], is the shape of the cloud
+    """
+    height, width = X.shape if X.ndim == 2 else (1, X.shape[0])
+    point_num = X.size
+    handle.write(PCD_HEADER.format(width, height, point_num, data).encode('ascii'))
+
+    if data == 'ascii':
+        M = np.column_stack((X.reshape(-1), Y.reshape(-1), Z.reshape(-1), I.reshape(-1)))
+        # all lines are formatted at once and written with a single call
+        handle.write(('%.6f %.6f %.6f %d\n' * point_num % tuple(M.ravel().tolist())).encode('ascii'))
+        return
+
+    points = np.empty(point_num, dtype=PCD_DTYPE)
+    points['x'] = X.reshape(-1)
+    points['y'] = Y.reshape(-1)
+    points['z'] = Z.reshape(-1)
+    points['intensity'] = I.reshape(-1)
+    if data == 'binary':
+        points.tofile(handle)
+    elif data == 'binary_compressed':
+        # fields are stored column by column before the LZF compression
+        raw = points.view('<f4').reshape(-1, len(PCD_DTYPE.names)).T.tobytes()
+        compressed = lzf.compress(raw, len(raw) + len(raw) // 32 + 16) if raw else b''
+        handle.write(struct.pack('<II', len(compressed), len(raw)))
+        handle.write(compressed)
+
+
+def read_pcd(path):
+    """
+    Read a PCD file written by write_pcd or write_organized_pcd
+    :return: structured array of PCD_DTYPE, of shape [HEIGHT x WIDTH] if the point cloud is organized
+    """
+    with open(path, 'rb') as handle:
+        header = {}
+        while 'DATA' not in header:
+            line = handle.readline()
+            if not line:
+                raise ValueError('invalid pcd header: {}'.format(path))
+            fields = line.decode('ascii').split()
+            if fields and not fields[0].startswith('#'):
+                header[fields[0]] = fields[1:]
+        body = handle.read()
+
+    if header['FIELDS'] != list(PCD_DTYPE.names):
+        raise ValueError('unsupported pcd fields {}: {}'.format(' '.join(header['FIELDS']), path))
+    points = read_points(body, header, path)
+    height = int(header.get('HEIGHT', ['1'])[0])
+    return points.reshape(height, -1) if height > 1 else points
+
+
+def read_points(body, header, path):
+    point_num = int(header['POINTS'][0])
+    data = header['DATA'][0]
+
+    if data == 'ascii':
+        values = np.fromstring(body.decode('ascii'), sep=' ')
+        points = np.empty(point_num, dtype=PCD_DTYPE)
+        points.view('<f4').reshape(-1, len(PCD_DTYPE.names))[:] = values.reshape(point_num, len(PCD_DTYPE.names))
+        return points
+    if data == 'binary':
+        return np.frombuffer(body, dtype=PCD_DTYPE, count=point_num).copy()
+    if data == 'binary_compressed':
+        check_data_format(data)
+        compressed_size, raw_size = struct.unpack_from('<II', body)
+        raw = lzf.decompress(body[8:8 + compressed_size], raw_size) if raw_size else b''
+        columns = np.frombuffer(raw, dtype='<f4').reshape(len(PCD_DTYPE.names), -1)
+        points = np.empty(point_num, dtype=PCD_DTYPE)
+        points.view('<f4').reshape(-1, len(PCD_DTYPE.names))[:] = columns.T
+        return points
+    raise ValueError('unknown pcd DATA format {}: {}'.format(data, path))
@@ -0,0 +1,209 @@
+import cProfile
+import csv
+import json
+import threading
+import time
+
+
+class NullStage:
+    """
+    Stage of a disabled profiler, entering and leaving it does nothing
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+NULL_STAGE = NullStage()
+
+
+class Stage:
+    """
+    Stage of an enabled profiler, the time of stages nested in it is not counted as its own time
+    """
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = None
+        self.nested = 0.
+
+    def __enter__(self):
+        stack = self.profiler.stack()
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        seconds = time.perf_counter() - self.start
+        stack = self.profiler.stack()
+        stack.pop()
+        if stack:
+            stack[-1].nested += seconds
+        self.profiler.add_time(self.name, seconds - self.nested)
+        return False
+
+
+class Profiler:
+    """
+    Wall time and number of calls of each stage, counters and distributions of values. A disabled profiler,
+    the default, only checks a flag on each call. The time of a stage excludes the stages nested in it,
+    stages run by several threads add up their wall time.
+    """
+    def __init__(self, enabled=False, packets=None, dump=None):
+        """
+        :param packets: (first, last) ordinal of the packets to run cProfile for
+        :param dump: path of the cProfile dump of the packet range, it is read by pstats, snakeviz and others
+        """
+        self.enabled = enabled
+        self.packets = packets
+        self.dump = dump
+        self.times = {}
+        self.calls = {}
+        self.counters = {}
+        self.distributions = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.cprofile = None
+
+    def stack(self):
+        """
+        :return: stages entered by the current thread
+        """
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def stage(self, name):
+        """
+        :return: context manager measuring the wall time of a stage
+        """
+        if not self.enabled:
+            return NULL_STAGE
+        return Stage(self, name)
+
+    def iterate(self, name, iterable):
+        """
+        :return: iterable measuring the wall time of getting each item as a stage
+        """
+        if not self.enabled:
+            return iterable
+        return self.timed_items(name, iterable)
+
+    def timed_items(self, name, iterable):
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                item = next(iterator, StopIteration)
+            if item is StopIteration:
+                return
+            yield item
+
+    def add_time(self, name, seconds, calls=1):
+        with self.lock:
+            self.times[name] = self.times.get(name, 0.) + seconds
+            self.calls[name] = self.calls.get(name, 0) + calls
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        """
+        Add a value to the distribution of which count, mean, min and max are reported
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            count, total, low, high = self.distributions.get(name, (0, 0, value, value))
+            self.distributions[name] = (count + 1, total + value, min(low, value), max(high, value))
+
+    def check_packets(self, first, last):
+        """
+        Start or stop cProfile when the packets about to be processed enter or leave the profiled packet range
+        :param first: ordinal of the first packet about to be processed
+        :param last: ordinal of the last packet about to be processed
+        """
+        if not self.enabled or self.packets is None:
+            return
+        if self.cprofile is None and first <= self.packets[1] and last >= self.packets[0]:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        elif self.cprofile is not None and first > self.packets[1]:
+            self.stop_cprofile()
+
+    def stop_cprofile(self):
+        if self.cprofile is None:
+            return
+        self.cprofile.disable()
+        if self.dump:
+            self.cprofile.dump_stats(self.dump)
+        self.cprofile = None
+        self.packets = None
+
+    def report(self):
+        """
+        :return: dict of the stages, counters and distributions
+        """
+        return {'stages': {name: {'seconds': self.times[name], 'calls': self.calls[name]} for name in self.times},
+                'counters': dict(self.counters),
+                'distributions': {name: {'count': count, 'sum': total, 'min': low, 'max': high}
+                                  for name, (count, total, low, high) in self.distributions.items()}}
+
+    def merge(self, report):
+        """
+        Add the report of another profiler, e.g. of a worker process
+        """
+        for name, stage in report['stages'].items():
+            self.add_time(name, stage['seconds'], stage['calls'])
+        with self.lock:
+            for name, value in report['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, dist in report['distributions'].items():
+                count, total, low, high = self.distributions.get(name, (0, 0, dist['min'], dist['max']))
+                self.distributions[name] = (count + dist['count'], total + dist['sum'], min(low, dist['min']),
+                                            max(high, dist['max']))
+
+    def summary(self):
+        """
+        :return: table of the stages, counters and distributions
+        """
+        total = sum(self.times.values())
+        lines = ["{:<24} {:>10} {:>8} {:>10} {:>12}".format("stage", "seconds", "%", "calls", "ms/call")]
+        for name, seconds in sorted(self.times.items(), key=lambda item: -item[1]):
+            calls = self.calls[name]
+            lines.append("{:<24} {:>10.3f} {:>8.1f} {:>10} {:>12.3f}".format(
+                name, seconds, 100. * seconds / total if total > 0 else 0., calls, 1E3 * seconds / calls))
+        for name, value in sorted(self.counters.items()):
+            lines.append("{:<24} {:>10}".format(name, value))
+        for name, (count, total, low, high) in sorted(self.distributions.items()):
+            lines.append("{:<24} count {} mean {:.1f} min {} max {}".format(name, count, total / count, low, high))
+        return "\n".join(lines)
+
+    def write_report(self, path):
+        """
+        Write the report as CSV file if the path ends with .csv, otherwise as JSON file
+        """
+        report = self.report()
+        if str(path).endswith('.csv'):
+            with open(path, 'w', newline='') as fp:
+                writer = csv.writer(fp)
+                writer.writerow(['kind', 'name', 'value', 'calls', 'min', 'max'])
+                for name, stage in report['stages'].items():
+                    writer.writerow(['stage', name, stage['seconds'], stage['calls'], '', ''])
+                for name, value in report['counters'].items():
+                    writer.writerow(['counter', name, value, '', '', ''])
+                for name, dist in report['distributions'].items():
+                    writer.writerow(['distribution', name, dist['sum'], dist['count'], dist['min'], dist['max']])
+        else:
+            with open(path, 'w') as fp:
+                json.dump(report, fp, indent=2)
+
+    def close(self):
+        """
+        Stop cProfile if the packet range has not ended yet
+        """
+        self.stop_cprofile()
@@ -0,0 +1,273 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import yaml
+from tqdm import tqdm
+
+from dataset import LidarDataset
+
+
+DEPTH_DIR = "data_depth"
+
+IMAGE_SIZE = (1280, 720)
+
+# largest normalized radius tan(angle to the optical axis) checked for the distortion model
+MAX_RADIUS = 4.
+
+
+class OpenCVLoader(yaml.SafeLoader):
+    """
+    Loader of the YAML files of cv::FileStorage, e.g. the calibration files of the Autoware calibration toolbox
+    """
+
+
+def construct_matrix(loader, node):
+    matrix = loader.construct_mapping(node, deep=True)
+    return np.array(matrix['data'], dtype=np.float64).reshape(matrix['rows'], matrix['cols'])
+
+
+OpenCVLoader.add_constructor('tag:yaml.org,2002:opencv-matrix', construct_matrix)
+
+
+def read_calibration(path, lidar_to_camera=False):
+    """
+    Read the calibration file of a camera written by the Autoware calibration toolbox
+    :param lidar_to_camera: CameraExtrinsicMat transforms lidar into camera coordinates, by default it is the pose
+                            of the camera in the lidar coordinate system as written by Autoware
+    :return: dict of the rotation [3 x 3] and translation [3] from lidar into camera coordinates, camera matrix
+             [3 x 3], distortion coefficients k1, k2, p1, p2, k3 and image size (width, height)
+    """
+    with open(path, 'r') as f:
+        # PyYAML does not accept the %YAML:1.0 directive of cv::FileStorage
+        text = "".join(line for line in f if not line.startswith('%YAML'))
+    calibration = yaml.load(text, Loader=OpenCVLoader)
+
+    extrinsic = np.asarray(calibration['CameraExtrinsicMat'], dtype=np.float64)
+    if not lidar_to_camera:
+        extrinsic = np.linalg.inv(extrinsic)
+    dist = np.zeros(5)
+    coeffs = np.asarray(calibration.get('DistCoeff', dist), dtype=np.float64).reshape(-1)[:5]
+    dist[:len(coeffs)] = coeffs
+    return {'rotation': extrinsic[:3, :3], 'translation': extrinsic[:3, 3],
+            'camera_mat': np.asarray(calibration['CameraMat'], dtype=np.float64),
+            'dist': dist, 'image_size': tuple(int(n) for n in calibration.get('ImageSize', IMAGE_SIZE))}
+
+
+def max_radius(dist):
+    """
+    :return: largest normalized radius up to which the distorted radius grows, points beyond it would wrap around
+             into the image
+    """
+    k1, k2, _, _, k3 = dist
+    r = np.linspace(0, MAX_RADIUS, 4001)
+    r2 = r ** 2
+    # derivative of r * (1 + k1 r^2 + k2 r^4 + k3 r^6)
+    slope = 1 + 3 * k1 * r2 + 5 * k2 * r2 ** 2 + 7 * k3 * r2 ** 3
+    decreasing = np.flatnonzero(slope <= 0)
+    return r[decreasing[0] - 1] if decreasing.size > 0 else MAX_RADIUS
+
+
+class CameraProjector:
+    """
+    Projection of lidar frames into all cameras at once: the points are transformed into the coordinates of every
+    camera in one pass, projected with the pinhole model and the distortion of each camera, and of the points
+    falling on the same pixel the nearest one is kept
+    """
+    def __init__(self, calibrations, min_depth=0.1):
+        """
+        :param calibrations: calibration of each camera as returned by read_calibration
+        :param min_depth: minimum distance of the points in front of a camera [m]
+        """
+        self.rotation = np.stack([calibration['rotation'] for calibration in calibrations])
+        self.translation = np.stack([calibration['translation'] for calibration in calibrations])
+        self.camera_mat = np.stack([calibration['camera_mat'] for calibration in calibrations])
+        self.dist = np.stack([calibration['dist'] for calibration in calibrations])
+        self.image_size = np.array([calibration['image_size'] for calibration in calibrations], dtype=np.int64)
+        self.max_r2 = np.array([max_radius(dist) ** 2 for dist in self.dist])
+        self.min_depth = min_depth
+
+    def __len__(self):
+        return len(self.rotation)
+
+    def project(self, xyz):
+        """
+        :param xyz: [N x 3] points in lidar coordinates
+        :return: camera, pixel (row * width + column) and depth of the nearest point of each pixel hit, and the
+                 index of that point, sorted by camera and pixel
+        """
+        xyz = np.asarray(xyz, dtype=np.float64)
+        # [cameras x N x 3]
+        points = np.einsum('cij,nj->cni', self.rotation, xyz) + self.translation[:, None, :]
+        depth = points[..., 2]
+        valid = depth > self.min_depth
+        z = np.where(valid, depth, 1.)
+        x = points[..., 0] / z
+        y = points[..., 1] / z
+        r2 = x ** 2 + y ** 2
+        valid &= r2 < self.max_r2[:, None]
+
+        k1, k2, p1, p2, k3 = (self.dist[:, i, None] for i in range(5))
+        radial = 1 + k1 * r2 + k2 * r2 ** 2 + k3 * r2 ** 3
+        xd = x * radial + 2 * p1 * x * y + p2 * (r2 + 2 * x ** 2)
+        yd = y * radial + p1 * (r2 + 2 * y ** 2) + 2 * p2 * x * y
+        K = self.camera_mat
+        u = K[:, 0, 0, None] * xd + K[:, 0, 1, None] * yd + K[:, 0, 2, None]
+        v = K[:, 1, 1, None] * yd + K[:, 1, 2, None]
+
+        # pixel centers are at integer coordinates
+        width, height = self.image_size[:, 0, None], self.image_size[:, 1, None]
+        valid &= (u > -0.5) & (u < width - 0.5) & (v > -0.5) & (v < height - 0.5)
+        cameras, indices = np.nonzero(valid)
+        columns = np.floor(u[valid] + 0.5).astype(np.int64)
+        rows = np.floor(v[valid] + 0.5).astype(np.int64)
+        pixels = rows * self.image_size[cameras, 0] + columns
+        depth = depth[valid]
+
+        # scatter min: first point of each pixel of each camera after sorting by pixel and depth
+        keys = cameras * int(np.prod(self.image_size, axis=1).max()) + pixels
+        order = np.lexsort((depth, keys))
+        first = order[np.flatnonzero(np.diff(keys[order], prepend=-1) != 0)]
+        return cameras[first], pixels[first], depth[first], indices[first]
+
+    def depth_maps(self, xyz):
+        """
+        :return: sparse depth map of each camera: camera_start [cameras + 1] into pixels and depth, the sorted
+                 pixels (row * width + column) with a point and their depth [m]
+        """
+        cameras, pixels, depth, _ = self.project(xyz)
+        return {'camera_start': np.searchsorted(cameras, np.arange(len(self) + 1)).astype(np.int64),
+                'pixels': pixels.astype(np.uint32), 'depth': depth.astype(np.float32),
+                'image_size': self.image_size}
+
+
+def write_depth(path, depth_maps):
+    np.savez_compressed(path, **depth_maps)
+
+
+def read_depth(path, camera=None):
+    """
+    Read the depth maps written by write_depth
+    :param camera: id of the camera, None for all cameras
+    :return: dense depth map [height x width] of the camera, 0 where there is no point, or list of those of all
+             cameras
+    """
+    with np.load(path) as data:
+        depth_maps = {name: data[name] for name in data.files}
+    cameras = range(len(depth_maps['image_size'])) if camera is None else [camera]
+    dense = []
+    for j in cameras:
+        width, height = depth_maps['image_size'][j]
+        start, end = depth_maps['camera_start'][j], depth_maps['camera_start'][j + 1]
+        image = np.zeros(height * width, dtype=np.float32)
+        image[depth_maps['pixels'][start:end]] = depth_maps['depth'][start:end]
+        dense.append(image.reshape(height, width))
+    return dense if camera is None else dense[0]
+
+
+def depth_path(out_dir, lidar_txt):
+    """
+    :param lidar_txt: lidar_txt of an entry of data_all.pkl, {scene}/data_txt/{frame_nr}_{time}.txt
+    :return: path of the depth maps of the lidar frame
+    """
+    scene_name, _, txt_name = Path(lidar_txt.replace("\\", "/")).parts[-3:]
+    return Path(out_dir) / scene_name / DEPTH_DIR / (Path(txt_name).stem + ".npz")
+
+
+def scene_frames(dataset):
+    """
+    :return: dict of the lidar frames of each scene as list of (position of an entry of the frame in the dataset,
+             lidar_txt), each frame matched with several imgs is projected once
+    """
+    scenes = {}
+    seen = set()
+    for i in range(len(dataset)):
+        lidar_txt = dataset.entry(i)['lidar_txt']
+        if lidar_txt in seen:
+            continue
+        seen.add(lidar_txt)
+        scene_name = Path(lidar_txt.replace("\\", "/")).parts[-3]
+        scenes.setdefault(scene_name, []).append((i, lidar_txt))
+    return scenes
+
+
+# dataset and projector of a worker process
+worker = {}
+
+
+def init_worker(dataset, projector):
+    worker['dataset'] = dataset
+    worker['projector'] = projector
+
+
+def project_scene(frames, out_dir, overwrite=False):
+    """
+    Project the lidar frames of a scene into all cameras and write their depth maps
+    :param frames: list of (position in the dataset, lidar_txt) of the frames
+    :return: number of frames written
+    """
+    dataset, projector = worker['dataset'], worker['projector']
+    written = 0
+    for i, lidar_txt in frames:
+        path = depth_path(out_dir, lidar_txt)
+        if path.exists() and not overwrite:
+            continue
+        os.makedirs(path.parent.absolute(), exist_ok=True)
+        try:
+            frame = dataset.load_frame(i)
+        except Exception as ex:
+            print(str(ex))
+            continue
+        write_depth(path, projector.depth_maps(frame['xyz']))
+        written += 1
+    return written
+
+
+def main(args):
+    projector = CameraProjector([read_calibration(path, args['lidar_to_camera']) for path in args['calibration']],
+                                args['min_depth'])
+    dataset = LidarDataset(args['pkl'], args['lidar_path'], cache_mb=0)
+    out_dir = args['out_dir'] or args['lidar_path']
+    scenes = scene_frames(dataset)
+
+    written = 0
+    if args['workers'] <= 1:
+        init_worker(dataset, projector)
+        for scene_name in tqdm(scenes):
+            written += project_scene(scenes[scene_name], out_dir, args['overwrite'])
+    else:
+        # each worker process opens the frames of the scenes it projects
+        with ProcessPoolExecutor(max_workers=args['workers'], initializer=init_worker,
+                                 initargs=(dataset, projector)) as pool:
+            futures = {pool.submit(project_scene, frames, out_dir, args['overwrite']): scene_name
+                       for scene_name, frames in scenes.items()}
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                try:
+                    written += future.result()
+                except Exception as ex:
+                    print("{}: {}".format(futures[future], str(ex)))
+    print("depth maps of {} of {} lidar frames written".format(written, sum(len(frames) for frames in scenes.values())))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--pkl', type=str, default='data_all.pkl',
+                        help="Path of data_all.pkl or of its columnar index data_index.npz")
+    parser.add_argument('-lp', '--lidar_path', type=str, help="Path of the lidar data", required=True)
+    parser.add_argument('-c', '--calibration', type=str, nargs='+', required=True,
+                        help="Paths of the Autoware calibration files of camera_0, camera_1, ... in this order")
+    parser.add_argument('-o', '--out_dir', type=str, default=None,
+                        help="Path of the output directory, by default the depth maps are written next to the frames "
+                             "into {scene}/data_depth of the lidar path")
+    parser.add_argument('-w', '--workers', type=int, default=1, help="Number of scenes projected at the same time")
+    parser.add_argument('--min_depth', type=float, default=0.1,
+                        help="Minimum distance of the points in front of a camera [m]")
+    parser.add_argument('--lidar_to_camera', action='store_true',
+                        help="CameraExtrinsicMat transforms lidar into camera coordinates instead of being the pose "
+                             "of the camera in the lidar coordinate system")
+    parser.add_argument('--overwrite', action='store_true', help="Project the frames which have depth maps again")
+
+    args = vars(parser.parse_args())
+    main(args)
@@ -0,0 +1,86 @@
+import numpy as np
+
+from pcd import write_organized_pcd
+
+
+RANGE_IMAGE_FORMATS = ('npy', 'pcd')
+
+# channels of each pixel of a range image, a range of 0 means no return
+RANGE_IMAGE_DTYPE = np.dtype([('range', '<f4'), ('intensity', 'u1'), ('azimuth', '<f4'), ('timestamp', '<f8')])
+
+
+class RangeImage:
+    """
+    Organized [rings x ceil(360 / resolution)] image of a frame, row r holds the ring with the r-th highest
+    vertical angle and column c the azimuths [c * resolution, (c + 1) * resolution). The image is allocated
+    once and refilled for every frame, the neighbours of a point are the adjacent pixels.
+    """
+    def __init__(self, omega, resolution=0.36):
+        """
+        :param omega: vertical angle of each laser [degree]
+        :param resolution: azimuth covered by each column [degree]
+        """
+        omega = np.asarray(omega)
+        # row of each laser, the highest laser is on top
+        self.rows = np.argsort(np.argsort(-omega, kind='stable'))
+        self.omega = np.sort(omega)[::-1]
+        self.resolution = resolution
+        self.width = int(np.ceil(360. / resolution))
+        self.image = np.zeros((len(omega), self.width), dtype=RANGE_IMAGE_DTYPE)
+
+    def fill(self, frame):
+        """
+        Fill the image with the points of a frame, of several returns in the same pixel the nearest one is kept
+        :param frame: structured array with the fields laser_id, horizontal_angle, distance, intensity, timestamp
+        :return: the image
+        """
+        self.image.fill(0)
+        valid = frame['distance'] > 0
+        rows = self.rows[frame['laser_id'][valid]]
+        cols = (np.floor(frame['horizontal_angle'][valid] / self.resolution).astype(np.int64)) % self.width
+        distances = frame['distance'][valid]
+
+        # first point of each pixel after sorting by pixel and distance
+        pixels = rows * self.width + cols
+        order = np.lexsort((distances, pixels))
+        first = order[np.flatnonzero(np.diff(pixels[order], prepend=-1) != 0)]
+        image = self.image.reshape(-1)
+        image['range'][pixels[first]] = distances[first]
+        image['intensity'][pixels[first]] = frame['intensity'][valid][first]
+        image['azimuth'][pixels[first]] = frame['horizontal_angle'][valid][first]
+        image['timestamp'][pixels[first]] = frame['timestamp'][valid][first]
+        return self.image
+
+    def xyz(self, image=None):
+        """
+        :return: X, Y, Z [rings x width] of the pixels, NaN for pixels without return
+        """
+        image = self.image if image is None else image
+        distances = np.where(image['range'] > 0, image['range'], np.nan)
+        alpha = np.radians(self.omega)[:, None]
+        theta = np.radians(image['azimuth'])
+        X = distances * np.cos(alpha) * np.cos(theta)
+        Y = distances * np.cos(alpha) * np.sin(-theta)
+        Z = distances * np.sin(alpha)
+        return X, Y, Z
+
+
+def check_range_image_format(fmt):
+    if fmt not in RANGE_IMAGE_FORMATS:
+        raise ValueError('unknown range-image-format {}, expected one of {}'.format(
+            fmt, ', '.join(RANGE_IMAGE_FORMATS)))
+
+
+def write_range_image(path, range_image, image=None, fmt='npy', data='binary'):
+    """
+    Write a range image as .npy file of RANGE_IMAGE_DTYPE or as organized PCD file of HEIGHT rings
+    :param image: image filled by range_image, by default its current one
+    :param data: DATA format of PCD files
+    """
+    check_range_image_format(fmt)
+    image = range_image.image if image is None else image
+    if fmt == 'npy':
+        np.save(path, image)
+    else:
+        X, Y, Z = range_image.xyz(image)
+        write_organized_pcd(path, X, Y, Z, image['intensity'], data)
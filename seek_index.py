@@ -0,0 +1,76 @@
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+# entry of the seek index of a pcap file: ordinal and byte offset of the record of a data packet, its capture
+# time and the number of roll overs before it, i.e. of frames finished when reading the file from its start
+SEEK_INDEX_DTYPE = np.dtype([('ordinal', '<i8'), ('offset', '<i8'), ('timestamp', '<f8'), ('frames', '<i8')])
+
+SEEK_INDEX_SUFFIX = ".seek.npz"
+
+
+def seek_index_path(pcap_path):
+    """
+    :return: path of the seek index stored next to a pcap file
+    """
+    return Path(str(pcap_path) + SEEK_INDEX_SUFFIX)
+
+
+def save_seek_index(pcap_path, port, entries):
+    """
+    Store the seek index next to the pcap file together with the size and mtime of the file it belongs to
+    """
+    stat = os.stat(pcap_path)
+    try:
+        with open(seek_index_path(pcap_path), 'wb') as f:
+            np.savez(f, entries=entries, size=stat.st_size, mtime=stat.st_mtime_ns, port=port)
+    except Exception as ex:
+        print(str(ex))
+
+
+def load_seek_index(pcap_path, port):
+    """
+    :return: entries of the seek index of a pcap file, None if there is none or it belongs to another file or port
+    """
+    path = seek_index_path(pcap_path)
+    if not path.exists():
+        return None
+    stat = os.stat(pcap_path)
+    try:
+        with np.load(path) as data:
+            if (int(data['size']), int(data['mtime']), int(data['port'])) != (stat.st_size, stat.st_mtime_ns, port):
+                return None
+            return data['entries']
+    except Exception as ex:
+        print(str(ex))
+        return None
+
+
+def entry_before_frame(entries, roll_over):
+    """
+    :param roll_over: number of the roll over starting a frame, counted from the start of the file
+    :return: last entry before the roll over, None if there is none
+    """
+    pos = np.searchsorted(entries['frames'], roll_over, side='left') - 1
+    return entries[pos] if pos >= 0 else None
+
+
+def entry_before_time(entries, timestamp):
+    """
+    :return: last entry before the start of the frame in progress at timestamp, None if there is none
+    """
+    pos = np.searchsorted(entries['timestamp'], timestamp, side='right') - 1
+    if pos < 0:
+        return None
+    # the frame in progress started at the roll over following the last entry of fewer frames
+    return entry_before_frame(entries, entries['frames'][pos])
+
+
+def entry_before_packet(entries, ordinal):
+    """
+    :return: last entry at or before a packet, None if there is none
+    """
+    pos = np.searchsorted(entries['ordinal'], ordinal, side='right') - 1
+    return entries[pos] if pos >= 0 else None
@@ -0,0 +1,138 @@
+import argparse
+import datetime
+import os
+from pathlib import Path
+
+import numpy as np
+from tqdm import tqdm
+
+import lidar
+from pcap_reader import PcapWriter, udp_headers
+
+
+# time of one LSC16 data packet: 24 sequences of 16 firings of 3.125 μs each
+PACKET_PERIOD = 24 * 16 * 3.125E-6
+
+# time of the first synthetic packet (2023-03-06 00:00:00 Beijing time)
+START_TIME = 1678032000.
+
+
+def make_packets(n_packets, first_packet=0, frequency=10., zero_ratio=0.1, seed=0):
+    """
+    Make valid LSC16 data packets of a synthetic scene, a room of varying radius with a floor 1.5 m below the lidar
+    :param first_packet: number of the first packet, consecutive calls continue the rotation of the lidar
+    :param frequency: rotation frequency of the lidar [Hz], 5, 10 or 20
+    :param zero_ratio: fraction of firings without return besides those out of range
+    :return: timestamp of each packet, [N x 1206] uint8 array of packets
+    """
+    rng = np.random.default_rng((seed, first_packet))
+    lsc16 = lidar.LSC16()
+    packets = np.zeros(n_packets, dtype=lidar.PACKET_DTYPE)
+    blocks = packets['blocks']
+
+    # azimuth of each block, 12 blocks per packet
+    block_nr = (first_packet + np.arange(n_packets))[:, None] * 12 + np.arange(12)
+    azimuth = (block_nr * (360. * frequency * PACKET_PERIOD / 12)) % 360.
+    blocks['flag'] = 0xeeff
+    blocks['azimuth'] = np.round(azimuth * 100).astype(np.int64) % 36000
+
+    # distance of each firing [m], each block holds two sequences of the 16 lasers
+    theta = np.radians(azimuth)[:, :, None]
+    omega = np.radians(np.tile(lsc16.omega, 2))
+    radius = 8. + 3. * np.sin(3. * theta) + 1.5 * np.cos(7. * theta)
+    wall = radius / np.cos(omega)
+    floor = np.where(omega < 0, 1.5 / np.sin(-np.minimum(omega, -1E-6)), np.inf)
+    distances = np.minimum(wall, floor) + rng.normal(0., 0.02, wall.shape)
+    units = np.round(distances / (lsc16.FACTOR_MM2CM * lsc16.FACTOR_CM2M))
+    units[(units <= 0) | (units > 0xffff) | (rng.random(units.shape) < zero_ratio)] = 0
+    blocks['firings']['distance'] = units
+    intensity = 40. + 160. * np.exp(-distances / 20.) + rng.normal(0., 10., wall.shape)
+    blocks['firings']['intensity'] = np.where(units > 0, np.clip(intensity, 0, 255), 0)
+
+    timestamps = START_TIME + (first_packet + np.arange(n_packets)) * PACKET_PERIOD
+    packets['timestamp'] = np.round((timestamps % 3600) * 1E6).astype(np.int64)
+    packets['factory'] = 0x1037
+    return timestamps, packets.view(np.uint8).reshape(n_packets, lidar.PACKET_SIZE)
+
+
+def write_pcap(path, n_packets, port=2369, device_port=2368, device_every=50, frequency=10., chunk_size=10000,
+               seed=0):
+    """
+    Write a pcap file of synthetic LSC16 data packets
+    :param port: data-port of the data packets
+    :param device_port: port of the device packets interleaved with the data packets, their payload is random
+    :param device_every: one device packet is written after this number of data packets, 0 writes none
+    :return: number of data packets written
+    """
+    data_headers = udp_headers(port)
+    device_headers = udp_headers(device_port)
+    rng = np.random.default_rng(seed)
+    with PcapWriter(path, port) as writer:
+        for first in tqdm(range(0, n_packets, chunk_size), desc=Path(path).name):
+            timestamps, payloads = make_packets(min(chunk_size, n_packets - first), first, frequency, seed=seed)
+            headers = np.tile(data_headers, (len(timestamps), 1))
+            if device_every > 0:
+                # device packets are inserted after every device_every-th data packet
+                at = np.arange(device_every - first % device_every, len(timestamps) + 1, device_every)
+                at = at[at <= len(timestamps)]
+                timestamps = np.insert(timestamps, at, timestamps[at - 1] + PACKET_PERIOD / 2)
+                payloads = np.insert(payloads, at, rng.integers(0, 256, (len(at), lidar.PACKET_SIZE)), axis=0)
+                headers = np.insert(headers, at, device_headers, axis=0)
+            writer.write(timestamps, payloads, headers)
+    return n_packets
+
+
+def write_data_tree(root, scenes=3, frames=300, camera_num=4, seed=0):
+    """
+    Write a synthetic imgs and lidar directory tree of data_pkl.py, all files are empty
+    :param root: output dir, the imgs are written to root/imgs and the lidar data to root/lidar
+    :param scenes: number of scenes
+    :param frames: number of imgs of each camera and lidar frames of each scene, all recorded at 10 Hz
+    :return: number of files written
+    """
+    rng = np.random.default_rng(seed)
+    n_files = 0
+    for i in range(scenes):
+        scene_name = "indoor_{}".format(i) if i % 2 == 0 else "outdoor_{}".format(i)
+        imgs_path = Path(root) / "imgs" / "imgs_{}".format(scene_name)
+        txt_path = Path(root) / "lidar" / "lidar_{}".format(scene_name) / "data_txt"
+        os.makedirs(imgs_path.absolute(), exist_ok=True)
+        os.makedirs(txt_path.absolute(), exist_ok=True)
+
+        start = START_TIME + i * 3600.
+        for cam_id in range(camera_num):
+            # cameras are not triggered together, each one has its own offset and jitter
+            timestamps = start + np.arange(frames) * 0.1 + rng.uniform(0., 0.05) + rng.normal(0., 0.005, frames)
+            for timestamp in timestamps:
+                open(imgs_path / "{:.6f}_{}.jpg".format(timestamp, cam_id), 'wb').close()
+        # lidar data is named in local time, as data_pkl.py parses it
+        timestamps = start + np.arange(frames) * 0.1 + rng.uniform(0., 0.1)
+        for frame_nr, timestamp in enumerate(timestamps):
+            curr_time = str(datetime.datetime.fromtimestamp(round(timestamp, 6))).replace(":", "-").replace(" ", "_")
+            if "." not in curr_time:
+                curr_time += ".000000"
+            open(txt_path / "{}_{}.txt".format(frame_nr, curr_time), 'wb').close()
+        n_files += frames * (camera_num + 1)
+    return n_files
+
+
+def main(args):
+    if args['pcap']:
+        write_pcap(args['pcap'], args['packets'], args['port'], frequency=args['frequency'])
+    if args['tree']:
+        write_data_tree(args['tree'], args['scenes'], args['frames'])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pcap', type=str, default=None, help="Path of a synthetic pcap file to write")
+    parser.add_argument('-n', '--packets', type=int, default=10000, help="Number of data packets of the pcap file")
+    parser.add_argument('--port', type=int, default=2369, help="data-port of the data packets")
+    parser.add_argument('--frequency', type=float, default=10., help="Rotation frequency of the lidar [Hz]")
+    parser.add_argument('--tree', type=str, default=None,
+                        help="Path of a synthetic imgs and lidar directory tree for data_pkl.py to write")
+    parser.add_argument('--scenes', type=int, default=3, help="Number of scenes of the directory tree")
+    parser.add_argument('--frames', type=int, default=300, help="Number of frames of each scene and camera")
+
+    args = vars(parser.parse_args())
+    main(args)
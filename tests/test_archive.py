@@ -0,0 +1,126 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import archive
+import synthetic
+from archive import ARCHIVE_FILE, ArchiveReader, ArchiveWriter, decode_points, encode_points
+from frame_buffer import COMPACT_FRAME_DTYPE, FRAME_DTYPE
+from lidar_manager import LSLidarManager
+from main import read_params
+
+PARAMS_PATH = Path(__file__).resolve().parent.parent / "params.yaml"
+
+
+def make_frames(dtype, sizes=(500, 0, 1, 700, 300, 450), seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    start = 1678032000.
+    for size in sizes:
+        frame = np.zeros(size, dtype=dtype)
+        for name in dtype.names:
+            kind = dtype[name].kind
+            if kind == 'f':
+                frame[name] = rng.normal(size=size) * 10
+            else:
+                frame[name] = rng.integers(0, np.iinfo(dtype[name]).max, size)
+        frame['timestamp'] = start + np.sort(rng.random(size)) * 0.1
+        start += 0.1
+        frames.append(frame)
+    return frames
+
+
+def codecs():
+    return [codec for codec in archive.ARCHIVE_CODECS
+            if not (codec == 'zstd' and archive.zstandard is None or codec == 'lz4' and archive.lz4 is None)]
+
+
+@pytest.mark.parametrize('dtype', [FRAME_DTYPE, COMPACT_FRAME_DTYPE])
+def test_encode_points(dtype):
+    points = np.concatenate(make_frames(dtype))
+    points['x'][[3, 10]] = [np.nan, -np.inf]
+    decoded = decode_points(encode_points(points), dtype, len(points))
+    assert decoded.tobytes() == points.tobytes()
+
+
+@pytest.mark.parametrize('codec', codecs())
+@pytest.mark.parametrize('chunk_frames', [1, 4])
+@pytest.mark.parametrize('dtype', [FRAME_DTYPE, COMPACT_FRAME_DTYPE])
+def test_round_trip(tmp_path, codec, chunk_frames, dtype):
+    frames = make_frames(dtype)
+    writer = ArchiveWriter(tmp_path, dtype, codec=codec, chunk_frames=chunk_frames)
+    for frame_nr, frame in enumerate(frames):
+        writer.write(10 + frame_nr, frame)
+    writer.close()
+
+    with ArchiveReader(tmp_path) as reader:
+        assert reader.dtype == dtype and reader.codec == codec
+        assert len(reader) == len(frames)
+        # random access within and across chunks
+        for frame_nr in (13, 10, 15, 11, 12, 14):
+            np.testing.assert_array_equal(reader.frame(frame_nr), frames[frame_nr - 10])
+        assert reader.frame(9) is None
+        timestamps = reader.index['timestamp']
+        selected = reader.time_range(timestamps[2], timestamps[4])
+        assert [frame_nr for frame_nr, _ in selected] == [12, 13, 14]
+        for frame_nr, points in selected:
+            np.testing.assert_array_equal(points, frames[frame_nr - 10])
+
+
+def test_append(tmp_path):
+    frames = make_frames(FRAME_DTYPE)
+    writer = ArchiveWriter(tmp_path, FRAME_DTYPE, chunk_frames=2)
+    for frame_nr in range(3):
+        writer.write(frame_nr, frames[frame_nr])
+    writer.close()
+
+    writer = ArchiveWriter(tmp_path, FRAME_DTYPE, chunk_frames=2, append=True)
+    assert writer.frames == {0, 1, 2}
+    for frame_nr in range(3, len(frames)):
+        writer.write(frame_nr, frames[frame_nr])
+    writer.close()
+
+    with ArchiveReader(tmp_path) as reader:
+        assert list(reader.index['frame']) == list(range(len(frames)))
+        for frame_nr, frame in enumerate(frames):
+            np.testing.assert_array_equal(reader.frame(frame_nr), frame)
+
+
+def test_incomplete_archive(tmp_path):
+    frames = make_frames(FRAME_DTYPE)
+    writer = ArchiveWriter(tmp_path, FRAME_DTYPE)
+    for frame_nr, frame in enumerate(frames):
+        writer.write(frame_nr, frame)
+    writer.close()
+    path = tmp_path / ARCHIVE_FILE
+    with open(path, 'r+b') as f:
+        f.truncate(path.stat().st_size - 5)
+    with pytest.raises(ValueError):
+        ArchiveReader(tmp_path)
+
+    # an archive without footer is started over
+    writer = ArchiveWriter(tmp_path, FRAME_DTYPE, append=True)
+    assert writer.frames == set()
+    writer.write(0, frames[0])
+    writer.close()
+    with ArchiveReader(tmp_path) as reader:
+        assert len(reader) == 1
+        np.testing.assert_array_equal(reader[0], frames[0])
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_extraction(tmp_path, compact):
+    pcap_path = tmp_path / "seq.pcap"
+    synthetic.write_pcap(pcap_path, 1000)
+    params = dict(read_params(PARAMS_PATH), txt=False, pcd=False, npy=True, archive=True, compact=compact,
+                  resume=False, **{'archive-chunk-frames': 3})
+    LSLidarManager(pcap_path, tmp_path / "out", params).run(progress=lambda n: None)
+
+    npy_path = tmp_path / "out" / "seq" / "data_npy"
+    names = sorted(os.listdir(npy_path), key=lambda name: int(name.split("_")[0]))
+    with ArchiveReader(tmp_path / "out" / "seq" / "data_archive") as reader:
+        assert list(reader.index['frame']) == [int(name.split("_")[0]) for name in names]
+        for name in names:
+            np.testing.assert_array_equal(reader.frame(int(name.split("_")[0])), np.load(npy_path / name))
@@ -0,0 +1,54 @@
+import numpy as np
+
+from data_index import DataIndex, write_index
+
+
+def entry(scene, timestamp):
+    lidar_scene = scene.replace("imgs", "lidar")
+    return {'img1': "{}/{:.6f}_1.jpg".format(scene, timestamp), 'img2': "{}/{:.6f}_2.jpg".format(scene, timestamp),
+            'img3': "{}/{:.6f}_3.jpg".format(scene, timestamp),
+            'lidar_txt': "{}/data_txt/0_{:.6f}.txt".format(lidar_scene, timestamp),
+            'lidar_pcd': "{}/data_pcd/0_{:.6f}.pcd".format(lidar_scene, timestamp)}
+
+
+def make_data_dict(scenes):
+    data_dict = {}
+    for scene, timestamps in scenes.items():
+        for timestamp in timestamps:
+            data_dict["{}/{:.6f}_0.jpg".format(scene, timestamp)] = entry(scene, timestamp)
+    return data_dict
+
+
+def test_scene_name_prefix_of_another_scene(tmp_path):
+    # '-' sorts before '/', so sorting by img0 key alone interleaves the entries of both scenes
+    scenes = {'imgs_outdoor_zhensheng_north': [1678032000.5, 1678032001.5, 1678032002.5],
+              'imgs_outdoor_zhensheng_north-N1_north': [1678032000.0, 1678032001.0, 1678032002.0, 1678032003.0]}
+    data_dict = make_data_dict(scenes)
+    path = tmp_path / "data_index.npz"
+    write_index(path, data_dict)
+    index = DataIndex(path)
+
+    assert len(index) == len(data_dict)
+    for scene, timestamps in scenes.items():
+        keys = [index.key(i) for i in index.scene_range(scene)]
+        assert keys == sorted("{}/{:.6f}_0.jpg".format(scene, timestamp) for timestamp in timestamps)
+        assert [index.key(i) for i in index.select(scene=scene)] == keys
+    for key, value in data_dict.items():
+        assert index.find(key) is not None
+        assert index.entry(index.find(key)) == value
+    assert dict(index.as_dict()) == data_dict
+    assert index.find('imgs_outdoor_zhensheng_north/0.000000_0.jpg') is None
+
+
+def test_select_split_and_time(tmp_path):
+    scenes = {'imgs_indoor_fengyu': [10.0, 11.0, 12.0], 'imgs_indoor_N7_floor_1': [10.5, 11.5],
+              'imgs_indoor_unknown': [11.0]}
+    path = tmp_path / "data_index.npz"
+    write_index(path, make_data_dict(scenes))
+    index = DataIndex(path)
+
+    assert [index.key(i) for i in index.select(split='train')] == \
+        ["imgs_indoor_fengyu/{:.6f}_0.jpg".format(t) for t in (10.0, 11.0, 12.0)]
+    assert [index.key(i) for i in index.select(split='test', start=11.0)] == ["imgs_indoor_N7_floor_1/11.500000_0.jpg"]
+    assert len(index.select(start=10.6, end=11.0)) == 2
+    assert np.array_equal(index.select(scene=[]), np.zeros(0, dtype=np.int64))
@@ -0,0 +1,146 @@
+import os
+import pickle
+import shutil
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import synthetic
+from data_pkl import generate_data_pkl, parse_lidar_timestamps
+
+
+def lidar_timestamp(name):
+    """
+    :return: timestamp of the local time in the name of lidar data, as parsed by the original data_pkl.py
+    """
+    name_list = os.path.splitext(name)[0].split("_")
+    return datetime.timestamp(datetime.strptime("{}_{}".format(name_list[1], name_list[2]), '%Y-%m-%d_%H-%M-%S.%f'))
+
+
+def baseline_data_dict(imgs_path, lidar_path, camera_num=4):
+    """
+    data_dict of the original matching: the nearest timestamp of each camera and of the lidar data is found by
+    argmin over all timestamps of the scene for every img of camera_0
+    """
+    data_dict = {}
+    for scene_name in sorted(os.listdir(imgs_path)):
+        names = sorted(os.listdir(os.path.join(imgs_path, scene_name)))
+        tp = {str(j): np.array([float(name.split("_")[0]) for name in names
+                                if os.path.splitext(name)[0].split("_")[1] == str(j)]) for j in range(camera_num)}
+        lidar_scene_name = scene_name.replace("imgs", "lidar")
+        lidar_names = sorted(os.listdir(os.path.join(lidar_path, lidar_scene_name, "data_txt")))
+        lidar_tp = np.array([lidar_timestamp(name) for name in lidar_names])
+        # of equal timestamps the last name is kept
+        lidar_by_tp = {timestamp: name for timestamp, name in zip(lidar_tp, lidar_names)}
+
+        for img0_name in (name for name in names if os.path.splitext(name)[0].split("_")[1] == "0"):
+            img0_key = os.path.join(scene_name, img0_name)
+            img0_tp = float(img0_name.split("_")[0])
+            data_dict[img0_key] = {}
+            for i in range(1, camera_num):
+                img_tp = tp[str(i)][np.argmin(np.absolute(tp[str(i)] - img0_tp))]
+                data_dict[img0_key]["img{}".format(i)] = os.path.join(scene_name, "{:.6f}_{}.jpg".format(img_tp, i))
+            lidar_name = lidar_by_tp[lidar_tp[np.argmin(np.absolute(lidar_tp - img0_tp))]]
+            data_dict[img0_key]["lidar_txt"] = os.path.join(lidar_scene_name, "data_txt", lidar_name)
+            data_dict[img0_key]["lidar_pcd"] = os.path.join(lidar_scene_name, "data_pcd",
+                                                            lidar_name.replace("txt", "pcd"))
+    return data_dict
+
+
+@pytest.fixture(scope='module')
+def data_tree(tmp_path_factory):
+    root = tmp_path_factory.mktemp("data_tree")
+    synthetic.write_data_tree(root, scenes=3, frames=60)
+    return root
+
+
+def run(root, cwd, monkeypatch, **args):
+    """
+    Run data_pkl.py in cwd
+    :return: generate_data_pkl and the data_dict of the data_all.pkl written
+    """
+    monkeypatch.chdir(cwd)
+    generator = generate_data_pkl(dict({'imgs_path': str(root / "imgs"), 'lidar_path': str(root / "lidar"),
+                                        'workers': 2}, **args))
+    with open(cwd / "data_all.pkl", 'rb') as f:
+        return generator, pickle.load(f)
+
+
+def test_parse_lidar_timestamps(data_tree):
+    names = sorted(os.listdir(data_tree / "lidar" / "lidar_indoor_0" / "data_txt"))
+    np.testing.assert_array_equal(parse_lidar_timestamps(names), [lidar_timestamp(name) for name in names])
+    assert len(parse_lidar_timestamps([])) == 0
+
+
+def test_matches_baseline(data_tree, tmp_path, monkeypatch):
+    _, data_dict = run(data_tree, tmp_path, monkeypatch)
+    expected = baseline_data_dict(str(data_tree / "imgs"), str(data_tree / "lidar"))
+    assert len(data_dict) == 3 * 60
+    assert data_dict == expected
+
+
+def test_ties_take_the_earlier_timestamp():
+    generator = generate_data_pkl.__new__(generate_data_pkl)
+    generator.max_offset = None
+    tp_array = np.array([1., 2., 4.])
+    matched, _ = generator.match_timestamps(tp_array, np.array([0., 1.5, 3., 3.5, 9.]))
+    np.testing.assert_array_equal(matched, [1., 1., 2., 4., 4.])
+    # the same as the argmin of the original matching
+    np.testing.assert_array_equal(matched, [tp_array[np.argmin(np.absolute(tp_array - query))]
+                                            for query in (0., 1.5, 3., 3.5, 9.)])
+
+
+def test_max_offset(data_tree, tmp_path, monkeypatch):
+    expected = baseline_data_dict(str(data_tree / "imgs"), str(data_tree / "lidar"))
+    # largest offset of the imgs and lidar data matched with each img of camera_0
+    offsets = {}
+    for img0_key, value in expected.items():
+        img0_tp = float(os.path.basename(img0_key).split("_")[0])
+        tps = [float(os.path.basename(value["img{}".format(i)]).split("_")[0]) for i in range(1, 4)]
+        tps.append(lidar_timestamp(os.path.basename(value['lidar_txt'])))
+        offsets[img0_key] = max(abs(tp - img0_tp) for tp in tps)
+    max_offset = float(np.median(list(offsets.values())))
+
+    _, data_dict = run(data_tree, tmp_path, monkeypatch, max_offset=max_offset)
+    assert sorted(data_dict) == sorted(key for key, offset in offsets.items() if offset <= max_offset)
+    assert 0 < len(data_dict) < len(expected)
+    for img0_key, value in data_dict.items():
+        assert value == expected[img0_key]
+
+
+def scanned(generator):
+    return sorted(name for index in (generator.imgs_index, generator.lidar_index) for name, scene in index.items()
+                  if scene['scanned'])
+
+
+def test_incremental_rebuild(data_tree, tmp_path, monkeypatch):
+    root = tmp_path / "tree"
+    shutil.copytree(data_tree, root)
+    cache = str(tmp_path / "cache.pkl")
+    os.makedirs(tmp_path / "cached")
+    os.makedirs(tmp_path / "uncached")
+
+    generator, data_dict = run(root, tmp_path / "cached", monkeypatch, cache=cache)
+    assert len(scanned(generator)) == 6
+    generator, cached = run(root, tmp_path / "cached", monkeypatch, cache=cache)
+    assert scanned(generator) == [] and cached == data_dict
+
+    # a lidar frame is added to a scene, an img is removed from another one and a scene is added
+    txt_path = root / "lidar" / "lidar_indoor_0" / "data_txt"
+    name = sorted(os.listdir(txt_path))[10]
+    frame_nr, date, clock = os.path.splitext(name)[0].split("_")
+    open(txt_path / "{}_{}_{}.txt".format(frame_nr + "0", date, clock[:-1] + "7"), 'wb').close()
+    os.remove(root / "imgs" / "imgs_outdoor_1" / sorted(os.listdir(root / "imgs" / "imgs_outdoor_1"))[5])
+    shutil.copytree(root / "imgs" / "imgs_indoor_2", root / "imgs" / "imgs_indoor_4")
+    shutil.copytree(root / "lidar" / "lidar_indoor_2", root / "lidar" / "lidar_indoor_4")
+
+    generator, cached = run(root, tmp_path / "cached", monkeypatch, cache=cache)
+    assert scanned(generator) == ['imgs_indoor_4', 'imgs_outdoor_1', 'lidar_indoor_0', 'lidar_indoor_4']
+    _, rebuilt = run(root, tmp_path / "uncached", monkeypatch)
+    assert cached == rebuilt == baseline_data_dict(str(root / "imgs"), str(root / "lidar"))
+    assert cached != data_dict
+
+    # the cache of another dataset is not used
+    generator, _ = run(data_tree, tmp_path / "cached", monkeypatch, cache=cache)
+    assert len(scanned(generator)) == 6
@@ -0,0 +1,141 @@
+import os
+import pickle
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import synthetic
+from data_index import write_index
+from dataset import LidarDataset
+from lidar_manager import LSLidarManager
+from main import read_params
+
+PARAMS_PATH = Path(__file__).resolve().parent.parent / "params.yaml"
+
+START_TIME = 1678032000
+
+
+@pytest.fixture(scope='module')
+def lidar_tree(tmp_path_factory):
+    """
+    Frames of a synthetic pcap file in every format, data_all.pkl and data_index.npz of an img0 per frame
+    :return: path of data_all.pkl, data_index.npz, the lidar dir and the npy frames
+    """
+    root = tmp_path_factory.mktemp("dataset")
+    pcap_path = root / "seq.pcap"
+    synthetic.write_pcap(pcap_path, 1200)
+    params = dict(read_params(PARAMS_PATH), **{'txt': True, 'pcd': True, 'pcd-format': 'ascii', 'npy': True,
+                                               'bin': True, 'archive': True, 'archive-codec': 'zlib'})
+    LSLidarManager(pcap_path, root / "lidar", params).run(progress=lambda n: None)
+
+    data_dict = {}
+    frames = []
+    txt_names = sorted(os.listdir(root / "lidar" / "seq" / "data_txt"), key=lambda name: int(name.split("_")[0]))
+    for txt_name in txt_names:
+        frame_nr = int(txt_name.split("_")[0])
+        stem = Path(txt_name).stem
+        data_dict["imgs_seq/{}.000000_0.jpg".format(START_TIME + frame_nr)] = {
+            'img1': "imgs_seq/{}.000000_1.jpg".format(START_TIME + frame_nr),
+            'img2': "imgs_seq/{}.000000_2.jpg".format(START_TIME + frame_nr),
+            'img3': "imgs_seq/{}.000000_3.jpg".format(START_TIME + frame_nr),
+            'lidar_txt': "seq/data_txt/{}".format(txt_name), 'lidar_pcd': "seq/data_pcd/{}.pcd".format(stem)}
+        frames.append(np.load(root / "lidar" / "seq" / "data_npy" / (stem + ".npy")))
+    assert len(frames) > 8
+    pkl_path = root / "data_all.pkl"
+    with open(pkl_path, 'wb') as f:
+        pickle.dump(data_dict, f)
+    index_path = root / "data_index.npz"
+    write_index(index_path, data_dict)
+    return pkl_path, index_path, root / "lidar", frames
+
+
+def assert_frame(frame, points, atol=0., timestamps=True):
+    xyz = np.column_stack((points['x'], points['y'], points['z']))
+    np.testing.assert_allclose(frame['xyz'], xyz, rtol=0, atol=atol)
+    np.testing.assert_array_equal(frame['laser_id'], points['laser_id'])
+    np.testing.assert_allclose(frame['intensity'], points['intensity'], rtol=0, atol=0.5)
+    if timestamps:
+        np.testing.assert_allclose(frame['timestamp'], points['timestamp'], rtol=0, atol=1E-6)
+    else:
+        assert np.all(np.isnan(frame['timestamp']))
+
+
+# tolerance of the coordinates of each format, TXT files have 6 decimals, ascii PCD files float32 values
+@pytest.mark.parametrize('fmt, atol', [('bin', 0.), ('npy', 0.), ('archive', 0.), ('txt', 1E-6), ('pcd', 1E-5)])
+def test_formats(lidar_tree, fmt, atol):
+    pkl_path, _, lidar_path, frames = lidar_tree
+    dataset = LidarDataset(pkl_path, lidar_path, cache_mb=0, formats=(fmt,))
+    assert len(dataset) == len(frames)
+    for i, points in enumerate(frames):
+        assert_frame(dataset.load_frame(i), points, atol, timestamps=fmt != 'pcd')
+
+
+def test_missing_format(lidar_tree, tmp_path):
+    pkl_path, _, _, _ = lidar_tree
+    dataset = LidarDataset(pkl_path, tmp_path, cache_mb=0)
+    with pytest.raises(FileNotFoundError):
+        dataset[0]
+
+
+def test_index_order(lidar_tree):
+    pkl_path, index_path, lidar_path, frames = lidar_tree
+    by_pkl = LidarDataset(pkl_path, lidar_path, cache_mb=0)
+    by_index = LidarDataset(index_path, lidar_path, cache_mb=0)
+    # the keys of the index are decoded when they are accessed
+    assert not isinstance(by_index.keys, list)
+    assert len(by_index) == len(by_pkl)
+    assert list(by_index.keys) == list(by_pkl.keys)
+    for i in (0, len(by_index) // 2, len(by_index) - 1):
+        sample = by_index[i]
+        expected = by_pkl[i]
+        assert {name: value for name, value in sample.items() if name.startswith('img')} == \
+            {name: value for name, value in expected.items() if name.startswith('img')}
+        np.testing.assert_array_equal(sample['xyz'], expected['xyz'])
+
+
+def test_lru_cache(lidar_tree):
+    pkl_path, _, lidar_path, frames = lidar_tree
+    dataset = LidarDataset(pkl_path, lidar_path, cache_mb=0, formats=('npy',))
+    sizes = [sum(values.nbytes for values in dataset.load_frame(i).values()) for i in range(3)]
+    # room for two of the first three frames
+    dataset.cache_bytes = sizes[0] + max(sizes[1:]) + 1
+
+    first = dataset[0]['xyz']
+    dataset[1]
+    assert dataset[0]['xyz'] is first
+    dataset[2]
+    # frame 1 is the least recently used one
+    assert list(dataset.cache) == [0, 2]
+    assert dataset.cached_bytes == sizes[0] + sizes[2] <= dataset.cache_bytes
+    assert not first.flags.writeable
+
+
+def test_prefetch(lidar_tree):
+    pkl_path, _, lidar_path, frames = lidar_tree
+    dataset = LidarDataset(pkl_path, lidar_path, prefetch=3)
+    dataset[0]
+    deadline = time.time() + 10
+    while time.time() < deadline and (dataset.pending or not all(i in dataset.cache for i in range(4))):
+        time.sleep(0.01)
+    assert set(dataset.cache) == {0, 1, 2, 3}
+    assert not dataset.pending
+    for i in range(1, 4):
+        assert_frame(dataset.cache[i], frames[i])
+
+
+@pytest.mark.parametrize('index', [False, True])
+def test_pickle(lidar_tree, index):
+    pkl_path, index_path, lidar_path, frames = lidar_tree
+    dataset = LidarDataset(index_path if index else pkl_path, lidar_path, prefetch=2)
+    dataset[0]
+    assert dataset.readers and dataset.cache
+
+    # a spawned worker process gets a dataset without readers, cache and prefetch thread
+    copy = pickle.loads(pickle.dumps(dataset))
+    assert not copy.readers and not copy.archives and not copy.cache and copy.prefetch_thread is None
+    assert list(copy.keys) == list(dataset.keys)
+    sample = copy[len(copy) - 1]
+    assert sample['img0'] == dataset.keys[len(dataset) - 1]
+    assert_frame(sample, frames[-1])
@@ -0,0 +1,137 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import lidar
+import synthetic
+from frame_buffer import FRAME_DTYPE, FrameAccumulator
+from lidar_manager import LSLidarManager
+from main import read_params
+
+PARAMS_PATH = Path(__file__).resolve().parent.parent / "params.yaml"
+
+
+class FrameRecorder(LSLidarManager):
+    """
+    Manager keeping the emitted frames and the packet each one starts in instead of writing them
+    """
+    def __init__(self):
+        super().__init__("seq.pcap", None, read_params(PARAMS_PATH))
+        self.emitted = []
+
+    def emit_frame(self, frame, frame_nr, info=None):
+        self.emitted.append((frame_nr, frame.copy(), info['first_packet']))
+
+
+def roll_over(theta, last_theta):
+    """
+    Roll over check of the per packet extraction: index of the first firing after the roll over, or None
+    """
+    inside = np.flatnonzero(np.diff(theta) < 0.)
+    if inside.size > 0:
+        return inside[0] + 1
+    if theta[0] != last_theta[0] and theta[0] - last_theta[-1] < 0.:
+        return 0
+    return None
+
+
+def packet_frames(packets, timestamps):
+    """
+    Frames of the per packet extraction: each packet is decoded on its own and its points are appended to the
+    frame until the packet with the roll over, the checks start over at the packet after a roll over
+    :return: list of the frames as FRAME_DTYPE arrays of the returns with a distance
+    """
+    lsc16 = lidar.LSC16()
+    frames = []
+    parts = []
+    last_theta = None
+    for packet, timestamp in zip(packets, timestamps):
+        X, Y, Z, intensities, theta, firing_times, distances = lsc16.process_data_frame(packet.tobytes(), timestamp)
+        points = np.zeros(len(X), dtype=FRAME_DTYPE)
+        points['timestamp'] = firing_times
+        points['laser_id'] = np.tile(np.arange(lsc16.count_lasers), len(X) // lsc16.count_lasers)
+        points['x'], points['y'], points['z'] = X, Y, Z
+        points['intensity'] = intensities
+        points['vertical_angle'] = lsc16.omega[points['laser_id']]
+        points['horizontal_angle'] = theta
+        points['distance'] = distances
+        points = points[distances > 0]
+
+        if last_theta is None:
+            last_theta = theta
+        index = roll_over(theta, last_theta)
+        if index is None:
+            parts.append(points)
+            last_theta = theta
+        else:
+            split = np.searchsorted(np.flatnonzero(distances > 0), index)
+            parts.append(points[:split])
+            frames.append(np.concatenate(parts))
+            parts = [points[split:]]
+            last_theta = None
+    return frames
+
+
+def boundary_packets(n_packets, at):
+    """
+    :return: timestamps and packets with the azimuths turned so that packet 'at' starts a revolution at 0°
+    """
+    timestamps, packets = synthetic.make_packets(n_packets)
+    blocks = packets.view(lidar.PACKET_DTYPE)[:, 0]['blocks']
+    blocks['azimuth'] = (blocks['azimuth'].astype(np.int64) - int(blocks['azimuth'][at, 0])) % 36000
+    return timestamps, packets
+
+
+def assemble(packets, timestamps, batch_size):
+    recorder = FrameRecorder()
+    for i in range(0, len(packets), batch_size):
+        recorder.process_data_batch(packets[i:i + batch_size], timestamps[i:i + batch_size],
+                                    np.arange(i, min(i + batch_size, len(packets))))
+    return recorder
+
+
+def assert_frames(emitted, expected):
+    assert [frame_nr for frame_nr, _, _ in emitted] == list(range(len(expected)))
+    for (_, frame, _), points in zip(emitted, expected):
+        for name in FRAME_DTYPE.names:
+            np.testing.assert_array_equal(frame[name], points[name], err_msg=name)
+
+
+def test_accumulator_grows():
+    accumulator = FrameAccumulator(capacity=4)
+    chunks = [np.arange(n, dtype=np.float64) + 100 * k for k, n in enumerate((3, 5, 0, 9))]
+    for chunk in chunks:
+        accumulator.append(x=chunk, laser_id=np.ones(len(chunk), dtype=np.int64))
+    assert len(accumulator) == 17 and len(accumulator.buffer) >= 17
+    np.testing.assert_array_equal(accumulator.frame()['x'], np.concatenate(chunks))
+    assert np.all(accumulator.frame()['laser_id'] == 1)
+
+    accumulator.clear()
+    capacity = len(accumulator.buffer)
+    accumulator.append(x=chunks[0], laser_id=np.zeros(3, dtype=np.int64))
+    assert len(accumulator.buffer) == capacity
+    np.testing.assert_array_equal(accumulator.frame()['x'], chunks[0])
+
+
+@pytest.mark.parametrize('batch_size', [1, 7, 256, 1000])
+def test_batches_match_packets(batch_size):
+    timestamps, packets = synthetic.make_packets(700)
+    expected = packet_frames(packets, timestamps)
+    assert len(expected) > 5
+    recorder = assemble(packets, timestamps, batch_size)
+    assert_frames(recorder.emitted, expected)
+
+
+@pytest.mark.parametrize('batch_size', [1, 5, 256])
+def test_roll_over_on_packet_boundary(batch_size):
+    at = 150
+    timestamps, packets = boundary_packets(400, at)
+    theta = lidar.LSC16().read_azimuth_batch(packets)
+    assert theta[at, 0] == 0. and np.all(np.diff(theta[at]) >= 0) and theta[at - 1, -1] > theta[at, 0]
+    expected = packet_frames(packets, timestamps)
+    assert len(expected) > 3
+    recorder = assemble(packets, timestamps, batch_size)
+    assert_frames(recorder.emitted, expected)
+    # the packet at the boundary starts a frame
+    assert at in [first_packet for _, _, first_packet in recorder.emitted]
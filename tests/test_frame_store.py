@@ -0,0 +1,139 @@
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import synthetic
+from archive import ArchiveReader
+from convert import convert_sequence
+from frame_buffer import FRAME_DTYPE
+from frame_store import FrameSequenceReader, FrameSequenceWriter, INDEX_FILE, POINTS_FILE, read_txt
+from lidar_manager import LSLidarManager, frame_time, write_txt
+from main import read_params
+
+PARAMS_PATH = Path(__file__).resolve().parent.parent / "params.yaml"
+
+# decimals of the fields of TXT files
+TXT_ATOL = {'timestamp': 1E-6, 'x': 1E-6, 'y': 1E-6, 'z': 1E-6, 'horizontal_angle': 1E-3, 'distance': 1E-4}
+
+
+def make_frame(n, frame_nr=0):
+    rng = np.random.default_rng(frame_nr)
+    frame = np.zeros(n, dtype=FRAME_DTYPE)
+    frame['timestamp'] = 1678032000. + frame_nr * 0.1 + np.sort(rng.uniform(0., 0.1, n))
+    frame['laser_id'] = rng.integers(0, 16, n)
+    for name in ('x', 'y', 'z'):
+        frame[name] = rng.normal(size=n) * 10
+    frame['intensity'] = rng.integers(0, 256, n)
+    frame['horizontal_angle'] = rng.uniform(0., 360., n)
+    frame['distance'] = np.sqrt(frame['x'] ** 2 + frame['y'] ** 2 + frame['z'] ** 2)
+    return frame
+
+
+def frame_number(name):
+    return int(name.split("_")[0])
+
+
+def read_npy_dir(path):
+    return {Path(name).stem: np.load(Path(path) / name) for name in sorted(os.listdir(path))}
+
+
+def assert_txt_equal(points, expected):
+    for name in expected.dtype.names:
+        np.testing.assert_allclose(points[name], expected[name], rtol=0, atol=TXT_ATOL.get(name, 0), err_msg=name)
+
+
+def test_sequence_round_trip(tmp_path):
+    frames = {frame_nr: make_frame(n, frame_nr) for frame_nr, n in ((3, 100), (4, 0), (5, 250))}
+    writer = FrameSequenceWriter(tmp_path / "data_bin", FRAME_DTYPE)
+    for frame_nr, frame in frames.items():
+        writer.write(frame_nr, frame)
+    writer.close()
+
+    reader = FrameSequenceReader(tmp_path / "data_bin")
+    assert len(reader) == len(frames) and reader.dtype == FRAME_DTYPE
+    for frame_nr, frame in frames.items():
+        np.testing.assert_array_equal(reader[reader.find(frame_nr)], frame)
+    assert reader.find(6) is None
+    assert reader.index['timestamp'][0] == frames[3]['timestamp'][0] and np.isnan(reader.index['timestamp'][1])
+
+
+def test_append_drops_incomplete_frame(tmp_path):
+    frames = [make_frame(50 + frame_nr, frame_nr) for frame_nr in range(3)]
+    writer = FrameSequenceWriter(tmp_path, FRAME_DTYPE)
+    for frame_nr, frame in enumerate(frames[:2]):
+        writer.write(frame_nr, frame)
+    writer.close()
+    # an interrupted write leaves points without index entry and a partial index entry
+    with open(tmp_path / POINTS_FILE, 'ab') as fp:
+        fp.write(frames[2][:10].tobytes())
+    with open(tmp_path / INDEX_FILE, 'ab') as fp:
+        fp.write(b'\0' * 7)
+
+    writer = FrameSequenceWriter(tmp_path, FRAME_DTYPE, append=True)
+    assert writer.frames == {0, 1}
+    writer.write(2, frames[2])
+    writer.close()
+    reader = FrameSequenceReader(tmp_path)
+    assert len(reader) == 3
+    for frame_nr, frame in enumerate(frames):
+        np.testing.assert_array_equal(reader[frame_nr], frame)
+
+
+def test_txt_round_trip(tmp_path):
+    frame = make_frame(500)
+    path = tmp_path / "0_frame.txt"
+    write_txt(path, frame['timestamp'], frame['laser_id'], frame['x'], frame['y'], frame['z'], frame['intensity'],
+              frame['vertical_angle'], frame['horizontal_angle'], frame['distance'])
+    assert_txt_equal(read_txt(path), frame)
+
+
+@pytest.fixture(scope='module')
+def sequence(tmp_path_factory):
+    """
+    TXT and npy files of the frames of a synthetic pcap file
+    """
+    root = tmp_path_factory.mktemp("convert")
+    synthetic.write_pcap(root / "seq.pcap", 800)
+    params = dict(read_params(PARAMS_PATH), **{'txt': True, 'pcd': False, 'npy': True})
+    LSLidarManager(root / "seq.pcap", root / "out", params).run(progress=lambda n: None)
+    seq_path = root / "txt" / "seq"
+    os.makedirs(seq_path)
+    shutil.copytree(root / "out" / "seq" / "data_txt", seq_path / "data_txt")
+    return seq_path, read_npy_dir(root / "out" / "seq" / "data_npy")
+
+
+def test_convert_txt(sequence, tmp_path):
+    seq_path, expected = sequence
+    convert_sequence(seq_path, tmp_path / "npy", 'npy')
+    frames = read_npy_dir(tmp_path / "npy" / "data_npy")
+    assert list(frames) == list(expected)
+    for name in expected:
+        assert_txt_equal(frames[name], expected[name])
+
+    convert_sequence(seq_path, tmp_path / "bin", 'bin')
+    reader = FrameSequenceReader(tmp_path / "bin" / "data_bin")
+    assert len(reader) == len(frames)
+    for i, name in enumerate(frames):
+        assert reader.index['frame'][i] == frame_number(name)
+        np.testing.assert_array_equal(reader[i], frames[name])
+
+
+def test_convert_archive(sequence, tmp_path):
+    seq_path, expected = sequence
+    convert_sequence(seq_path, tmp_path / "seq", 'archive')
+    assert len(ArchiveReader(tmp_path / "seq" / "data_archive")) == len(expected)
+    # a sequence with only an archive is converted from it, TXT files give no frame time, the files are named
+    # after the timestamp of the first point
+    convert_sequence(tmp_path / "seq", tmp_path / "npy", 'npy')
+    frames = read_npy_dir(tmp_path / "npy" / "data_npy")
+    assert [frame_number(name) for name in frames] == [frame_number(name) for name in expected]
+    for name, expected_name in zip(frames, expected):
+        assert name.split("_", 1)[1] == frame_time(frames[name]['timestamp'][0])
+        assert_txt_equal(frames[name], expected[expected_name])
+
+    convert_sequence(tmp_path / "seq", tmp_path / "txt", 'txt')
+    for name, expected_name in zip(frames, expected):
+        assert_txt_equal(read_txt(tmp_path / "txt" / "data_txt" / (name + ".txt")), expected[expected_name])
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+import lidar
+import synthetic
+from frame_buffer import COMPACT_FRAME_DTYPE, FRAME_DTYPE, vertical_angles
+
+
+def make_packets(n_packets=300):
+    timestamps, packets = synthetic.make_packets(n_packets)
+    return timestamps, packets
+
+
+def decode_packets(lsc16, packets, timestamps):
+    """
+    Reference decoding packet by packet, the points of each firing in firing order
+    """
+    decoded = [lsc16.process_data_frame(packet.tobytes(), timestamp) for packet, timestamp in zip(packets, timestamps)]
+    X, Y, Z, intensities, azimuth, firing_times, distances = (np.concatenate(values) for values in zip(*decoded))
+    laser_id = np.tile(np.arange(lsc16.count_lasers), len(X) // lsc16.count_lasers)
+    return {'timestamp': firing_times, 'laser_id': laser_id, 'x': X, 'y': Y, 'z': Z, 'intensity': intensities,
+            'horizontal_angle': azimuth, 'distance': distances, 'vertical_angle': lsc16.omega[laser_id]}
+
+
+def test_process_data_batch_matches_process_data_frame():
+    timestamps, packets = make_packets()
+    lsc16 = lidar.LSC16()
+    expected = decode_packets(lsc16, packets, timestamps)
+    X, Y, Z, intensities, azimuth, firing_times, distances = lsc16.process_data_batch(packets, timestamps)
+    for name, values in zip(('x', 'y', 'z', 'intensity', 'horizontal_angle', 'timestamp', 'distance'),
+                            (X, Y, Z, intensities, azimuth, firing_times, distances)):
+        np.testing.assert_array_equal(values.reshape(-1), expected[name], err_msg=name)
+
+
+def test_decode_batch_matches_process_data_frame():
+    timestamps, packets = make_packets()
+    lsc16 = lidar.LSC16()
+    expected = decode_packets(lsc16, packets, timestamps)
+    points, azimuth, valid = lsc16.decode_batch(packets, timestamps)
+
+    kept = expected['distance'] > 0
+    np.testing.assert_array_equal(valid.reshape(-1), kept)
+    np.testing.assert_array_equal(azimuth.reshape(-1), expected['horizontal_angle'])
+    assert set(points) == set(FRAME_DTYPE.names)
+    for name in FRAME_DTYPE.names:
+        np.testing.assert_array_equal(points[name], expected[name][kept], err_msg=name)
+
+
+@pytest.mark.parametrize('params', [
+    {'min_range': 2., 'max_range': 9.},
+    {'rings': [0, 3, 15]},
+    {'azimuth_sector': [90., 180.]},
+    {'azimuth_sector': [300., 30.]},
+    {'crop_box': [-5., -6., -1., 6., 5., 0.5]},
+    {'min_range': 1., 'rings': [1, 2, 3, 4], 'azimuth_sector': [350., 200.], 'crop_box': [-8., -8., -2., 8., 8., 2.]},
+])
+def test_point_filter(params):
+    timestamps, packets = make_packets()
+    lsc16 = lidar.LSC16()
+    expected = decode_packets(lsc16, packets, timestamps)
+    points, _, valid = lsc16.decode_batch(packets, timestamps, lidar.PointFilter(**params))
+
+    kept = expected['distance'] > 0
+    if 'min_range' in params:
+        kept &= expected['distance'] >= params['min_range']
+    if 'max_range' in params:
+        kept &= expected['distance'] <= params['max_range']
+    if 'rings' in params:
+        kept &= np.isin(expected['laser_id'], params['rings'])
+    if 'azimuth_sector' in params:
+        start, end = params['azimuth_sector']
+        azimuth = expected['horizontal_angle']
+        kept &= ((azimuth >= start) & (azimuth <= end)) if start <= end else ((azimuth >= start) | (azimuth <= end))
+    if 'crop_box' in params:
+        lower, upper = np.array(params['crop_box'][:3]), np.array(params['crop_box'][3:])
+        xyz = np.column_stack((expected['x'], expected['y'], expected['z']))
+        kept &= np.all((xyz >= lower) & (xyz <= upper), axis=1)
+
+    assert 0 < np.count_nonzero(kept) < len(kept)
+    np.testing.assert_array_equal(valid.reshape(-1), kept)
+    for name in FRAME_DTYPE.names:
+        np.testing.assert_array_equal(points[name], expected[name][kept], err_msg=name)
+
+
+def test_compact_decode_within_tolerance():
+    timestamps, packets = make_packets()
+    expected, _, expected_valid = lidar.LSC16().decode_batch(packets, timestamps)
+    lsc16 = lidar.LSC16(compact=True)
+    points, _, valid = lsc16.decode_batch(packets, timestamps)
+
+    np.testing.assert_array_equal(valid, expected_valid)
+    assert set(points) == set(COMPACT_FRAME_DTYPE.names)
+    frame = np.zeros(len(points['x']), dtype=COMPACT_FRAME_DTYPE)
+    for name in COMPACT_FRAME_DTYPE.names:
+        assert points[name].dtype == COMPACT_FRAME_DTYPE[name], name
+        frame[name] = points[name]
+    for name in ('timestamp', 'laser_id', 'intensity'):
+        np.testing.assert_array_equal(points[name], expected[name], err_msg=name)
+    for name in ('x', 'y', 'z', 'distance'):
+        assert np.all(np.abs(points[name] - expected[name]) < 1E-6 * expected['distance']), name
+    assert np.max(np.abs(points['horizontal_angle'] - expected['horizontal_angle'])) < 3E-5
+    np.testing.assert_array_equal(vertical_angles(frame, lsc16.omega), expected['vertical_angle'])
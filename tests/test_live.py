@@ -0,0 +1,124 @@
+import os
+import socket
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import synthetic
+from lidar_manager import LSLidarManager
+from live import LSLidarLive, replay
+from main import read_params
+from pcap_reader import PcapReader
+
+PARAMS_PATH = Path(__file__).resolve().parent.parent / "params.yaml"
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def live_params(port, **params):
+    return dict(read_params(PARAMS_PATH), **dict({'data-port': port, 'txt': False, 'pcd': False, 'npy': True},
+                                                 **params))
+
+
+class SlowWriter(LSLidarLive):
+    """
+    Live decoder whose files take longer to write than the frames take to arrive
+    """
+    def write_frame(self, frame, frame_nr, info=None, products=None):
+        time.sleep(0.2)
+        super().write_frame(frame, frame_nr, info, products)
+
+
+def wait_decoded(lidar_live, packets, timeout=10.):
+    deadline = time.time() + timeout
+    while time.time() < deadline and lidar_live.tail + lidar_live.dropped < packets:
+        time.sleep(0.01)
+
+
+@pytest.fixture(scope='module')
+def stream(tmp_path_factory):
+    """
+    Synthetic pcap file of a free port and its frames extracted offline
+    """
+    root = tmp_path_factory.mktemp("live")
+    port = free_port()
+    pcap_path = root / "seq.pcap"
+    synthetic.write_pcap(pcap_path, 600, port, device_every=0)
+    LSLidarManager(pcap_path, root / "offline", live_params(port)).run(progress=lambda n: None)
+    npy_path = root / "offline" / "seq" / "data_npy"
+    names = sorted(os.listdir(npy_path), key=lambda name: int(name.split("_")[0]))
+    return port, pcap_path, [np.load(npy_path / name) for name in names]
+
+
+def test_replay_is_published_and_written(stream, tmp_path):
+    port, pcap_path, frames = stream
+    published = []
+    lidar_live = LSLidarLive(live_params(port), tmp_path, callback=lambda frame, frame_nr: published.append(
+        (frame_nr, frame)), record=str(tmp_path / "rec.pcap"), host='127.0.0.1')
+    lidar_live.start()
+    try:
+        sent = replay(pcap_path, port, speed=5.)
+        wait_decoded(lidar_live, sent)
+    finally:
+        lidar_live.stop()
+    assert sent == 600
+    assert (lidar_live.packet_count, lidar_live.dropped, lidar_live.invalid) == (sent, 0, 0)
+    assert lidar_live.unwritten == 0
+
+    # the frames have the points of the offline extraction, the timestamps are the receive times
+    assert [frame_nr for frame_nr, _ in published] == list(range(len(frames)))
+    for (_, frame), expected in zip(published, frames):
+        for name in ('laser_id', 'x', 'y', 'z', 'intensity', 'distance'):
+            np.testing.assert_array_equal(frame[name], expected[name], err_msg=name)
+    assert len(os.listdir(tmp_path / "rec" / "data_npy")) == len(frames)
+
+    with PcapReader(pcap_path, port) as sent_reader, PcapReader(tmp_path / "rec.pcap", port) as recorded_reader:
+        np.testing.assert_array_equal(np.concatenate([np.array(batch.payloads) for batch in recorded_reader.batches()]),
+                                      np.concatenate([np.array(batch.payloads) for batch in sent_reader.batches()]))
+
+
+def test_full_ring_drops_packets(stream):
+    port, pcap_path, frames = stream
+
+    def slow_consumer(frame, frame_nr):
+        # the decoding thread is blocked, the ring buffer fills up
+        time.sleep(0.3)
+
+    lidar_live = LSLidarLive(live_params(port), callback=slow_consumer, host='127.0.0.1', ring_size=64, batch_size=16)
+    lidar_live.start()
+    try:
+        sent = replay(pcap_path, port, speed=20.)
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(b'\0' * 100, ('127.0.0.1', port))
+        wait_decoded(lidar_live, sent)
+        time.sleep(0.2)
+    finally:
+        lidar_live.stop()
+    assert lidar_live.dropped > 0
+    # packets dropped by the kernel are not counted
+    assert lidar_live.packet_count + lidar_live.dropped <= sent
+    assert lidar_live.invalid == 1
+
+
+def test_slow_files_do_not_block(stream, tmp_path):
+    port, pcap_path, frames = stream
+    published = []
+    lidar_live = SlowWriter(live_params(port, **{'queue-size': 1}), tmp_path,
+                            callback=lambda frame, frame_nr: published.append(frame_nr), host='127.0.0.1')
+    lidar_live.start()
+    try:
+        sent = replay(pcap_path, port, speed=5.)
+        wait_decoded(lidar_live, sent)
+        # every frame is published while the first ones are still being written
+        assert published == list(range(len(frames)))
+    finally:
+        lidar_live.stop()
+    assert lidar_live.unwritten > 0
+    written = os.listdir(Path(tmp_path) / lidar_live.pcap_path.stem / "data_npy")
+    assert len(written) == len(frames) - lidar_live.unwritten
@@ -0,0 +1,126 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import synthetic
+from frame_store import FrameSequenceReader
+from lidar_manager import LSLidarManager
+from main import read_params
+from manifest import MANIFEST_FILE
+
+PARAMS_PATH = Path(__file__).resolve().parent.parent / "params.yaml"
+
+
+class Interrupted(Exception):
+    pass
+
+
+class InterruptedManager(LSLidarManager):
+    """
+    Manager whose extraction is interrupted before writing the files of a frame
+    """
+    def __init__(self, pcap_path, out_root, params, frames):
+        super().__init__(pcap_path, out_root, params)
+        self.remaining = frames
+
+    def write_frame(self, frame, frame_nr, info=None, products=None):
+        if self.remaining == 0:
+            raise Interrupted()
+        self.remaining -= 1
+        super().write_frame(frame, frame_nr, info, products)
+
+
+def resume_params(**params):
+    return dict(read_params(PARAMS_PATH), **dict({'txt': False, 'pcd': False, 'npy': True, 'bin': True,
+                                                  'resume': True}, **params))
+
+
+def extract(pcap_path, out_root, params):
+    return LSLidarManager(pcap_path, out_root, params).run(progress=lambda n: None)
+
+
+def read_frames(out_path):
+    npy_path = Path(out_path) / "data_npy"
+    return {name: np.load(npy_path / name) for name in sorted(os.listdir(npy_path))}
+
+
+def frame_records(out_path):
+    with open(Path(out_path) / MANIFEST_FILE, 'r') as fp:
+        records = [json.loads(line) for line in fp.read().splitlines()[1:]]
+    return [record['frame'] for record in records if 'frame' in record]
+
+
+def assert_complete(out_path, expected):
+    frames = read_frames(out_path)
+    assert list(frames) == list(expected)
+    for name in expected:
+        np.testing.assert_array_equal(frames[name], expected[name])
+    # every frame is stored once in the sequence file
+    reader = FrameSequenceReader(Path(out_path) / "data_bin")
+    assert sorted(reader.index['frame'].tolist()) == sorted(int(name.split("_")[0]) for name in expected)
+    for name in expected:
+        np.testing.assert_array_equal(reader[reader.find(int(name.split("_")[0]))], expected[name])
+
+
+@pytest.fixture(scope='module')
+def reference(tmp_path_factory):
+    """
+    Synthetic pcap file, its frames and stats extracted without manifest
+    """
+    root = tmp_path_factory.mktemp("manifest")
+    pcap_path = root / "seq.pcap"
+    synthetic.write_pcap(pcap_path, 2000)
+    stats = extract(pcap_path, root / "reference", resume_params(resume=False))
+    frames = read_frames(root / "reference" / "seq")
+    assert len(frames) > 10
+    return pcap_path, stats, frames
+
+
+def test_resume_after_interrupt(reference, tmp_path):
+    pcap_path, full_stats, expected = reference
+    params = resume_params()
+    with pytest.raises(Interrupted):
+        InterruptedManager(pcap_path, tmp_path, params, 6).run(progress=lambda n: None)
+    out_path = tmp_path / "seq"
+    assert frame_records(out_path) == list(range(6))
+
+    stats = extract(pcap_path, tmp_path, params)
+    assert stats['frames'] == len(expected) - 6
+    assert stats['packets'] < full_stats['packets']
+    assert sorted(frame_records(out_path)) == list(range(len(expected)))
+    assert_complete(out_path, expected)
+
+    # the output dir is up to date
+    stats = extract(pcap_path, tmp_path, params)
+    assert (stats['packets'], stats['frames']) == (0, 0)
+    assert len(frame_records(out_path)) == len(expected)
+
+
+def test_missing_files_extracted_again(reference, tmp_path):
+    pcap_path, full_stats, expected = reference
+    params = resume_params()
+    extract(pcap_path, tmp_path, params)
+    out_path = tmp_path / "seq"
+    names = list(expected)
+    for name in (names[3], names[7], names[8]):
+        os.remove(out_path / "data_npy" / name)
+    # a record which was not completely written is dropped
+    with open(out_path / MANIFEST_FILE, 'a') as fp:
+        fp.write('{"frame": 99, "first_pa')
+
+    stats = extract(pcap_path, tmp_path, params)
+    assert stats['frames'] == 3
+    assert stats['packets'] < full_stats['packets']
+    assert_complete(out_path, expected)
+
+
+def test_changed_config_starts_over(reference, tmp_path):
+    pcap_path, _, expected = reference
+    extract(pcap_path, tmp_path, resume_params())
+    stats = extract(pcap_path, tmp_path, resume_params(txt=True))
+    assert stats['frames'] == len(expected)
+    assert len(os.listdir(tmp_path / "seq" / "data_txt")) == len(expected)
+    assert frame_records(tmp_path / "seq") == list(range(len(expected)))
@@ -0,0 +1,114 @@
+import shutil
+import struct
+
+import numpy as np
+import pytest
+
+import synthetic
+from lidar import PACKET_SIZE
+from pcap_reader import PcapReader, PcapWriter, RECORD_HEADER_SIZE, udp_headers
+
+dpkt = pytest.importorskip('dpkt')
+
+PORT = 2369
+
+
+@pytest.fixture(scope='module')
+def pcaps(tmp_path_factory):
+    """
+    Synthetic pcap file with device packets, a short datagram of the data port and two data packets after it, and a
+    copy of it ending in a truncated record
+    """
+    root = tmp_path_factory.mktemp("pcap")
+    path = root / "seq.pcap"
+    synthetic.write_pcap(path, 1000, PORT, device_every=50)
+    # a datagram of the data port too short to be a data packet
+    short = udp_headers(PORT).tobytes() + bytes(100)
+    with open(path, 'ab') as f:
+        f.write(struct.pack('<IIII', 1678040000, 0, len(short), len(short)) + short)
+
+    tail_path = root / "tail.pcap"
+    timestamps, payloads = synthetic.make_packets(3, 1000)
+    with PcapWriter(tail_path, PORT) as writer:
+        writer.write(timestamps, payloads)
+    with open(tail_path, 'rb') as f:
+        records = f.read()[24:]
+    with open(path, 'ab') as f:
+        f.write(records[:2 * len(records) // 3])
+
+    truncated = root / "truncated.pcap"
+    shutil.copy(path, truncated)
+    with open(truncated, 'ab') as f:
+        f.write(records[2 * len(records) // 3:-500])
+    return path, truncated
+
+
+def read_dpkt(path):
+    """
+    Data packets of a pcap file read as by the dpkt iteration the reader replaced
+    :return: ordinal, timestamp and payload of each data packet
+    """
+    packets = []
+    with open(path, 'rb') as f:
+        for idx, (ts, buf) in enumerate(dpkt.pcap.Reader(f)):
+            eth = dpkt.ethernet.Ethernet(buf)
+            if eth.data.data.sport == PORT and len(eth.data.data.data) >= PACKET_SIZE:
+                packets.append((idx, ts, np.frombuffer(eth.data.data.data, dtype=np.uint8)))
+    return packets
+
+
+def read_all(path, batch_size=64, **kwargs):
+    with PcapReader(path, PORT, batch_size) as reader:
+        batches = list(reader.batches(**kwargs))
+        return batches, [np.array(batch.payloads) for batch in batches]
+
+
+def test_matches_dpkt(pcaps):
+    path, _ = pcaps
+    expected = read_dpkt(path)
+    batches, payloads = read_all(path)
+    assert all(len(batch.indices) == 64 for batch in batches[:-1])
+    indices = np.concatenate([batch.indices for batch in batches])
+    assert indices.tolist() == [idx for idx, _, _ in expected]
+    # device packets and the short datagram are skipped
+    assert len(indices) == 1002
+    np.testing.assert_allclose(np.concatenate([batch.timestamps for batch in batches]),
+                               [ts for _, ts, _ in expected], rtol=0, atol=1E-6)
+    np.testing.assert_array_equal(np.concatenate(payloads), np.stack([payload for _, _, payload in expected]))
+
+    data = open(path, 'rb').read()
+    offsets = np.concatenate([batch.offsets for batch in batches])
+    for offset, payload in zip(offsets[::97], np.concatenate(payloads)[::97]):
+        caplen = struct.unpack_from('<I', data, offset + 8)[0]
+        assert caplen == 42 + PACKET_SIZE
+        assert data[offset + RECORD_HEADER_SIZE + 42:offset + RECORD_HEADER_SIZE + caplen] == payload.tobytes()
+    # the last batch ends after the last data packet
+    assert batches[-1].position == offsets[-1] + RECORD_HEADER_SIZE + 42 + PACKET_SIZE == len(data)
+
+
+def test_truncated_record(pcaps):
+    path, truncated = pcaps
+    batches, payloads = read_all(path)
+    truncated_batches, truncated_payloads = read_all(truncated)
+    indices = np.concatenate([batch.indices for batch in truncated_batches])
+    # the truncated record at the end is not read
+    np.testing.assert_array_equal(indices, np.concatenate([batch.indices for batch in batches]))
+    np.testing.assert_array_equal(np.concatenate(truncated_payloads), np.concatenate(payloads))
+    assert truncated_batches[-1].position == batches[-1].position
+
+
+def test_start_stop_and_seek(pcaps):
+    path, _ = pcaps
+    batches, payloads = read_all(path)
+    indices = np.concatenate([batch.indices for batch in batches])
+    offsets = np.concatenate([batch.offsets for batch in batches])
+    payloads = np.concatenate(payloads)
+    start, stop = int(indices[300]), int(indices[700])
+
+    expected = (indices >= start) & (indices <= stop)
+    for kwargs in ({'start': start, 'stop': stop}, {'start': start, 'stop': stop, 'seek': (start, offsets[300])},
+                   {'start': start, 'stop': stop, 'seek': (int(indices[250]), offsets[250])}):
+        window, window_payloads = read_all(path, **kwargs)
+        np.testing.assert_array_equal(np.concatenate([batch.indices for batch in window]), indices[expected])
+        np.testing.assert_array_equal(np.concatenate([batch.offsets for batch in window]), offsets[expected])
+        np.testing.assert_array_equal(np.concatenate(window_payloads), payloads[expected])
@@ -0,0 +1,46 @@
+import io
+
+import numpy as np
+import pytest
+
+import pcd
+
+
+def make_points(n=1000):
+    rng = np.random.default_rng(0)
+    X, Y, Z = (rng.normal(size=n) * 20 for _ in range(3))
+    return X, Y, Z, rng.integers(0, 256, n).astype(np.float64)
+
+
+def test_ascii_matches_savetxt():
+    X, Y, Z, I = make_points()
+    X[3] = np.nan
+    handle = io.BytesIO()
+    pcd.write_points(handle, X, Y, Z, I, 'ascii')
+    expected = io.BytesIO()
+    expected.write(pcd.PCD_HEADER.format(len(X), 1, len(X), 'ascii').encode('ascii'))
+    np.savetxt(expected, np.column_stack((X, Y, Z, I)), fmt=('%.6f', '%.6f', '%.6f', '%d'), delimiter=' ')
+    assert handle.getvalue() == expected.getvalue()
+
+
+@pytest.mark.parametrize('data', pcd.PCD_DATA_FORMATS)
+def test_round_trip(tmp_path, data):
+    if data == 'binary_compressed' and pcd.lzf is None:
+        pytest.skip('requires the python-lzf package')
+    X, Y, Z, I = make_points()
+    path = tmp_path / "frame.pcd"
+    pcd.write_pcd(path, X, Y, Z, I, data)
+    points = pcd.read_pcd(path)
+    atol = 1E-6 if data == 'ascii' else 1E-5
+    for name, values in zip(('x', 'y', 'z', 'intensity'), (X, Y, Z, I)):
+        np.testing.assert_allclose(points[name], values.astype(np.float32), rtol=1E-6, atol=atol)
+
+
+@pytest.mark.parametrize('data', pcd.PCD_DATA_FORMATS)
+def test_empty_frame_round_trip(tmp_path, data):
+    if data == 'binary_compressed' and pcd.lzf is None:
+        pytest.skip('requires the python-lzf package')
+    path = tmp_path / "empty.pcd"
+    pcd.write_pcd(path, *(np.empty(0) for _ in range(4)), data)
+    points = pcd.read_pcd(path)
+    assert len(points) == 0 and points.dtype == pcd.PCD_DTYPE
@@ -0,0 +1,77 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import synthetic
+from lidar_manager import LSLidarManager
+from main import read_params
+
+PARAMS_PATH = Path(__file__).resolve().parent.parent / "params.yaml"
+
+# every output format, the frames are written by the writer threads
+ALL_FORMATS = {'txt': True, 'pcd': True, 'pcd-format': 'binary', 'npy': True, 'bin': True, 'archive': True,
+               'archive-codec': 'zlib', 'voxel': True, 'range-image': True}
+
+
+@pytest.fixture(scope='module')
+def pcap_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp("pipeline") / "seq.pcap"
+    synthetic.write_pcap(path, 1500)
+    return path
+
+
+@pytest.fixture(scope='module')
+def synchronous(pcap_path):
+    """
+    Stats and output dir of the extraction into every format by the decoding thread
+    """
+    stats, path = extract(pcap_path, pcap_path.parent / "sync", **ALL_FORMATS)
+    assert stats['frames'] > 10
+    return stats, path
+
+
+def extract(pcap_path, out_root, **params):
+    stats = LSLidarManager(pcap_path, out_root, dict(read_params(PARAMS_PATH), **params)).run(progress=lambda n: None)
+    return stats, Path(out_root) / Path(pcap_path).stem
+
+
+def assert_same_tree(path, expected_path):
+    files = sorted(str(fpath.relative_to(path)) for fpath in Path(path).rglob("*") if fpath.is_file())
+    expected_files = sorted(str(fpath.relative_to(expected_path)) for fpath in Path(expected_path).rglob("*")
+                            if fpath.is_file())
+    assert files == expected_files
+    for name in files:
+        if name.endswith(".npz"):
+            # the members of npz files are dated
+            with np.load(path / name) as data, np.load(expected_path / name) as expected:
+                assert data.files == expected.files
+                for member in expected.files:
+                    np.testing.assert_array_equal(data[member], expected[member], err_msg=name)
+        else:
+            with open(path / name, 'rb') as f, open(expected_path / name, 'rb') as expected:
+                assert f.read() == expected.read(), name
+
+
+@pytest.mark.parametrize('writer_threads, queue_size', [(1, 1), (3, 2), (2, 8)])
+def test_writer_threads_equal_synchronous(pcap_path, synchronous, tmp_path, writer_threads, queue_size):
+    stats, expected_path = synchronous
+    threaded_stats, path = extract(pcap_path, tmp_path / "threads", **dict(ALL_FORMATS, **{
+        'writer-threads': writer_threads, 'queue-size': queue_size}))
+    assert (threaded_stats['packets'], threaded_stats['frames']) == (stats['packets'], stats['frames'])
+    assert_same_tree(path, expected_path)
+
+
+def test_stop_early_with_read_ahead(pcap_path, tmp_path):
+    # the window stops reading before the end of the file, the read ahead thread is stopped
+    _, full_path = extract(pcap_path, tmp_path / "full", npy=True, txt=False, pcd=False)
+    names = sorted(os.listdir(full_path / "data_npy"), key=lambda name: int(name.split("_")[0]))
+    end = float(np.load(full_path / "data_npy" / names[4])['timestamp'][0])
+    params = {'npy': True, 'txt': False, 'pcd': False, 'end-time': end}
+    stats, expected_path = extract(pcap_path, tmp_path / "sync", **params)
+    threaded_stats, path = extract(pcap_path, tmp_path / "threads", **dict(params, **{'writer-threads': 2,
+                                                                                      'queue-size': 1}))
+    assert threaded_stats['packets'] == stats['packets']
+    assert sorted(os.listdir(path / "data_npy")) == sorted(os.listdir(expected_path / "data_npy")) == names[:5]
+    assert_same_tree(path, expected_path)
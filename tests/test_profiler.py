@@ -0,0 +1,120 @@
+import csv
+import json
+import os
+import pstats
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import lidar
+import synthetic
+from lidar_manager import LSLidarManager
+from main import read_params
+from pcap_reader import PcapReader
+from profiler import Profiler
+
+PARAMS_PATH = Path(__file__).resolve().parent.parent / "params.yaml"
+
+
+@pytest.fixture(scope='module')
+def pcap_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp("profiler") / "seq.pcap"
+    synthetic.write_pcap(path, 1000)
+    return path
+
+
+def firing_distances(pcap_path, port):
+    """
+    :return: distance of every firing of the data packets, decoded packet by packet
+    """
+    lsc16 = lidar.LSC16()
+    with PcapReader(pcap_path, port) as reader:
+        return np.concatenate([lsc16.process_data_frame(payload.tobytes(), timestamp)[6]
+                               for batch in reader.batches()
+                               for payload, timestamp in zip(batch.payloads, batch.timestamps)])
+
+
+def extract(pcap_path, out_root, profiler=None, **params):
+    params = dict(read_params(PARAMS_PATH), **dict({'txt': False, 'pcd': False, 'npy': True}, **params))
+    return LSLidarManager(pcap_path, out_root, params, profiler).run(progress=lambda n: None)
+
+
+def test_stages_and_counters(pcap_path, tmp_path):
+    params = read_params(PARAMS_PATH)
+    distances = firing_distances(pcap_path, params['data-port'])
+    min_range, max_range = np.percentile(distances[distances > 0], [20, 90])
+    kept = (distances > 0) & (distances >= min_range) & (distances <= max_range)
+
+    stats = extract(pcap_path, tmp_path, Profiler(enabled=True), **{'min-range': float(min_range),
+                                                                    'max-range': float(max_range)})
+    profile = stats['profile']
+    assert {'read', 'decode', 'assemble', 'write_npy'} <= set(profile['stages'])
+    for stage in profile['stages'].values():
+        assert stage['seconds'] >= 0. and stage['calls'] > 0
+    assert profile['stages']['write_npy']['calls'] == stats['frames']
+    assert profile['stages']['decode']['calls'] == profile['stages']['assemble']['calls']
+
+    counters = profile['counters']
+    assert counters['packets'] == stats['packets'] == 1000
+    assert counters['frames'] == stats['frames']
+    assert counters['bytes_read'] == os.path.getsize(pcap_path)
+    # the returns of 0 and out of range are dropped when decoding
+    assert counters['dropped_points'] == len(distances) - np.count_nonzero(kept) > 0
+    npy_path = tmp_path / "seq" / "data_npy"
+    frames = [np.load(npy_path / name) for name in os.listdir(npy_path)]
+    assert counters['points'] == sum(len(frame) for frame in frames) <= np.count_nonzero(kept)
+    for frame in frames:
+        assert np.all((frame['distance'] >= min_range) & (frame['distance'] <= max_range))
+
+    dist = profile['distributions']['points_per_frame']
+    assert (dist['count'], dist['sum']) == (len(frames), counters['points'])
+    assert (dist['min'], dist['max']) == (min(len(frame) for frame in frames), max(len(frame) for frame in frames))
+
+
+def test_disabled_profiler(pcap_path, tmp_path):
+    profiler = Profiler()
+    stats = extract(pcap_path, tmp_path, profiler)
+    assert 'profile' not in stats
+    assert profiler.report() == {'stages': {}, 'counters': {}, 'distributions': {}}
+
+
+def test_nested_stages_and_merge():
+    profiler = Profiler(enabled=True)
+    with profiler.stage('outer'):
+        with profiler.stage('inner'):
+            sum(range(100000))
+    report = profiler.report()
+    assert report['stages']['outer']['calls'] == report['stages']['inner']['calls'] == 1
+
+    profiler.count('points', 5)
+    profiler.observe('points_per_frame', 3)
+    other = Profiler(enabled=True)
+    other.count('points', 2)
+    other.observe('points_per_frame', 7)
+    other.add_time('inner', 1.)
+    profiler.merge(other.report())
+    merged = profiler.report()
+    assert merged['counters'] == {'points': 7}
+    assert merged['distributions']['points_per_frame'] == {'count': 2, 'sum': 10, 'min': 3, 'max': 7}
+    assert merged['stages']['inner']['calls'] == 2
+    assert merged['stages']['inner']['seconds'] == pytest.approx(report['stages']['inner']['seconds'] + 1.)
+
+
+def test_reports_and_packet_range(pcap_path, tmp_path):
+    dump = tmp_path / "profile.prof"
+    profiler = Profiler(enabled=True, packets=(300, 400), dump=str(dump))
+    extract(pcap_path, tmp_path, profiler)
+    # cProfile ran for the packet range only
+    assert 'process_data_batch' in {name for _, _, name in pstats.Stats(str(dump)).stats}
+
+    profiler.write_report(tmp_path / "report.json")
+    with open(tmp_path / "report.json", 'r') as fp:
+        assert json.load(fp) == json.loads(json.dumps(profiler.report()))
+    profiler.write_report(tmp_path / "report.csv")
+    with open(tmp_path / "report.csv", 'r', newline='') as fp:
+        rows = list(csv.reader(fp))
+    assert rows[0] == ['kind', 'name', 'value', 'calls', 'min', 'max']
+    assert {(row[0], row[1]) for row in rows[1:]} >= {('stage', 'decode'), ('counter', 'packets'),
+                                                      ('distribution', 'points_per_frame')}
+    assert "decode" in profiler.summary()
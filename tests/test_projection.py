@@ -0,0 +1,99 @@
+import numpy as np
+
+from projection import CameraProjector, read_calibration, read_depth, write_depth
+
+CALIBRATION = """%YAML:1.0
+---
+CameraExtrinsicMat: !!opencv-matrix
+   rows: 4
+   cols: 4
+   dt: d
+   data: [ {} ]
+CameraMat: !!opencv-matrix
+   rows: 3
+   cols: 3
+   dt: d
+   data: [ 700., 0., 640., 0., 700., 360., 0., 0., 1. ]
+DistCoeff: !!opencv-matrix
+   rows: 1
+   cols: 5
+   dt: d
+   data: [ -0.3, 0.1, 0.001, -0.001, 0. ]
+ImageSize: [ 1280, 720 ]
+ReprojectionError: 0.5
+DistModel: plumb_bob
+"""
+
+
+def write_calibrations(tmp_path):
+    """
+    Cameras looking along +x, -y, -x and +y of the lidar, x right, y down and z forward
+    """
+    paths = []
+    for j, yaw in enumerate((0, -90, 180, 90)):
+        a = np.radians(yaw)
+        pose = np.eye(4)
+        pose[:3, 0] = [np.sin(a), -np.cos(a), 0]
+        pose[:3, 1] = [0, 0, -1]
+        pose[:3, 2] = [np.cos(a), np.sin(a), 0]
+        pose[:3, 3] = [0.1, 0.05, -0.2]
+        path = tmp_path / "camera_{}.yaml".format(j)
+        path.write_text(CALIBRATION.format(", ".join("{:.12e}".format(value) for value in pose.reshape(-1))))
+        paths.append(path)
+    return paths
+
+
+def project_points(calibration, max_r2, xyz, min_depth=0.1):
+    """
+    Reference projection point by point
+    """
+    width, height = calibration['image_size']
+    image = np.zeros((height, width), dtype=np.float64)
+    K = calibration['camera_mat']
+    k1, k2, p1, p2, k3 = calibration['dist']
+    for point in xyz:
+        q = calibration['rotation'] @ point + calibration['translation']
+        if q[2] <= min_depth:
+            continue
+        x, y = q[0] / q[2], q[1] / q[2]
+        r2 = x * x + y * y
+        if r2 >= max_r2:
+            continue
+        radial = 1 + k1 * r2 + k2 * r2 ** 2 + k3 * r2 ** 3
+        xd = x * radial + 2 * p1 * x * y + p2 * (r2 + 2 * x * x)
+        yd = y * radial + p1 * (r2 + 2 * y * y) + 2 * p2 * x * y
+        column = int(np.floor(K[0, 0] * xd + K[0, 1] * yd + K[0, 2] + 0.5))
+        row = int(np.floor(K[1, 1] * yd + K[1, 2] + 0.5))
+        if 0 <= column < width and 0 <= row < height and (image[row, column] == 0 or q[2] < image[row, column]):
+            image[row, column] = q[2]
+    return image
+
+
+def test_nearest_point_per_pixel(tmp_path):
+    calibrations = [read_calibration(path) for path in write_calibrations(tmp_path)]
+    projector = CameraProjector(calibrations)
+    rng = np.random.default_rng(0)
+    xyz = rng.normal(size=(5000, 3)) * [10, 10, 2]
+    # points hidden behind others on the same ray
+    xyz = np.concatenate((xyz, xyz[:500] * 1.5))
+
+    path = tmp_path / "depth.npz"
+    write_depth(path, projector.depth_maps(xyz))
+    depth_maps = read_depth(path)
+    assert len(depth_maps) == 4
+    for j, calibration in enumerate(calibrations):
+        expected = project_points(calibration, projector.max_r2[j], xyz)
+        assert depth_maps[j].shape == (720, 1280)
+        assert np.count_nonzero(expected) > 0
+        np.testing.assert_allclose(depth_maps[j], expected, rtol=1E-6)
+        np.testing.assert_array_equal(read_depth(path, j), depth_maps[j])
+
+
+def test_camera_pose_is_inverted(tmp_path):
+    projector = CameraProjector([read_calibration(path) for path in write_calibrations(tmp_path)])
+    # a point in front of each camera, on the optical axis
+    cameras, pixels, depth, _ = projector.project([[5.1, 0.05, -0.2], [0.1, -4.95, -0.2], [-4.9, 0.05, -0.2],
+                                                   [0.1, 5.05, -0.2]])
+    np.testing.assert_array_equal(cameras, [0, 1, 2, 3])
+    np.testing.assert_array_equal(pixels, [360 * 1280 + 640] * 4)
+    np.testing.assert_allclose(depth, 5.)
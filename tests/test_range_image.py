@@ -0,0 +1,138 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import lidar
+import pcd
+import synthetic
+from frame_buffer import FRAME_DTYPE
+from lidar_manager import LSLidarManager
+from main import read_params
+from range_image import RangeImage, check_range_image_format, write_range_image
+
+PARAMS_PATH = Path(__file__).resolve().parent.parent / "params.yaml"
+
+
+def make_frame(points):
+    """
+    :param points: list of (laser_id, horizontal_angle, distance, intensity)
+    """
+    frame = np.zeros(len(points), dtype=FRAME_DTYPE)
+    for i, name in enumerate(('laser_id', 'horizontal_angle', 'distance', 'intensity')):
+        frame[name] = [point[i] for point in points]
+    frame['timestamp'] = np.arange(len(points))
+    return frame
+
+
+@pytest.fixture(scope='module')
+def extracted(tmp_path_factory):
+    """
+    Frames and organized PCD files of a synthetic pcap file
+    """
+    root = tmp_path_factory.mktemp("range_image")
+    pcap_path = root / "seq.pcap"
+    synthetic.write_pcap(pcap_path, 600)
+    params = dict(read_params(PARAMS_PATH), **{'txt': False, 'pcd': False, 'npy': True, 'range-image': True,
+                                               'range-image-format': 'pcd', 'pcd-format': 'binary'})
+    LSLidarManager(pcap_path, root, params).run(progress=lambda n: None)
+    out_path = root / "seq"
+    names = sorted(os.listdir(out_path / "data_npy"), key=lambda name: int(name.split("_")[0]))
+    assert len(names) > 3
+    return [(np.load(out_path / "data_npy" / name), out_path / "data_range" / name.replace(".npy", ".pcd"))
+            for name in names]
+
+
+def test_rings_and_azimuths():
+    omega = lidar.LSC16().omega
+    range_image = RangeImage(omega)
+    assert range_image.image.shape == (16, 1000)
+    # the rows are ordered from the highest to the lowest laser
+    np.testing.assert_array_equal(range_image.omega, np.arange(15, -16, -2))
+    np.testing.assert_array_equal(range_image.omega[range_image.rows], omega)
+    assert (range_image.rows[15], range_image.rows[13], range_image.rows[0]) == (0, 1, 15)
+
+    image = range_image.fill(make_frame([(15, 0.1, 5., 10),     # pixel (0, 0)
+                                         (0, 359.9, 6., 20),    # pixel (15, 999)
+                                         (1, 10.0, 8., 30),     # pixel (7, 27)
+                                         (1, 10.05, 7., 40),    # pixel (7, 27), nearer
+                                         (3, 180.1, 9., 50),    # pixel (6, 500)
+                                         (3, 181., 0., 60)]))   # no return
+    assert np.count_nonzero(image['range']) == 4
+    assert tuple(image[0, 0]) == (5., 10, np.float32(0.1), 0.)
+    assert tuple(image[15, 999]) == (6., 20, np.float32(359.9), 1.)
+    assert tuple(image[7, 27]) == (7., 40, np.float32(10.05), 3.)
+    assert tuple(image[6, 500]) == (9., 50, np.float32(180.1), 4.)
+
+    # the image is cleared for the next frame
+    image = range_image.fill(make_frame([(2, 359.99, 3., 1)]))
+    assert np.count_nonzero(image['range']) == 1 and image[14, 999]['range'] == 3.
+
+
+def test_resolution():
+    range_image = RangeImage(lidar.LSC16().omega, resolution=1.)
+    assert range_image.width == 360
+    image = range_image.fill(make_frame([(15, 0.5, 1., 0), (15, 1.5, 2., 0), (15, 359.5, 3., 0)]))
+    np.testing.assert_array_equal(image['range'][0, [0, 1, 359]], [1., 2., 3.])
+    assert RangeImage(lidar.LSC16().omega, resolution=0.7).width == 515
+
+
+def test_pixels_of_frames(extracted):
+    range_image = RangeImage(lidar.LSC16().omega)
+    for frame, _ in extracted:
+        image = range_image.fill(frame)
+        valid = frame[frame['distance'] > 0]
+        rows = range_image.rows[valid['laser_id']]
+        cols = np.floor(valid['horizontal_angle'] / 0.36).astype(np.int64) % 1000
+        pixels = set(zip(rows.tolist(), cols.tolist()))
+        assert set(zip(*np.nonzero(image['range']))) == pixels
+        # every pixel holds the nearest return
+        for row, col in list(pixels)[:200]:
+            in_pixel = (rows == row) & (cols == col)
+            assert image[row, col]['range'] == np.float32(valid['distance'][in_pixel].min())
+
+        # the pixels are at the coordinates of their points
+        X, Y, Z = range_image.xyz()
+        nearest = {}
+        for point, row, col in zip(valid, rows, cols):
+            if (row, col) not in nearest or point['distance'] < nearest[(row, col)]['distance']:
+                nearest[(row, col)] = point
+        keys = list(nearest)
+        for values, name in ((X, 'x'), (Y, 'y'), (Z, 'z')):
+            np.testing.assert_allclose([values[key] for key in keys], [nearest[key][name] for key in keys],
+                                       atol=1E-4, err_msg=name)
+        assert np.count_nonzero(np.isnan(X)) == X.size - len(pixels)
+
+
+def test_organized_pcd(extracted):
+    range_image = RangeImage(lidar.LSC16().omega)
+    for frame, fpath in extracted:
+        range_image.fill(frame)
+        with open(fpath, 'rb') as f:
+            header = f.read(400).decode('ascii', errors='replace')
+        assert 'WIDTH 1000\nHEIGHT 16\n' in header and 'POINTS 16000\n' in header
+        points = pcd.read_pcd(fpath)
+        assert points.shape == (16, 1000)
+        for values, name in zip(range_image.xyz(), ('x', 'y', 'z')):
+            np.testing.assert_array_equal(points[name], values.astype(np.float32), err_msg=name)
+        np.testing.assert_array_equal(points['intensity'], range_image.image['intensity'])
+
+
+@pytest.mark.parametrize('data', pcd.PCD_DATA_FORMATS)
+def test_write_range_image(tmp_path, extracted, data):
+    if data == 'binary_compressed' and pcd.lzf is None:
+        pytest.skip('requires the python-lzf package')
+    range_image = RangeImage(lidar.LSC16().omega)
+    image = range_image.fill(extracted[0][0]).copy()
+    range_image.fill(extracted[1][0])
+    write_range_image(tmp_path / "image.npy", range_image, image)
+    np.testing.assert_array_equal(np.load(tmp_path / "image.npy"), image)
+
+    write_range_image(tmp_path / "image.pcd", range_image, image, 'pcd', data)
+    points = pcd.read_pcd(tmp_path / "image.pcd")
+    atol = 1E-6 if data == 'ascii' else 0.
+    for values, name in zip(range_image.xyz(image), ('x', 'y', 'z')):
+        np.testing.assert_allclose(points[name], values.astype(np.float32), atol=atol, rtol=1E-6, err_msg=name)
+    with pytest.raises(ValueError):
+        check_range_image_format('png')
@@ -0,0 +1,101 @@
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import synthetic
+from lidar_manager import LSLidarManager
+from main import read_params
+from seek_index import SEEK_INDEX_DTYPE, entry_before_frame, entry_before_packet, entry_before_time, \
+    load_seek_index, seek_index_path
+
+PARAMS_PATH = Path(__file__).resolve().parent.parent / "params.yaml"
+
+
+def extract_params(**params):
+    return dict(read_params(PARAMS_PATH), txt=False, pcd=False, npy=True, resume=False, **params)
+
+
+def extract(pcap_path, out_root, params):
+    stats = LSLidarManager(pcap_path, out_root, params).run(progress=lambda n: None)
+    npy_path = Path(out_root) / Path(pcap_path).stem / "data_npy"
+    return stats, {name: np.load(npy_path / name) for name in sorted(os.listdir(npy_path))}
+
+
+def frame_nr(name):
+    return int(name.split("_")[0])
+
+
+@pytest.fixture(scope='module')
+def full(tmp_path_factory):
+    """
+    Synthetic pcap file and all of its frames
+    """
+    root = tmp_path_factory.mktemp("seek")
+    pcap_path = root / "seq.pcap"
+    synthetic.write_pcap(pcap_path, 3000)
+    stats, frames = extract(pcap_path, root / "full", extract_params(**{'seek-interval': 64}))
+    assert len(frames) > 20
+    return pcap_path, stats, frames
+
+
+def test_entry_lookup():
+    entries = np.array([(0, 24, 10.0, 0), (64, 5000, 10.1, 0), (128, 9000, 10.2, 1), (192, 13000, 10.3, 2),
+                        (256, 17000, 10.4, 2)], dtype=SEEK_INDEX_DTYPE)
+    assert entry_before_packet(entries, 0)['ordinal'] == 0
+    assert entry_before_packet(entries, 200)['ordinal'] == 192
+    assert entry_before_packet(entries[1:], 10) is None
+    # the entry before the roll over starting a frame has fewer frames
+    assert entry_before_frame(entries, 1)['ordinal'] == 64
+    assert entry_before_frame(entries, 3)['ordinal'] == 256
+    assert entry_before_frame(entries, 0) is None
+    # the frame in progress at 10.25 started at the roll over after the entry at 10.1
+    assert entry_before_time(entries, 10.25)['ordinal'] == 64
+    assert entry_before_time(entries, 10.45)['ordinal'] == 128
+    assert entry_before_time(entries, 9.) is None
+
+
+def test_index_belongs_to_file(full, tmp_path):
+    pcap_path = tmp_path / "seq.pcap"
+    shutil.copy(full[0], pcap_path)
+    params = extract_params(**{'seek-interval': 64})
+    entries = LSLidarManager(pcap_path, None, params).seek_index()
+    assert seek_index_path(pcap_path).exists()
+    assert len(entries) > 0 and np.all(np.diff(entries['ordinal']) > 0) and np.all(np.diff(entries['frames']) >= 0)
+
+    np.testing.assert_array_equal(load_seek_index(pcap_path, params['data-port']), entries)
+    assert load_seek_index(pcap_path, params['data-port'] + 1) is None
+    with open(pcap_path, 'ab') as f:
+        f.write(b'\0')
+    assert load_seek_index(pcap_path, params['data-port']) is None
+
+
+def test_time_window(full, tmp_path):
+    pcap_path, full_stats, frames = full
+    names = list(frames)
+    k = len(names) // 2
+    # the window starts and ends inside frames k and k + 3
+    start = frames[names[k]]['timestamp'][[0, -1]].mean()
+    end = frames[names[k + 3]]['timestamp'][[0, -1]].mean()
+    params = extract_params(**{'seek-interval': 64, 'start-time': float(start), 'end-time': float(end)})
+    for _ in range(2):
+        # the second run loads the stored seek index
+        stats, window = extract(pcap_path, tmp_path / "window", params)
+        assert list(window) == names[k:k + 4]
+        for name, frame in window.items():
+            np.testing.assert_array_equal(frame, frames[name])
+        assert stats['packets'] < full_stats['packets']
+
+
+def test_selected_frames(full, tmp_path):
+    pcap_path, full_stats, frames = full
+    names = list(frames)
+    wanted = [names[2], names[3], names[-5]]
+    params = extract_params(**{'seek-interval': 64, 'frames': [frame_nr(name) for name in wanted]})
+    stats, selected = extract(pcap_path, tmp_path / "frames", params)
+    assert list(selected) == wanted
+    for name, frame in selected.items():
+        np.testing.assert_array_equal(frame, frames[name])
+    assert stats['packets'] < full_stats['packets']
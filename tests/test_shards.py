@@ -0,0 +1,96 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import synthetic
+from lidar_manager import LSLidarManager
+from main import plan, plan_shards, read_params, run_parallel
+
+PARAMS_PATH = Path(__file__).resolve().parent.parent / "params.yaml"
+
+
+def extract_params(**params):
+    return dict(read_params(PARAMS_PATH), **dict({'txt': False, 'pcd': False, 'npy': True, 'resume': False,
+                                                  'seek-interval': 64}, **params))
+
+
+def read_frames(out_path):
+    npy_path = Path(out_path) / "data_npy"
+    return {name: np.load(npy_path / name) for name in sorted(os.listdir(npy_path))}
+
+
+def extract(pcap_path, out_root, params, seek=None):
+    """
+    :return: stats of the extraction and bytes of the pcap file reported as progress
+    """
+    progress = []
+    stats = LSLidarManager(pcap_path, out_root, params).run(seek, progress.append)
+    return stats, sum(progress)
+
+
+@pytest.fixture(scope='module')
+def serial(tmp_path_factory):
+    """
+    Synthetic pcap files and their frames extracted at once
+    """
+    root = tmp_path_factory.mktemp("shards")
+    pcaps = [root / "seq_a.pcap", root / "seq_b.pcap"]
+    synthetic.write_pcap(pcaps[0], 3000)
+    synthetic.write_pcap(pcaps[1], 1500, seed=1)
+    results = {}
+    for pcap_path in pcaps:
+        stats, progress = extract(pcap_path, root / "serial", extract_params())
+        results[pcap_path] = (stats, progress, read_frames(root / "serial" / pcap_path.stem))
+    return pcaps, results
+
+
+def assert_same_frames(frames, expected):
+    assert list(frames) == list(expected)
+    for name in expected:
+        np.testing.assert_array_equal(frames[name], expected[name])
+
+
+def test_shards_equal_serial(serial, tmp_path):
+    pcaps, results = serial
+    pcap_path = pcaps[0]
+    expected_stats, expected_progress, expected = results[pcap_path]
+    shards = plan_shards(pcap_path, extract_params(), 4)
+    assert len(shards) == 4
+    starts = [shard_params['from'] for shard_params, _ in shards]
+    assert starts[0] == 0 and np.all(np.diff(starts) > 0)
+
+    packets = frames = progress = 0
+    for shard_params, seek in shards:
+        stats, shard_progress = extract(pcap_path, tmp_path, shard_params, seek)
+        packets += stats['packets']
+        frames += stats['frames']
+        progress += shard_progress
+    # the packets read past a shard to finish its last frame are counted by the following shard only
+    assert packets == expected_stats['packets']
+    assert frames == expected_stats['frames'] == len(expected)
+    assert progress == expected_progress
+    assert_same_frames(read_frames(tmp_path / pcap_path.stem), expected)
+
+
+def test_up_to_date_shards_skipped(serial, tmp_path):
+    pcap_path = serial[0][0]
+    params = extract_params(resume=True)
+    shards = plan(pcap_path, tmp_path, params, 4)
+    assert len(shards) == 4
+    for shard_params, seek in shards[:2]:
+        extract(pcap_path, tmp_path, shard_params, seek)
+    assert [shard_params['from'] for shard_params, _ in plan(pcap_path, tmp_path, params, 4)] == \
+        [shard_params['from'] for shard_params, _ in shards[2:]]
+    for shard_params, seek in shards[2:]:
+        extract(pcap_path, tmp_path, shard_params, seek)
+    assert plan(pcap_path, tmp_path, params, 4) == []
+    assert_same_frames(read_frames(tmp_path / pcap_path.stem), serial[1][pcap_path][2])
+
+
+def test_run_parallel_equals_serial(serial, tmp_path):
+    pcaps, results = serial
+    run_parallel([str(pcap_path) for pcap_path in pcaps], tmp_path, extract_params(), 2, 3)
+    for pcap_path in pcaps:
+        assert_same_frames(read_frames(tmp_path / pcap_path.stem), results[pcap_path][2])
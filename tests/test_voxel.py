@@ -0,0 +1,115 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import synthetic
+from frame_buffer import FRAME_DTYPE
+from lidar_manager import LSLidarManager
+from main import read_params
+from voxel import Voxelizer, check_voxel_format, occupancy, read_voxels, write_voxels
+
+PARAMS_PATH = Path(__file__).resolve().parent.parent / "params.yaml"
+
+
+def make_frame(points):
+    """
+    :param points: list of (x, y, z, intensity, distance)
+    """
+    frame = np.zeros(len(points), dtype=FRAME_DTYPE)
+    for i, name in enumerate(('x', 'y', 'z', 'intensity', 'distance')):
+        frame[name] = [point[i] for point in points]
+    return frame
+
+
+# grid of 4 x 4 x 2 voxels of 0.5 m
+BOUNDS = [0., 0., 0., 2., 2., 1.]
+FRAME = make_frame([(0.1, 0.1, 0.1, 10, 1.),    # voxel (0, 0, 0)
+                    (0.4, 0.2, 0.3, 20, 1.),    # voxel (0, 0, 0)
+                    (1.2, 0.6, 0.7, 30, 1.),    # voxel (2, 1, 1)
+                    (1.9, 1.9, 0.9, 40, 0.),    # no return
+                    (2.0, 0.1, 0.1, 50, 1.),    # on the upper bound of x
+                    (-0.1, 0.1, 0.1, 60, 1.)])  # below the lower bound of x
+
+
+def test_hand_computed_grid():
+    grid = Voxelizer(BOUNDS, 0.5).add(FRAME)
+    assert tuple(grid['shape']) == (4, 4, 2)
+    np.testing.assert_array_equal(grid['coords'], [[0, 0, 0], [2, 1, 1]])
+    np.testing.assert_array_equal(grid['count'], [2, 1])
+    np.testing.assert_array_equal(grid['intensity'], [15., 30.])
+    assert grid['coords'].dtype == np.uint16 and grid['count'].dtype == np.uint32
+
+
+def test_voxel_size_per_axis():
+    voxelizer = Voxelizer(BOUNDS, [0.3, 1., 0.4])
+    # the grid is rounded up to whole voxels, x of 2.0 m is inside the voxels up to 2.1 m
+    assert voxelizer.shape == (7, 2, 3)
+    grid = voxelizer.add(FRAME)
+    np.testing.assert_array_equal(grid['coords'], [[0, 0, 0], [1, 0, 0], [4, 0, 1], [6, 0, 0]])
+    np.testing.assert_array_equal(grid['count'], [1, 1, 1, 1])
+    np.testing.assert_array_equal(grid['intensity'], [10., 20., 30., 50.])
+
+
+def test_frames_aggregated():
+    voxelizer = Voxelizer(BOUNDS, 0.5, n_frames=2)
+    voxelizer.add(FRAME)
+    grid = voxelizer.add(make_frame([(1.3, 0.9, 0.6, 60, 1.), (1.6, 1.6, 0.2, 5, 1.)]))
+    np.testing.assert_array_equal(grid['coords'], [[0, 0, 0], [2, 1, 1], [3, 3, 0]])
+    np.testing.assert_array_equal(grid['count'], [2, 2, 1])
+    np.testing.assert_array_equal(grid['intensity'], [15., 45., 5.])
+
+    # the first frame leaves the aggregation
+    grid = voxelizer.add(make_frame([]))
+    np.testing.assert_array_equal(grid['coords'], [[2, 1, 1], [3, 3, 0]])
+    np.testing.assert_array_equal(grid['count'], [1, 1])
+
+    voxelizer.reset()
+    grid = voxelizer.add(make_frame([]))
+    assert grid['coords'].shape == (0, 3) and len(grid['count']) == 0
+
+
+def test_invalid_grid():
+    with pytest.raises(ValueError):
+        Voxelizer([0., 0., 0., 0., 1., 1.], 0.5)
+    with pytest.raises(ValueError):
+        Voxelizer([0., 0., 0., 100., 1., 1.], 0.001)
+    with pytest.raises(ValueError):
+        check_voxel_format('dense')
+
+
+@pytest.mark.parametrize('fmt', ['sparse', 'packed'])
+def test_write_read(tmp_path, fmt):
+    grid = Voxelizer(BOUNDS, 0.5).add(FRAME)
+    write_voxels(tmp_path / "grid.npz", grid, fmt)
+    read = read_voxels(tmp_path / "grid.npz")
+    np.testing.assert_array_equal(read['coords'], grid['coords'])
+    np.testing.assert_array_equal(occupancy(read), occupancy(grid))
+    assert np.count_nonzero(occupancy(read)) == 2
+    for name in ('shape', 'lower', 'voxel_size'):
+        np.testing.assert_array_equal(read[name], grid[name])
+    if fmt == 'sparse':
+        np.testing.assert_array_equal(read['count'], grid['count'])
+        np.testing.assert_array_equal(read['intensity'], grid['intensity'])
+    else:
+        assert 'count' not in read and 'intensity' not in read
+
+
+def test_extracted_grids(tmp_path):
+    pcap_path = tmp_path / "seq.pcap"
+    synthetic.write_pcap(pcap_path, 600)
+    params = dict(read_params(PARAMS_PATH), **{'txt': False, 'pcd': False, 'npy': True, 'voxel': True,
+                                               'voxel-frames': 2})
+    LSLidarManager(pcap_path, tmp_path, params).run(progress=lambda n: None)
+    out_path = tmp_path / "seq"
+    names = sorted(os.listdir(out_path / "data_npy"), key=lambda name: int(name.split("_")[0]))
+    assert len(names) > 3
+    # the grids of the frames written in frame order
+    voxelizer = Voxelizer(params['voxel-bounds'], params['voxel-size'], 2)
+    for name in names:
+        grid = voxelizer.add(np.load(out_path / "data_npy" / name))
+        read = read_voxels(out_path / "data_voxel" / name.replace(".npy", ".npz"))
+        assert grid['count'].sum() > 0
+        for key in ('coords', 'count', 'intensity'):
+            np.testing.assert_array_equal(read[key], grid[key], err_msg=key)
@@ -0,0 +1,111 @@
+from collections import deque
+
+import numpy as np
+
+
+VOXEL_FORMATS = ('sparse', 'packed')
+
+
+class Voxelizer:
+    """
+    Voxelization of frames into a grid of fixed bounds, each occupied voxel holds the number of points and
+    their mean intensity. The voxels of the last n_frames frames are aggregated, the points of earlier frames
+    are taken as they are in the lidar coordinate system.
+    """
+    def __init__(self, bounds, voxel_size, n_frames=1):
+        """
+        :param bounds: [x_min, y_min, z_min, x_max, y_max, z_max] of the grid [m]
+        :param voxel_size: edge length of the voxels [m], one value or one per axis
+        :param n_frames: number of consecutive frames aggregated into each grid
+        """
+        self.lower = np.array(bounds[:3], dtype=np.float64)
+        upper = np.array(bounds[3:], dtype=np.float64)
+        self.voxel_size = np.broadcast_to(np.asarray(voxel_size, dtype=np.float64), (3,)).copy()
+        self.shape = tuple(int(n) for n in np.ceil((upper - self.lower) / self.voxel_size))
+        if min(self.shape) <= 0 or max(self.shape) > np.iinfo(np.uint16).max:
+            raise ValueError('invalid voxel grid of shape {}'.format(self.shape))
+        self.frames = deque(maxlen=n_frames)
+
+    def reset(self):
+        self.frames.clear()
+
+    def voxelize(self, frame):
+        """
+        :param frame: structured array with the fields x, y, z, intensity and distance
+        :return: sorted linear indices of the occupied voxels, number of points and sum of intensities of each
+        """
+        xyz = np.column_stack((frame['x'], frame['y'], frame['z']))
+        idx = np.floor((xyz - self.lower) / self.voxel_size).astype(np.int64)
+        valid = (frame['distance'] > 0) & np.all((idx >= 0) & (idx < self.shape), axis=1)
+        linear = np.ravel_multi_index(idx[valid].T, self.shape)
+        return self.reduce(linear, np.ones(len(linear), dtype=np.int64),
+                           frame['intensity'][valid].astype(np.float64))
+
+    @staticmethod
+    def reduce(linear, counts, intensities):
+        """
+        Add up the counts and intensities of equal voxels
+        """
+        voxels, inverse = np.unique(linear, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        return voxels, np.bincount(inverse, weights=counts, minlength=len(voxels)).astype(np.int64), \
+            np.bincount(inverse, weights=intensities, minlength=len(voxels))
+
+    def add(self, frame):
+        """
+        Voxelize a frame and aggregate it with the previous frames
+        :return: dict of the grid: coords [M x 3] of the occupied voxels, count and mean intensity of each,
+                 shape, lower bounds and voxel_size of the grid
+        """
+        self.frames.append(self.voxelize(frame))
+        if len(self.frames) == 1:
+            voxels, counts, intensities = self.frames[0]
+        else:
+            voxels, counts, intensities = self.reduce(*(np.concatenate(values) for values in zip(*self.frames)))
+        coords = np.column_stack(np.unravel_index(voxels, self.shape)).astype(np.uint16)
+        return {'coords': coords, 'count': counts.astype(np.uint32),
+                'intensity': (intensities / np.maximum(counts, 1)).astype(np.float32),
+                'shape': np.array(self.shape), 'lower': self.lower, 'voxel_size': self.voxel_size}
+
+
+def check_voxel_format(fmt):
+    if fmt not in VOXEL_FORMATS:
+        raise ValueError('unknown voxel-format {}, expected one of {}'.format(fmt, ', '.join(VOXEL_FORMATS)))
+
+
+def write_voxels(path, grid, fmt='sparse'):
+    """
+    Write a voxel grid to a .npz file
+    :param fmt: sparse stores the coordinates, count and mean intensity of the occupied voxels, packed stores
+                only the occupancy of all voxels as bits
+    """
+    check_voxel_format(fmt)
+    meta = {'shape': grid['shape'], 'lower': grid['lower'], 'voxel_size': grid['voxel_size']}
+    if fmt == 'sparse':
+        np.savez(path, coords=grid['coords'], count=grid['count'], intensity=grid['intensity'], **meta)
+    else:
+        np.savez(path, occupancy=np.packbits(occupancy(grid).reshape(-1)), **meta)
+
+
+def read_voxels(path):
+    """
+    Read a voxel grid written by write_voxels
+    :return: dict of the grid, a packed grid has no count and intensity
+    """
+    with np.load(path) as data:
+        grid = {name: data[name] for name in data.files}
+    if 'occupancy' in grid:
+        n_voxels = int(np.prod(grid['shape']))
+        occupied = np.unpackbits(grid.pop('occupancy'), count=n_voxels).astype(bool)
+        grid['coords'] = np.column_stack(np.unravel_index(np.flatnonzero(occupied), tuple(grid['shape']))) \
+            .astype(np.uint16)
+    return grid
+
+
+def occupancy(grid):
+    """
+    :return: dense bool array of the occupied voxels of a grid
+    """
+    occupied = np.zeros(tuple(grid['shape']), dtype=bool)
+    occupied[tuple(grid['coords'].T.astype(np.int64))] = True
+    return occupied